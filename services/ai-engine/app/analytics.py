@@ -0,0 +1,394 @@
+"""Incremental per-user and per-topic confusion analytics, published as compacted summaries."""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiokafka import AIOKafkaConsumer, TopicPartition
+from aiokafka.partitioner import murmur2
+
+from .codec import JSON
+from .kafka_history import ensure_compacted_topic, read_to_end, wait_for_partitions
+from .publisher import publish_records
+
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "false").lower() in ("1", "true", "yes")
+ANALYTICS_TOPIC = os.getenv("ANALYTICS_TOPIC", "chat.analytics")
+ANALYTICS_TOPIC_PARTITIONS = int(os.getenv("ANALYTICS_TOPIC_PARTITIONS", "6"))
+ANALYTICS_TOPIC_REPLICATION = int(os.getenv("ANALYTICS_TOPIC_REPLICATION", "1"))
+ANALYTICS_PUBLISH_INTERVAL = float(os.getenv("ANALYTICS_PUBLISH_INTERVAL", "30"))
+ANALYTICS_EWMA_ALPHA = float(os.getenv("ANALYTICS_EWMA_ALPHA", "0.3"))
+# Slower average the trend is measured against; trend = ewma - slow average
+ANALYTICS_TREND_ALPHA = float(os.getenv("ANALYTICS_TREND_ALPHA", "0.05"))
+ANALYTICS_HISTOGRAM_BINS = int(os.getenv("ANALYTICS_HISTOGRAM_BINS", "10"))
+# Per worker; keys past the cap are not tracked rather than evicted and restarted from zero
+ANALYTICS_MAX_USERS = int(os.getenv("ANALYTICS_MAX_USERS", "100000"))
+ANALYTICS_MAX_TOPICS = int(os.getenv("ANALYTICS_MAX_TOPICS", "1000"))
+ANALYTICS_METADATA_TIMEOUT = float(os.getenv("ANALYTICS_METADATA_TIMEOUT", "30"))
+
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def topic_key(topic: str, partition: int) -> str:
+    # A topic's turns are split across input partitions, each with one writer at a time
+    return f"topic:{topic}@{partition}"
+
+
+def partition_for(user_id: str, partitions: int) -> int:
+    """The partition the user's chat.input records land on (Kafka's default murmur2 partitioner)."""
+    return (murmur2(user_id.encode("utf-8")) & 0x7FFFFFFF) % partitions
+
+
+def key_partition(key: str, partitions: int) -> int:
+    """Partition a summary record is published to: the one of the user, or of the topic record."""
+    if key.startswith("user:"):
+        return partition_for(key[len("user:"):], partitions)
+    return int(key.rsplit("@", 1)[1])
+
+
+class RollingStats:
+    """Online aggregates for one user or topic in constant memory.
+
+    Counts and the score sum give the exact mean; ``ewma`` follows recent
+    turns and ``trend`` is how far it sits above (more confused lately) or
+    below a slower average. Scores are bucketed into a fixed histogram over
+    0-100.
+    """
+
+    __slots__ = ("sessions", "turns", "total", "ewma", "slow", "histogram", "last", "updated")
+
+    def __init__(self, bins: int) -> None:
+        self.sessions = 0
+        self.turns = 0
+        self.total = 0
+        self.ewma = 0.0
+        self.slow = 0.0
+        self.histogram = [0] * bins
+        self.last: Optional[int] = None
+        self.updated = 0.0
+
+    def add(self, score: int, alpha: float, trend_alpha: float, now: float) -> None:
+        if self.turns == 0:
+            self.ewma = self.slow = float(score)
+        else:
+            self.ewma += alpha * (score - self.ewma)
+            self.slow += trend_alpha * (score - self.slow)
+        self.turns += 1
+        self.total += score
+        bins = len(self.histogram)
+        self.histogram[min(bins - 1, score * bins // 100)] += 1
+        self.last = score
+        self.updated = now
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.sessions,
+            "turns": self.turns,
+            "mean": round(self.total / self.turns, 2) if self.turns else None,
+            "ewma": round(self.ewma, 2),
+            "trend": round(self.ewma - self.slow, 2),
+            "histogram": list(self.histogram),
+            "lastScore": self.last,
+            "updatedAt": round(self.updated, 3),
+        }
+
+    @classmethod
+    def from_summary(cls, data: Dict[str, Any], bins: int) -> "RollingStats":
+        """Rebuild aggregates from a published summary (rounded to 2 decimals)."""
+        stats = cls(bins)
+        stats.sessions = int(data.get("sessions") or 0)
+        stats.turns = int(data.get("turns") or 0)
+        stats.total = round((data.get("mean") or 0) * stats.turns)
+        stats.ewma = float(data.get("ewma") or 0)
+        stats.slow = stats.ewma - float(data.get("trend") or 0)
+        histogram = data.get("histogram") or []
+        if len(histogram) == bins:
+            stats.histogram = [int(n) for n in histogram]
+        stats.last = data.get("lastScore")
+        stats.updated = float(data.get("updatedAt") or 0)
+        return stats
+
+
+class ConfusionAnalytics:
+    """Rolling confusion stats per user and per topic, updated as scores are produced.
+
+    Every key belongs to an input partition: a user's to the partition of
+    their turns, a topic record (``topic:<topic>@<partition>``) to the
+    partition whose turns it counts. With ``assign`` the aggregator holds
+    only the keys of the partitions this worker consumes, so each record has
+    a single writer; the compacted records of a newly assigned partition
+    are loaded with ``apply`` before its turns arrive. Turns of other
+    partitions are ignored. Keys past ``max_users``/``max_topics`` are not
+    tracked instead of being evicted, so a summary is never rebuilt from
+    zero over a published one. ``drain`` hands out the summaries of keys
+    changed since the last drain, so each publish carries only what moved.
+    """
+
+    def __init__(
+        self,
+        partitions: int = ANALYTICS_TOPIC_PARTITIONS,
+        alpha: float = ANALYTICS_EWMA_ALPHA,
+        trend_alpha: float = ANALYTICS_TREND_ALPHA,
+        bins: int = ANALYTICS_HISTOGRAM_BINS,
+        max_users: int = ANALYTICS_MAX_USERS,
+        max_topics: int = ANALYTICS_MAX_TOPICS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.partitions = partitions
+        self.alpha = alpha
+        self.trend_alpha = trend_alpha
+        self.bins = bins
+        self.max_users = max_users
+        self.max_topics = max_topics
+        self._clock = clock
+        self._users: Dict[str, RollingStats] = {}
+        # Partition of each tracked user, so the hash is computed once per user
+        self._user_partitions: Dict[str, int] = {}
+        self._topics: Dict[str, RollingStats] = {}
+        self._dirty: Dict[str, RollingStats] = {}
+        self._topic_keys: Dict[Tuple[str, int], str] = {}
+        # None while every partition is held (no consumer group, or partition counts differ)
+        self._owned: Optional[Set[int]] = None
+        self.events = 0
+        self.published = 0
+        self.untracked = 0
+        self.ignored = 0
+        self.restored = 0
+
+    def _stats(self, table: Dict[str, RollingStats], key: str, limit: int) -> Optional[RollingStats]:
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= limit:
+                self.untracked += 1
+                return None
+            stats = table[key] = RollingStats(self.bins)
+        return stats
+
+    def session(self, user_id: str, topic: str) -> None:
+        """Count a new session (initial greeting) for the user and the topic."""
+        now = self._clock()
+        for key, stats in self._both(user_id, topic):
+            stats.sessions += 1
+            stats.updated = now
+            self._dirty[key] = stats
+
+    def record(self, user_id: str, topic: str, score: int) -> None:
+        """Fold one turn's confusion score into the user's and the topic's stats."""
+        score = max(0, min(100, int(score)))
+        now = self._clock()
+        for key, stats in self._both(user_id, topic):
+            stats.add(score, self.alpha, self.trend_alpha, now)
+            self._dirty[key] = stats
+        self.events += 1
+
+    def _both(self, user_id: str, topic: str) -> List[Tuple[str, RollingStats]]:
+        partition = self._user_partitions.get(user_id)
+        if partition is None:
+            partition = partition_for(user_id, self.partitions)
+        if self._owned is not None and partition not in self._owned:
+            # A turn finishing after its partition moved on; the new owner answers it again
+            self.ignored += 1
+            return []
+        ukey = user_key(user_id)
+        tkey = self._topic_keys.get((topic, partition))
+        if tkey is None:
+            tkey = self._topic_keys[(topic, partition)] = topic_key(topic, partition)
+            if len(self._topic_keys) > self.max_topics:
+                self._topic_keys.clear()  # rebuilt on demand; only bounds free-text topics
+        both = []
+        user = self._stats(self._users, ukey, self.max_users)
+        if user is not None:
+            self._user_partitions[user_id] = partition
+            both.append((ukey, user))
+        topic_stats = self._stats(self._topics, tkey, self.max_topics)
+        if topic_stats is not None:
+            both.append((tkey, topic_stats))
+        return both
+
+    def summary(self, key: str) -> Optional[Dict[str, Any]]:
+        stats = self._users.get(key) or self._topics.get(key)
+        return None if stats is None else stats.summary()
+
+    def drain(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Summaries of every key changed since the last drain."""
+        dirty, self._dirty = self._dirty, {}
+        return [(key, stats.summary()) for key, stats in dirty.items()]
+
+    def retry(self, keys: Iterable[str]) -> None:
+        """Mark keys from a failed publish as changed again, unless already re-marked."""
+        for key in keys:
+            stats = self._users.get(key) or self._topics.get(key)
+            if stats is not None:
+                self._dirty.setdefault(key, stats)
+
+    def scope(self) -> None:
+        """Hold only assigned partitions from now on; ``assign`` adds them."""
+        self._owned = set()
+
+    def assign(self, partitions: Iterable[int]) -> List[int]:
+        """Keep only the keys of ``partitions``; returns the newly assigned ones to load.
+
+        Publish first: unpublished changes of partitions given up are dropped.
+        """
+        if self._owned is None:
+            return []
+        wanted = set(partitions)
+        dropped = self._owned - wanted
+        if dropped:
+            for table in (self._users, self._topics):
+                for key in [k for k in table if key_partition(k, self.partitions) in dropped]:
+                    del table[key]
+                    self._dirty.pop(key, None)
+            self._user_partitions = {
+                user_id: p for user_id, p in self._user_partitions.items() if p not in dropped
+            }
+        added = sorted(wanted - self._owned)
+        self._owned = wanted
+        return added
+
+    def apply(self, key: str, summary: Optional[Dict[str, Any]]) -> bool:
+        """Seed one key from a published summary; False if it is not this worker's."""
+        if key.startswith("user:"):
+            table = self._users
+        elif key.startswith("topic:") and "@" in key:
+            table = self._topics
+        else:
+            return False
+        try:
+            partition = key_partition(key, self.partitions)
+        except ValueError:
+            return False  # a topic record from before records were per partition
+        if self._owned is not None and partition not in self._owned:
+            return False
+        if summary is None:
+            table.pop(key, None)
+            if table is self._users:
+                self._user_partitions.pop(key[len("user:"):], None)
+            return True
+        table[key] = RollingStats.from_summary(summary, self.bins)
+        self.restored += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._users),
+            "topics": len(self._topics),
+            "events": self.events,
+            "pending": len(self._dirty),
+            "published": self.published,
+            "untracked": self.untracked,
+            "ignored": self.ignored,
+            "restored": self.restored,
+            "partitions": None if self._owned is None else sorted(self._owned),
+        }
+
+
+async def publish_analytics(producer: Any, analytics: ConfusionAnalytics, topic: str = ANALYTICS_TOPIC) -> int:
+    """Publish changed summaries keyed by user/topic; returns how many went out."""
+    pending = analytics.drain()
+    if not pending:
+        return 0
+    try:
+        # Each record goes to its input partition's analytics partition, where its owner loads it
+        await publish_records(producer, [
+            (topic, key.encode("utf-8"), JSON.dumps({"key": key, **summary}), key_partition(key, analytics.partitions))
+            for key, summary in pending
+        ])
+    except Exception:
+        analytics.retry(key for key, _ in pending)
+        raise
+    analytics.published += len(pending)
+    return len(pending)
+
+
+async def run_publisher(producer: Any, analytics: ConfusionAnalytics, interval: float = ANALYTICS_PUBLISH_INTERVAL) -> None:
+    """Publish changed summaries every ``interval`` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await publish_analytics(producer, analytics)
+        except Exception as e:
+            print(f"AI Engine Error (analytics publish): {e!r}", flush=True)
+
+
+async def _load(
+    analytics: ConfusionAnalytics, bootstrap_servers: List[str], topic: str, partitions: Optional[List[int]]
+) -> None:
+    """Read ``partitions`` (all when None) of the compacted topic into ``analytics``."""
+    consumer = AIOKafkaConsumer(bootstrap_servers=bootstrap_servers, group_id=None, enable_auto_commit=False)
+    await consumer.start()
+    try:
+        found = await wait_for_partitions(consumer, topic, ANALYTICS_METADATA_TIMEOUT)
+        tps = found if partitions is None else [TopicPartition(topic, p) for p in partitions]
+        consumer.assign(tps)
+        await consumer.seek_to_beginning(*tps)
+
+        def apply(record: Any) -> None:
+            if record.key is not None:
+                value = None if record.value is None else JSON.loads(record.value)
+                analytics.apply(record.key.decode("utf-8"), value)
+
+        await read_to_end(consumer, tps, apply)
+    finally:
+        await consumer.stop()
+
+
+async def restore_analytics(
+    analytics: ConfusionAnalytics,
+    bootstrap_servers: List[str],
+    input_topic: str,
+    topic: str = ANALYTICS_TOPIC,
+) -> None:
+    """Create the compacted topic if needed and decide how summaries are restored.
+
+    When ``input_topic`` has as many partitions as ``topic``, analytics is
+    scoped and each partition is loaded by ``load_assigned`` as it is
+    assigned. Otherwise every summary is read now and held, and replicas
+    would overwrite each other's records, which is logged.
+    """
+    await ensure_compacted_topic(bootstrap_servers, topic, ANALYTICS_TOPIC_PARTITIONS, ANALYTICS_TOPIC_REPLICATION)
+    consumer = AIOKafkaConsumer(bootstrap_servers=bootstrap_servers, group_id=None, enable_auto_commit=False)
+    await consumer.start()
+    try:
+        partitions = await wait_for_partitions(consumer, topic, ANALYTICS_METADATA_TIMEOUT)
+        inputs = consumer.partitions_for_topic(input_topic) or set()
+    finally:
+        await consumer.stop()
+    analytics.partitions = len(partitions)
+    if len(inputs) == len(partitions):
+        analytics.scope()
+        return
+    print(
+        f"Analytics holds every partition: {input_topic} has {len(inputs)} partition(s), {topic} has "
+        f"{len(partitions)}; with more than one worker their records overwrite each other",
+        flush=True,
+    )
+    await _load(analytics, bootstrap_servers, topic, None)
+    print(f"Analytics restored from {topic}: {analytics.snapshot()}", flush=True)
+
+
+async def load_assigned(
+    producer: Any,
+    analytics: ConfusionAnalytics,
+    bootstrap_servers: List[str],
+    partitions: Iterable[int],
+    topic: str = ANALYTICS_TOPIC,
+) -> None:
+    """On a rebalance: publish what changed, drop partitions given up, load the new ones."""
+    try:
+        await publish_analytics(producer, analytics, topic)
+    except Exception as e:
+        print(f"AI Engine Error (analytics publish): {e!r}", flush=True)
+    added = analytics.assign(partitions)
+    if added:
+        await _load(analytics, bootstrap_servers, topic, added)
+        print(f"Analytics loaded partition(s) {added} from {topic}: {analytics.snapshot()}", flush=True)
+
+
+def create_analytics(enabled: bool = ANALYTICS_ENABLED) -> Optional[ConfusionAnalytics]:
+    """The engine's analytics aggregator, or None when ANALYTICS_ENABLED is off."""
+    if not enabled:
+        return None
+    return ConfusionAnalytics()
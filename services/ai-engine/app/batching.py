@@ -0,0 +1,211 @@
+"""Micro-batching of student turns that share a topic."""
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .prompts import BATCH_STUDENT_INSTRUCTIONS
+from .router import STUDENT_MODEL
+
+
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "false").lower() in ("1", "true", "yes")
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "concurrent")  # concurrent | packed
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+# A packed reply is generated session after session, so its latency grows with the batch
+BATCH_PACKED_MAX_SIZE = int(os.getenv("BATCH_PACKED_MAX_SIZE", "3"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "20"))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "4096"))
+
+Messages = List[Dict[str, str]]
+# Runs one student completion: messages -> (raw JSON text, usage)
+CompleteOne = Callable[[Messages], Awaitable[Tuple[str, Any]]]
+
+
+class BatchBackend(ABC):
+    """Completes a batch of student conversations on one topic."""
+
+    @abstractmethod
+    async def complete(self, topic: str, conversations: List[Messages]) -> List[str]:
+        """Return the raw JSON reply for each conversation, in order."""
+
+
+class ConcurrentBatchBackend(BatchBackend):
+    """Sends each conversation as its own request, all at once."""
+
+    def __init__(self, complete_one: CompleteOne, on_usage: Optional[Callable[[Any], Any]] = None) -> None:
+        self._complete_one = complete_one
+        self._on_usage = on_usage
+
+    async def complete(self, topic: str, conversations: List[Messages]) -> List[str]:
+        results = await asyncio.gather(*(self._complete_one(c) for c in conversations))
+        if self._on_usage is not None:
+            for _, usage in results:
+                if usage is not None:
+                    self._on_usage(usage)
+        return [content for content, _ in results]
+
+
+class PackedBatchBackend(BatchBackend):
+    """Answers every conversation of a batch with a single chat completion.
+
+    The shared student system prompt is sent once, followed by all sessions
+    as one JSON document; the model replies with one object per session.
+    Sessions missing from the reply are retried on their own.
+
+    Saves prompt tokens, not time: the reply is decoded one session after
+    another, so a batch of n takes roughly n times as long as one turn.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        complete_one: CompleteOne,
+        on_usage: Optional[Callable[[Any], Any]] = None,
+        model: str = STUDENT_MODEL,
+        max_tokens: int = BATCH_MAX_TOKENS,
+    ) -> None:
+        self._client = client
+        self._complete_one = complete_one
+        self._on_usage = on_usage
+        self.model = model
+        self.max_tokens = max_tokens
+        self.missing = 0
+
+    async def complete(self, topic: str, conversations: List[Messages]) -> List[str]:
+        if len(conversations) == 1:
+            content, usage = await self._complete_one(conversations[0])
+            self._record(usage)
+            return [content]
+        system = conversations[0][0]["content"] + BATCH_STUDENT_INSTRUCTIONS
+        sessions = [{"id": i, "conversation": c[1:]} for i, c in enumerate(conversations)]
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": json.dumps({"sessions": sessions})},
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=min(500 * len(conversations), self.max_tokens),
+            temperature=0.3,
+        )
+        self._record(getattr(response, "usage", None))
+        replies: Dict[Any, Dict[str, Any]] = {}
+        try:
+            for reply in json.loads(response.choices[0].message.content).get("replies", []):
+                if isinstance(reply, dict):
+                    replies[reply.pop("id", None)] = reply
+        except (ValueError, AttributeError):
+            pass
+
+        results: List[Optional[str]] = [
+            json.dumps(replies[i]) if i in replies else None for i in range(len(conversations))
+        ]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            self.missing += len(missing)
+            retried = await asyncio.gather(*(self._complete_one(conversations[i]) for i in missing))
+            for i, (content, usage) in zip(missing, retried):
+                results[i] = content
+                self._record(usage)
+        return results
+
+    def _record(self, usage: Any) -> None:
+        if usage is not None and self._on_usage is not None:
+            self._on_usage(usage)
+
+
+class MicroBatcher:
+    """Groups concurrent turns per key into batches for a BatchBackend.
+
+    A batch is sent when it reaches ``max_size`` or ``max_wait`` seconds
+    after its first turn arrived, whichever comes first, so waiting for the
+    batch adds at most ``max_wait``; the backend's own latency for the batch
+    comes on top. Each caller gets back its own reply.
+    """
+
+    def __init__(
+        self,
+        backend: BatchBackend,
+        max_size: int = BATCH_MAX_SIZE,
+        max_wait: float = BATCH_MAX_WAIT_MS / 1000,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.backend = backend
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[Messages, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._running: set = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, key: str, messages: Messages) -> str:
+        """Queue one conversation and wait for its reply."""
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((messages, future))
+        if len(pending) >= self.max_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = [(m, f) for m, f in self._pending.pop(key, []) if not f.done()]
+        if not items:
+            return
+        task = asyncio.create_task(self._run(key, items))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: str, items: List[Tuple[Messages, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(items)
+        self.largest = max(self.largest, len(items))
+        try:
+            contents = await self.backend.complete(key, [m for m, _ in items])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), content in zip(items, contents):
+            if not future.done():
+                future.set_result(content)
+
+    async def close(self) -> None:
+        """Send whatever is still queued and wait for running batches."""
+        for key in list(self._pending):
+            self._flush(key)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest": self.largest,
+            "mean_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def create_batcher(
+    client: Optional[Any],
+    complete_one: CompleteOne,
+    on_usage: Optional[Callable[[Any], Any]] = None,
+) -> Optional[MicroBatcher]:
+    """The engine's batcher, or None when batching is off or in fallback mode."""
+    if not BATCHING_ENABLED or client is None:
+        return None
+    if BATCH_BACKEND == "packed":
+        # Small batches keep a packed reply well inside LLM_TURN_DEADLINE
+        return MicroBatcher(
+            PackedBatchBackend(client, complete_one, on_usage), max_size=min(BATCH_MAX_SIZE, BATCH_PACKED_MAX_SIZE)
+        )
+    return MicroBatcher(ConcurrentBatchBackend(complete_one, on_usage))
@@ -0,0 +1,279 @@
+"""Caches for LLM output: pre-generated greetings, exact-match responses and duplicate turns."""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+
+GREETING_CACHE_ENABLED = os.getenv("GREETING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+GREETING_CACHE_VARIANTS = int(os.getenv("GREETING_CACHE_VARIANTS", "4"))
+GREETING_CACHE_TTL = float(os.getenv("GREETING_CACHE_TTL", "3600"))
+GREETING_CACHE_MAX_TOPICS = int(os.getenv("GREETING_CACHE_MAX_TOPICS", "256"))
+HOT_TOPICS = [t.strip() for t in os.getenv("HOT_TOPICS", "").split(",") if t.strip()]
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+
+TURN_DEDUPE_ENABLED = os.getenv("TURN_DEDUPE_ENABLED", "true").lower() in ("1", "true", "yes")
+TURN_DEDUPE_MAX_ENTRIES = int(os.getenv("TURN_DEDUPE_MAX_ENTRIES", "4096"))
+TURN_DEDUPE_TTL = float(os.getenv("TURN_DEDUPE_TTL", "300"))
+# Events without a messageId are matched on their text, so only within a short window
+TURN_DEDUPE_UNKEYED_TTL = float(os.getenv("TURN_DEDUPE_UNKEYED_TTL", "10"))
+
+T = TypeVar("T")
+
+
+class CacheStats:
+    """Hit/miss counters plus an estimate of LLM time saved by hits."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._miss_seconds = 0.0
+
+    def observe_miss(self, seconds: float) -> None:
+        self.misses += 1
+        self._miss_seconds += seconds
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        # Each hit saves roughly one average-latency LLM call
+        return self.hits * (self._miss_seconds / self.misses) if self.misses else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hit_ratio, 4),
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+class GreetingCache:
+    """Per-topic pool of pre-generated initial greetings.
+
+    Each topic keeps up to ``variants`` greetings, each valid for ``ttl``
+    seconds, and a random one is served per session. Whenever a pool is
+    below its target it is refilled in the background, so popular topics are
+    answered without waiting on the LLM. At most ``max_topics`` topics are
+    kept, least recently used first out.
+    """
+
+    def __init__(
+        self,
+        variants: int = GREETING_CACHE_VARIANTS,
+        ttl: float = GREETING_CACHE_TTL,
+        max_topics: int = GREETING_CACHE_MAX_TOPICS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.variants = variants
+        self.ttl = ttl
+        self.max_topics = max_topics
+        self.stats = CacheStats()
+        self._clock = clock
+        self._pools: "OrderedDict[str, List[Tuple[float, Dict[str, Any]]]]" = OrderedDict()
+        self._refills: Dict[str, asyncio.Task] = {}
+
+    async def get(self, topic: str, generate: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        pool = self._fresh(topic)
+        if pool:
+            self.stats.hits += 1
+            self._refill(topic, generate)
+            return dict(random.choice(pool)[1])
+        start = self._clock()
+        greeting = await generate(topic)
+        self.stats.observe_miss(self._clock() - start)
+        self._add(topic, greeting)
+        self._refill(topic, generate)
+        return dict(greeting)
+
+    def prefetch(self, topics: Iterable[str], generate: Callable[[str], Awaitable[Dict[str, Any]]]) -> None:
+        """Start filling the pools of ``topics`` ahead of demand."""
+        for topic in topics:
+            self._refill(topic, generate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = self.stats.snapshot()
+        stats["topics"] = len(self._pools)
+        return stats
+
+    async def close(self) -> None:
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _fresh(self, topic: str) -> List[Tuple[float, Dict[str, Any]]]:
+        pool = self._pools.get(topic)
+        if pool is None:
+            return []
+        now = self._clock()
+        pool[:] = [item for item in pool if now - item[0] <= self.ttl]
+        self._pools.move_to_end(topic)
+        return pool
+
+    def _add(self, topic: str, greeting: Dict[str, Any]) -> None:
+        pool = self._pools.setdefault(topic, [])
+        pool.append((self._clock(), greeting))
+        del pool[: max(0, len(pool) - self.variants)]
+        self._pools.move_to_end(topic)
+        while len(self._pools) > self.max_topics:
+            self._pools.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _refill(self, topic: str, generate: Callable[[str], Awaitable[Dict[str, Any]]]) -> None:
+        if topic in self._refills or len(self._fresh(topic)) >= self.variants:
+            return
+        task = asyncio.create_task(self._run_refill(topic, generate))
+        self._refills[topic] = task
+        task.add_done_callback(lambda _: self._refills.pop(topic, None))
+
+    async def _run_refill(self, topic: str, generate: Callable[[str], Awaitable[Dict[str, Any]]]) -> None:
+        try:
+            while len(self._fresh(topic)) < self.variants:
+                self._add(topic, await generate(topic))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"AI Engine Error (greeting refill for {topic}): {e}", flush=True)
+
+
+def response_key(topic: str, history: List[Dict[str, str]], teacher_message: str) -> str:
+    """Cache key for one student turn: topic, trimmed history and teacher message."""
+    payload = json.dumps([topic, history, teacher_message], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match LRU/TTL cache of raw student completions."""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if self._clock() - item[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return item[1]
+
+    def put(self, key: str, content: str, seconds: float) -> None:
+        """Store a completion that took ``seconds`` to generate."""
+        self.stats.observe_miss(seconds)
+        self._entries[key] = (self._clock(), content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = self.stats.snapshot()
+        stats["entries"] = len(self._entries)
+        return stats
+
+
+def turn_key(user_id: str, message_id: Optional[str], topic: str, message: str) -> str:
+    """Identity of one chat event, shared by every copy of it.
+
+    Keyed on the client's ``messageId`` when there is one. Without it the
+    user, topic and message text stand in; the gateway stamps a new
+    timestamp on each resend, so the timestamp cannot be part of the key.
+    """
+    if message_id is not None:
+        return f"{user_id}\x00id\x00{message_id}"
+    digest = hashlib.sha256(f"{topic}\x00{message}".encode("utf-8")).hexdigest()[:32]
+    return f"{user_id}\x00text\x00{digest}"
+
+
+class TurnDeduplicator:
+    """Singleflight plus a short memory of finished results, keyed per event.
+
+    The first copy of an event runs ``generate``; copies arriving while it
+    runs await the same result, and copies arriving up to ``ttl`` seconds
+    (or the ``ttl`` given to ``run``) after it finished get the stored result. Only the first copy reaches the
+    LLM and the history store. A failed generation is not remembered.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TURN_DEDUPE_MAX_ENTRIES,
+        ttl: float = TURN_DEDUPE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._in_flight: Dict[str, "asyncio.Future[Any]"] = {}
+        self._recent: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.generated = 0
+        self.coalesced = 0
+        self.recent_hits = 0
+
+    async def run(
+        self, key: str, generate: Callable[[], Awaitable[T]], ttl: Optional[float] = None
+    ) -> Tuple[T, bool]:
+        """``generate()``'s result for ``key``, and whether it was shared with an earlier copy."""
+        item = self._recent.get(key)
+        if item is not None:
+            if self._clock() <= item[0]:
+                self.recent_hits += 1
+                return item[1], True
+            del self._recent[key]
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            # Shielded: a cancelled duplicate must not cancel the first copy
+            return await asyncio.shield(pending), True
+
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await generate()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # retrieved: nobody may be waiting
+            raise
+        finally:
+            del self._in_flight[key]
+        self.generated += 1
+        future.set_result(result)
+        self._recent[key] = (self._clock() + (self.ttl if ttl is None else ttl), result)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+        return result, False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "generated": self.generated,
+            "coalesced": self.coalesced,
+            "recent_hits": self.recent_hits,
+            "entries": len(self._recent),
+        }
@@ -0,0 +1,134 @@
+"""Wire codecs for Kafka records and the validated inbound chat event."""
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .publisher import Headers
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack framing is optional
+    msgpack = None
+
+
+DEAD_LETTER_TOPIC = os.getenv("DEAD_LETTER_TOPIC", "chat.input.dlq")
+DEFAULT_TOPIC = "Computer Science"
+
+CONTENT_TYPE_HEADER = "content-type"
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class InvalidEvent(ValueError):
+    """An inbound record that cannot be decoded or fails validation."""
+
+
+class Codec:
+    """Serializer for one content type."""
+
+    __slots__ = ("content_type", "dumps", "loads", "headers")
+
+    def __init__(self, content_type: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]) -> None:
+        self.content_type = content_type
+        self.dumps = dumps
+        self.loads = loads
+        # JSON is the default on the wire and goes without a header
+        self.headers: Optional[Headers] = (
+            None if content_type == JSON_CONTENT_TYPE
+            else [(CONTENT_TYPE_HEADER, content_type.encode("latin-1"))]
+        )
+
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+JSON = Codec(JSON_CONTENT_TYPE, orjson.dumps if orjson else _stdlib_dumps, orjson.loads if orjson else json.loads)
+MSGPACK = Codec(MSGPACK_CONTENT_TYPE, msgpack.packb, msgpack.unpackb) if msgpack else None
+
+_CODECS: Dict[str, Codec] = {JSON_CONTENT_TYPE: JSON}
+if MSGPACK is not None:
+    _CODECS[MSGPACK_CONTENT_TYPE] = MSGPACK
+
+
+def codec_for(headers: Optional[Sequence[Tuple[str, bytes]]]) -> Codec:
+    """Codec named by a record's content-type header (JSON when absent)."""
+    for name, value in headers or ():
+        if name.lower() == CONTENT_TYPE_HEADER:
+            content_type = value.decode("latin-1").split(";", 1)[0].strip().lower()
+            codec = _CODECS.get(content_type)
+            if codec is None:
+                raise InvalidEvent(f"unsupported content type {content_type!r}")
+            return codec
+    return JSON
+
+
+@dataclass(frozen=True, slots=True)
+class ChatEvent:
+    """A validated message from ``chat.input``."""
+
+    user_id: str
+    message: str
+    topic: str = DEFAULT_TOPIC
+    timestamp: Any = None
+    is_initial: bool = False
+    message_id: Optional[str] = None  # client-generated, the same on every resend
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "ChatEvent":
+        if not isinstance(data, dict):
+            raise InvalidEvent(f"event must be an object, not {type(data).__name__}")
+        user_id = data.get("userId")
+        if isinstance(user_id, int) and not isinstance(user_id, bool):
+            user_id = str(user_id)
+        if not isinstance(user_id, str) or not user_id:
+            raise InvalidEvent("userId must be a non-empty string")
+        # The gateway forwards client fields as-is, so null means "not given" for optional ones
+        is_initial = data.get("isInitial")
+        if is_initial is None:
+            is_initial = False
+        if not isinstance(is_initial, bool):
+            raise InvalidEvent("isInitial must be a boolean")
+        message = data.get("message")
+        if message is None and is_initial:
+            message = ""
+        if not isinstance(message, str):
+            raise InvalidEvent("message must be a string")
+        topic = data.get("topic")
+        if topic is None or (isinstance(topic, str) and not topic.strip()):
+            topic = DEFAULT_TOPIC  # e.g. a session started before a topic was picked
+        if not isinstance(topic, str):
+            raise InvalidEvent("topic must be a string")
+        message_id = data.get("messageId") or None
+        if message_id is not None and not isinstance(message_id, str):
+            raise InvalidEvent("messageId must be a string")
+        return cls(user_id, message, topic, data.get("timestamp"), is_initial, message_id)
+
+
+def decode_event(value: Optional[bytes], headers: Optional[Sequence[Tuple[str, bytes]]] = None) -> Tuple[ChatEvent, Codec]:
+    """Decode and validate one inbound record; the codec is reused for the reply."""
+    codec = codec_for(headers)
+    if value is None:
+        raise InvalidEvent("empty record")
+    try:
+        data = codec.loads(value)
+    except Exception as e:
+        raise InvalidEvent(f"undecodable {codec.content_type} record: {e}") from e
+    return ChatEvent.from_dict(data), codec
+
+
+def dead_letter_headers(
+    error: BaseException, topic: str, partition: int, offset: int, headers: Optional[Sequence[Tuple[str, bytes]]] = None
+) -> Headers:
+    """Original headers plus where the record came from and why it was rejected."""
+    return [
+        *(headers or ()),
+        ("dlq-error", f"{type(error).__name__}: {error}"[:1000].encode("utf-8")),
+        ("dlq-source", f"{topic}:{partition}:{offset}".encode("utf-8")),
+    ]
@@ -1,29 +1,154 @@
 import asyncio
+import itertools
 import json
 import os
-from typing import Any, Dict, List
-from collections import defaultdict
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 
+from .analytics import (
+    ANALYTICS_PUBLISH_INTERVAL,
+    ConfusionAnalytics,
+    create_analytics,
+    load_assigned,
+    publish_analytics,
+    restore_analytics,
+    run_publisher,
+)
+from .batching import MicroBatcher, create_batcher
+from .cache import (
+    GREETING_CACHE_ENABLED,
+    HOT_TOPICS,
+    RESPONSE_CACHE_ENABLED,
+    TURN_DEDUPE_ENABLED,
+    TURN_DEDUPE_UNKEYED_TTL,
+    GreetingCache,
+    ResponseCache,
+    TurnDeduplicator,
+    response_key,
+    turn_key,
+)
+from .codec import (
+    DEAD_LETTER_TOPIC,
+    JSON,
+    ChatEvent,
+    Codec,
+    InvalidEvent,
+    dead_letter_headers,
+    decode_event,
+)
+from .history import HISTORY_BACKEND, HISTORY_TRIM_STEP, HistoryStore, InMemoryHistoryStore, ReadThroughHistoryStore
+from .kafka_history import KafkaHistoryBackend
+from .lanes import KeyedExecutor
+from .llm import LLMClient, PromptUsage, create_llm_client
+from .metrics import Metrics, consumer_lag, serve_metrics
+from .offsets import (
+    OFFSET_COMMIT_INTERVAL,
+    CommitOnRevoke,
+    OffsetTracker,
+    idempotency_key,
+    message_idempotency_key,
+)
+from .prompts import REPLY_CONTINUATION_PROMPT, build_student_messages, get_initial_greeting_prompt
+from .publisher import producer_config, publish_records
+from .ratelimit import rate_limit_key
+from .repair import (
+    INCOMPLETE,
+    OK,
+    REPLY_CONTINUATION_ENABLED,
+    REPLY_CONTINUATION_MAX_TOKENS,
+    REPLY_CONTINUATION_MODEL,
+    UNRECOVERABLE,
+    RepairStats,
+    Reply,
+    UnrecoverableReply,
+    merge_continuation,
+    parse_student_reply,
+)
+from .resilience import CircuitOpenError, LLMGuard
+from .router import STUDENT_MODEL, ModelRouter, Tier, create_router
+from .scheduler import MAX_IN_FLIGHT, MAX_QUEUED_EVENTS, SHUTDOWN_DRAIN_TIMEOUT, BoundedScheduler
+from .scorer import LOCAL_SCORER_MODE, SCORE_LOG_PATH, ConfusionScorer, ScoreLog, load_scorer
+from .startup import PROBES_ENABLED, Health, warm_up
+from .streaming import CHAT_OUTPUT_PARTIAL_TOPIC, STREAMING_ENABLED, collect_stream
+from .supervisor import install_event_loop
+from .window import TURN_MAX_TOKENS, RollingSummaries, build_window, create_summaries, truncate_to_tokens
+
 
 KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "kafka:9092").split(",")
 CHAT_INPUT_TOPIC = os.getenv("CHAT_INPUT_TOPIC", "chat.input")
 CHAT_OUTPUT_TOPIC = os.getenv("CHAT_OUTPUT_TOPIC", "chat.output")
 CHAT_SCORE_TOPIC = os.getenv("CHAT_SCORE_TOPIC", "chat.score")
 SERVICE_ID = os.getenv("SERVICE_ID", "ai-engine")
+# Set by app.supervisor when running as one of several worker processes
+WORKER_ID = os.getenv("WORKER_ID")
+THROUGHPUT_LOG_INTERVAL = float(os.getenv("THROUGHPUT_LOG_INTERVAL", "60"))  # 0 disables
 
-# Store conversation history per user session (userId -> list of messages)
-conversation_history: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+# Conversation history per user session, bounded by user count, idle TTL and size
+history_store: HistoryStore = InMemoryHistoryStore()
 
+# Pre-generated greetings per topic, and optional exact-match turn cache
+greeting_cache: Optional[GreetingCache] = GreetingCache() if GREETING_CACHE_ENABLED else None
+response_cache: Optional[ResponseCache] = ResponseCache() if RESPONSE_CACHE_ENABLED else None
 
-async def generate_initial_greeting(topic: str) -> Dict[str, Any]:
-    """Generate initial greeting when a session starts."""
-    from openai import AsyncOpenAI
-    from .prompts import get_initial_greeting_prompt
+# One generation per chat event however many copies arrive (TURN_DEDUPE_ENABLED)
+turn_dedupe: Optional[TurnDeduplicator] = TurnDeduplicator() if TURN_DEDUPE_ENABLED else None
+
+# Prompt/cached-token totals across all student turns
+prompt_usage = PromptUsage()
+
+# Cross-user micro-batcher for student turns (BATCHING_ENABLED)
+batcher: Optional[MicroBatcher] = None
+
+# Deadline, hedging and circuit breaker for student-turn LLM calls
+llm_guard = LLMGuard()
+
+# Local NumPy confusion scorer (None until one is trained) and training log
+local_scorer: Optional[ConfusionScorer] = load_scorer()
+score_log: Optional[ScoreLog] = None
+
+# Fast/strong model tier per student turn (ROUTER_ENABLED)
+router: Optional[ModelRouter] = create_router(local_scorer)
+
+# How student replies parsed, repaired or needed a continuation
+reply_repairs = RepairStats()
+
+# Rolling summaries of turns that fell out of the token window (SUMMARY_MODE)
+summaries: Optional[RollingSummaries] = create_summaries(None)
+
+# Rolling confusion stats per user and topic, published compacted (ANALYTICS_ENABLED)
+analytics: Optional[ConfusionAnalytics] = create_analytics()
+
+# Stage latencies and outcome counts (METRICS_ENABLED); no-ops when disabled
+metrics = Metrics()
+
+
+async def _request_greeting(topic: str, client: LLMClient) -> Dict[str, Any]:
+    """Ask the LLM for a session greeting; raises on any failure."""
+    response = await client.chat.completions.create(
+        model="gpt-4-turbo-preview",
+        messages=[
+            {"role": "system", "content": get_initial_greeting_prompt(topic)},
+            {"role": "user", "content": "Generate your initial greeting."}
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=300,
+        temperature=0.7
+    )
     
-    api_key = os.getenv("OPENAI_API_KEY", "")
-    if not api_key or api_key == "replace-me" or api_key == "your-openai-api-key-here":
+    result = json.loads(response.choices[0].message.content)
+    return {
+        "question": result.get("question", f"Hi! I'm ready to learn about {topic}. Let's begin!"),
+        "score": 0,  # Always 0 for initial greeting
+        "reasoning": result.get("reasoning", "Initial session greeting")
+    }
+
+
+async def generate_initial_greeting(topic: str, client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    """Generate initial greeting when a session starts."""
+    if client is None:
         return {
             "question": f"Hi! I'm Jamie, and I'm excited to learn about {topic}. Could you start by giving me a high-level overview of what {topic} is?",
             "score": 0,
@@ -31,24 +156,9 @@ async def generate_initial_greeting(topic: str) -> Dict[str, Any]:
         }
     
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": get_initial_greeting_prompt(topic)},
-                {"role": "user", "content": "Generate your initial greeting."}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=300,
-            temperature=0.7
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        return {
-            "question": result.get("question", f"Hi! I'm ready to learn about {topic}. Let's begin!"),
-            "score": 0,  # Always 0 for initial greeting
-            "reasoning": result.get("reasoning", "Initial session greeting")
-        }
+        if greeting_cache is not None:
+            return await greeting_cache.get(topic, lambda t: _request_greeting(t, client))
+        return await _request_greeting(topic, client)
     except Exception as e:
         print(f"AI Engine Error (initial greeting): {e}", flush=True)
         return {
@@ -58,135 +168,675 @@ async def generate_initial_greeting(topic: str) -> Dict[str, Any]:
         }
 
 
-async def generate_student_response(user_message: str, topic: str, user_id: str) -> Dict[str, Any]:
-    """Generate AI student response using CoT and Few-Shot prompting with conversation history."""
-    from openai import AsyncOpenAI
-    from .prompts import get_student_prompt
-    
-    api_key = os.getenv("OPENAI_API_KEY", "")
-    if not api_key or api_key == "replace-me" or api_key == "your-openai-api-key-here":
-        # Realistic fallback logic
-        return {
-            "question": f"Interesting point about {topic}. Can you explain it more simply with an example?",
-            "score": 25,  # Changed from 30 to be more generous
-            "reasoning": "Fallback mode: No API key provided."
-        }
-    
-    try:
-        client = AsyncOpenAI(api_key=api_key)
-        
-        # Build conversation history
-        messages = [{"role": "system", "content": get_student_prompt(topic)}]
-        
-        # Add conversation history (last 6 messages to keep context manageable)
-        history = conversation_history[user_id][-6:]
-        for msg in history:
-            messages.append(msg)
-        
-        # Add current teacher message
-        messages.append({"role": "user", "content": f"The teacher says: '{user_message}'"})
-        
+def _fallback_score(user_message: str, default: int) -> int:
+    """Local scorer's estimate when no LLM score is available, else ``default``."""
+    if local_scorer is None:
+        return default
+    return local_scorer.score(user_message)
+
+
+def _fallback_response(topic: str, user_message: str, reasoning: str) -> Dict[str, Any]:
+    """Student reply used when the LLM is unavailable, unconfigured or too slow."""
+    # Realistic fallback logic
+    return {
+        "question": f"Interesting point about {topic}. Can you explain it more simply with an example?",
+        "score": _fallback_score(user_message, 25),  # Changed from 30 to be more generous
+        "reasoning": reasoning
+    }
+
+
+async def _complete_student_turn(
+    client: LLMClient,
+    messages: List[Dict[str, str]],
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+    model: str = STUDENT_MODEL,
+) -> Tuple[str, Any]:
+    """Run the student completion and return the raw JSON text and token usage."""
+    if on_partial is None:
         response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
+            model=model,
             messages=messages,
             response_format={"type": "json_object"},
             max_tokens=500,
             temperature=0.3  # Slightly higher for more natural responses
         )
+        return response.choices[0].message.content, getattr(response, "usage", None)
+
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=500,
+        temperature=0.3,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    return await collect_stream(stream, on_partial)
+
+
+async def _tier_call(
+    tier: Tier,
+    client: LLMClient,
+    messages: List[Dict[str, str]],
+    on_partial: Optional[Callable[[str], Awaitable[None]]],
+    deadline: Optional[float] = None,
+) -> Tuple[str, Any]:
+    started = time.perf_counter()
+    with metrics.stage(f"llm_{tier.name}"):
+        # Streamed turns are never hedged: partials would be published twice
+        content, usage = await llm_guard.call(
+            lambda: _complete_student_turn(client, messages, on_partial, tier.model),
+            hedge=on_partial is None,
+            deadline=deadline,
+        )
+    tier.record(time.perf_counter() - started, usage)
+    return content, usage
+
+
+async def _routed_student_turn(
+    client: LLMClient,
+    messages: List[Dict[str, str]],
+    on_partial: Optional[Callable[[str], Awaitable[None]]],
+    user_id: str,
+    user_message: str,
+    topic: str,
+    deadline: Optional[float] = None,
+) -> Tuple[str, Any]:
+    """Student completion on the routed tier, redone on the strong model if the fast reply is rejected.
+
+    Both tiers share ``deadline``: an escalation gets what the fast tier left.
+    """
+    tier = router.route(user_id, user_message, topic)
+    if tier is router.fast:
+        # Not streamed: partials of a reply that gets escalated must never be shown
+        content, usage = await _tier_call(tier, client, messages, None, deadline)
+        reason = router.review(content)
+        if reason is None:
+            return content, usage
+        router.escalated(reason)
+        if usage is not None:
+            prompt_usage.record(usage)
+        tier = router.strong
+    return await _tier_call(tier, client, messages, on_partial, deadline)
+
+
+async def _continue_student_reply(
+    client: LLMClient, messages: List[Dict[str, str]], content: Optional[str], deadline: Optional[float] = None
+) -> Optional[Reply]:
+    """Ask for just the missing score and question of a cut-off reply; None if that fails too."""
+    try:
+        response = await llm_guard.call(
+            lambda: client.chat.completions.create(
+                model=REPLY_CONTINUATION_MODEL,
+                messages=[
+                    *messages,
+                    {"role": "assistant", "content": content or ""},
+                    {"role": "user", "content": REPLY_CONTINUATION_PROMPT},
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=REPLY_CONTINUATION_MAX_TOKENS,
+                temperature=0.3,
+            ),
+            hedge=False,
+            deadline=deadline,
+        )
+    except Exception as e:
+        print(f"AI Engine Error (reply continuation): {e!r}", flush=True)
+        return None
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        prompt_usage.record(usage)
+    reply, status = parse_student_reply(response.choices[0].message.content)
+    return None if status in (INCOMPLETE, UNRECOVERABLE) else reply
+
+
+async def _read_student_reply(
+    client: Optional[LLMClient],
+    messages: List[Dict[str, str]],
+    content: Optional[str],
+    deadline: Optional[float] = None,
+) -> Tuple[Reply, str]:
+    """Parse a reply, repairing it or asking for the lost question; raises UnrecoverableReply."""
+    with metrics.stage("parse"):
+        reply, status = parse_student_reply(content)
+    reply_repairs.record(status)
+    if status not in (INCOMPLETE, UNRECOVERABLE):
+        return reply, status
+    if REPLY_CONTINUATION_ENABLED and client is not None:
+        with metrics.stage("repair"):
+            continued = await _continue_student_reply(client, messages, content, deadline)
+        reply_repairs.record_continuation(continued is not None)
+        if continued is not None:
+            return merge_continuation(reply or {}, continued), status
+    raise UnrecoverableReply(f"no usable question in reply ({status})")
+
+
+async def generate_student_response(
+    user_message: str,
+    topic: str,
+    user_id: str,
+    client: Optional[LLMClient] = None,
+    history: Optional[HistoryStore] = None,
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Generate AI student response using CoT and Few-Shot prompting with conversation history.
+
+    When ``on_partial`` is given the completion is streamed and the question
+    text is passed to it piece by piece as it is generated. Every LLM call of
+    the turn (escalation and continuation included) shares one
+    ``LLM_TURN_DEADLINE``.
+    """
+    if history is None:
+        history = history_store
+    if client is None:
+        metrics.count("fallback")
+        return _fallback_response(topic, user_message, "Fallback mode: No API key provided.")
+    
+    try:
+        with metrics.stage("history_read"):
+            stored = await history.get(user_id)
+        with metrics.stage("prompt_build"):
+            # Newest history that fits the token budget; the window start moves in
+            # trim steps so the system prompt + earlier turns stay a cacheable prefix
+            recent, dropped = build_window(stored, step=HISTORY_TRIM_STEP)
+            if summaries is not None:
+                memory = summaries.memory_message(user_id)
+                if memory is not None:
+                    recent = [memory, *recent]
+                # Fold what just left the window into the summary, off the hot path
+                summaries.schedule(user_id, dropped)
+            teacher_turn = f"The teacher says: '{truncate_to_tokens(user_message, TURN_MAX_TOKENS)}'"
+            messages = build_student_messages(topic, recent, teacher_turn)
         
-        result = json.loads(response.choices[0].message.content)
+        cache_key = response_key(topic, recent, teacher_turn) if response_cache is not None else None
+        content = response_cache.get(cache_key) if cache_key is not None else None
+        cached = content is not None
+        deadline = llm_guard.turn_deadline()
+        if not cached:
+            started = time.perf_counter()
+            with metrics.stage("llm"):
+                if batcher is not None and on_partial is None:
+                    # Shares a request with other turns on this topic; usage is recorded per batch
+                    content = await llm_guard.call(
+                        lambda: batcher.submit(topic, messages), hedge=False, deadline=deadline
+                    )
+                    usage = None
+                elif router is not None:
+                    content, usage = await _routed_student_turn(
+                        client, messages, on_partial, user_id, user_message, topic, deadline
+                    )
+                else:
+                    # Streamed turns are never hedged: partials would be published twice
+                    content, usage = await llm_guard.call(
+                        lambda: _complete_student_turn(client, messages, on_partial),
+                        hedge=on_partial is None,
+                        deadline=deadline,
+                    )
+            if usage is not None:
+                turn = prompt_usage.record(usage)
+                print(
+                    f"Prompt tokens ({user_id}): {turn['prompt_tokens']} "
+                    f"({turn['cached_tokens']} cached)",
+                    flush=True,
+                )
         
-        # Store in conversation history
-        conversation_history[user_id].append({"role": "user", "content": f"The teacher says: '{user_message}'"})
-        conversation_history[user_id].append({"role": "assistant", "content": response.choices[0].message.content})
+        result, status = await _read_student_reply(client, messages, content, deadline)
+        if status != OK:
+            # History and cache keep the repaired reply, not the broken text
+            content = json.dumps(result)
+        if cache_key is not None and not cached:
+            response_cache.put(cache_key, content, time.perf_counter() - started)
         
-        # Limit history size (keep last 20 messages)
-        if len(conversation_history[user_id]) > 20:
-            conversation_history[user_id] = conversation_history[user_id][-20:]
+        # Store in conversation history (the store trims to its per-user message cap)
+        await history.append(
+            user_id,
+            {"role": "user", "content": teacher_turn},
+            {"role": "assistant", "content": content},
+        )
+        
+        score = result["confusion_score"]  # Already clamped between 0-100
+        if score is None:
+            score = 30
+        if router is not None:
+            router.observe(user_id, score)
+        if score_log is not None and not cached:
+            # Training data for the local scorer
+            score_log.record(topic, user_message, score, time.perf_counter() - started)
         
+        metrics.count("cached" if cached else "llm")
         return {
-            "question": result.get("question", "I'm not sure if I followed that. Can you rephrase?"),
-            "score": max(0, min(100, result.get("confusion_score", 30))),  # Clamp between 0-100
-            "reasoning": result.get("reasoning", "")
+            "question": result["question"],
+            "score": score,
+            "reasoning": result["reasoning"]
         }
-    except json.JSONDecodeError as e:
+    except CircuitOpenError:
+        metrics.count("fallback")
+        return _fallback_response(topic, user_message, "Fallback mode: LLM circuit breaker open.")
+    except asyncio.TimeoutError:
+        print(f"AI Engine Timeout: no reply within {llm_guard.deadline}s ({user_id})", flush=True)
+        metrics.count("fallback")
+        return _fallback_response(topic, user_message, "Fallback mode: LLM deadline exceeded.")
+    except UnrecoverableReply as e:
         print(f"AI Engine JSON Error: {e}", flush=True)
-        print(f"Raw response: {response.choices[0].message.content if 'response' in locals() else 'N/A'}", flush=True)
+        metrics.count("parse_error")
+        print(f"Raw response: {content if 'content' in locals() else 'N/A'}", flush=True)
         return {
             "question": "I'm having trouble processing that. Could you rephrase it?",
-            "score": 35,
+            "score": _fallback_score(user_message, 35),
             "reasoning": f"JSON parsing error: {str(e)}"
         }
     except Exception as e:
         print(f"AI Engine Error: {e}", flush=True)
+        metrics.count("error")
         return {
             "question": "That's interesting, but I need more details. Could you elaborate?",
-            "score": 30,
+            "score": _fallback_score(user_message, 30),
             "reasoning": f"Exception: {str(e)}"
         }
 
 
-async def process_chat_event(producer: AIOKafkaProducer, event: Dict[str, Any]) -> None:
-    user_message = event.get("message", "")
-    user_id = event.get("userId")
-    timestamp = event.get("timestamp")
-    topic = event.get("topic", "Computer Science")
-    is_initial = event.get("isInitial", False)  # Flag for initial greeting
+def _header_kwargs(codec: Codec) -> Dict[str, Any]:
+    """``headers`` argument for producer.send; JSON records go without one."""
+    return {"headers": codec.headers} if codec.headers else {}
+
+
+def _partial_publisher(
+    producer: AIOKafkaProducer, user_id: str, timestamp: Any, codec: Codec = JSON
+) -> Callable[[str], Awaitable[None]]:
+    """Callback that publishes streamed question text to the partial topic."""
+    key = user_id.encode("utf-8")
+    seq = itertools.count()
+
+    async def publish(delta: str) -> None:
+        # Enqueue only; the final chat.output record is the one we wait for
+        await producer.send(
+            CHAT_OUTPUT_PARTIAL_TOPIC,
+            key=key,
+            value=codec.dumps({
+                "userId": user_id,
+                "delta": delta,
+                "seq": next(seq),
+                "origin": SERVICE_ID,
+                "timestamp": timestamp,
+            }),
+            **_header_kwargs(codec),
+        )
+
+    return publish
+
+
+async def _answer_event(
+    producer: AIOKafkaProducer,
+    event: ChatEvent,
+    client: Optional[LLMClient],
+    history: HistoryStore,
+    codec: Codec,
+) -> Dict[str, Any]:
+    """Question, score and reasoning for one event (greeting or student turn)."""
+    user_message = event.message
+    user_id = event.user_id
+    timestamp = event.timestamp
+    topic = event.topic
 
     # Handle initial greeting
-    if is_initial or user_message.strip().upper() == "[INITIAL_GREETING]":
-        ai_data = await generate_initial_greeting(topic)
+    if event.is_initial or user_message.strip().upper() == "[INITIAL_GREETING]":
+        ai_data = await generate_initial_greeting(topic, client)
+        metrics.count("greeting")
         # Clear conversation history for new session
-        conversation_history[user_id] = []
+        await history.clear(user_id)
+        if summaries is not None:
+            summaries.forget(user_id)
+        if analytics is not None:
+            analytics.session(user_id, topic)
     else:
+        if local_scorer is not None and LOCAL_SCORER_MODE == "provisional":
+            # Millisecond estimate now; the LLM's score replaces it with the question
+            await producer.send(
+                CHAT_SCORE_TOPIC,
+                key=user_id.encode("utf-8"),
+                value=codec.dumps({
+                    "userId": user_id,
+                    "score": local_scorer.score(user_message),
+                    "provisional": True,
+                    "origin": SERVICE_ID,
+                    "timestamp": timestamp,
+                }),
+                **_header_kwargs(codec),
+            )
         # Generate response with conversation history
-        ai_data = await generate_student_response(user_message, topic, user_id)
-    
-    # 1. Send Question
-    await producer.send_and_wait(
-        CHAT_OUTPUT_TOPIC,
-        json.dumps({
-            "userId": user_id,
-            "question": ai_data["question"],
-            "origin": SERVICE_ID,
-            "timestamp": timestamp,
-            "reasoning": ai_data["reasoning"]
-        }).encode("utf-8"),
-    )
+        on_partial = _partial_publisher(producer, user_id, timestamp, codec) if STREAMING_ENABLED else None
+        ai_data = await generate_student_response(
+            user_message, topic, user_id, client, history, on_partial
+        )
+        if analytics is not None:
+            analytics.record(user_id, topic, ai_data["score"])
+    return ai_data
 
-    # 2. Send Score
-    await producer.send_and_wait(
-        CHAT_SCORE_TOPIC,
-        json.dumps({
-            "userId": user_id,
-            "score": ai_data["score"],
-            "origin": SERVICE_ID,
-            "timestamp": timestamp,
-        }).encode("utf-8"),
-    )
 
+async def process_chat_event(
+    producer: AIOKafkaProducer,
+    event: Union[ChatEvent, Dict[str, Any]],
+    client: Optional[LLMClient] = None,
+    history: Optional[HistoryStore] = None,
+    event_key: Optional[str] = None,
+    codec: Codec = JSON,
+) -> None:
+    """Answer one chat event with a question and a score.
 
-async def main() -> None:
-    consumer = AIOKafkaConsumer(
-        CHAT_INPUT_TOPIC,
-        bootstrap_servers=KAFKA_BROKERS,
-        group_id=f"{SERVICE_ID}-consumer",
-    )
-    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BROKERS)
+    A plain dict is validated into a ChatEvent first (InvalidEvent if it
+    does not fit). ``event_key`` identifies the input record; it is sent as
+    ``idempotencyKey`` on both outputs so a redelivered event can be
+    dropped downstream. An event with a client ``messageId`` uses that
+    instead, so copies answered on different workers share the key too.
+    Outputs are encoded with ``codec``, the one the input arrived in.
+    Copies of an event (TURN_DEDUPE_ENABLED; same messageId, or same user
+    and message within TURN_DEDUPE_UNKEYED_TTL) share the first copy's
+    answer and ``idempotencyKey`` instead of generating again.
+    """
+    if history is None:
+        history = history_store
+    if not isinstance(event, ChatEvent):
+        event = ChatEvent.from_dict(event)
+    user_id = event.user_id
+    timestamp = event.timestamp
+    if event.message_id is not None:
+        event_key = message_idempotency_key(user_id, event.message_id)
+    # LLM requests made for this event queue fairly under this user's key
+    rate_limit_key.set(user_id)
+
+    if turn_dedupe is None:
+        ai_data = await _answer_event(producer, event, client, history, codec)
+    else:
+        async def first_copy() -> Tuple[Optional[str], Dict[str, Any]]:
+            return event_key, await _answer_event(producer, event, client, history, codec)
+
+        # Re-published under the first copy's key, so the gateway shows the answer once
+        (event_key, ai_data), duplicate = await turn_dedupe.run(
+            turn_key(user_id, event.message_id, event.topic, event.message),
+            first_copy,
+            ttl=None if event.message_id is not None else TURN_DEDUPE_UNKEYED_TTL,
+        )
+        if duplicate:
+            metrics.count("duplicate")
+
+    # Question and score go out together: one batch, one round-trip
+    key = user_id.encode("utf-8")
+    with metrics.stage("produce"):
+        await publish_records(producer, [
+            (
+                CHAT_OUTPUT_TOPIC,
+                key,
+                codec.dumps({
+                    "userId": user_id,
+                    "question": ai_data["question"],
+                    "origin": SERVICE_ID,
+                    "timestamp": timestamp,
+                    "reasoning": ai_data["reasoning"],
+                    "idempotencyKey": event_key,
+                }),
+            ),
+            (
+                CHAT_SCORE_TOPIC,
+                key,
+                codec.dumps({
+                    "userId": user_id,
+                    "score": ai_data["score"],
+                    "origin": SERVICE_ID,
+                    "timestamp": timestamp,
+                    "idempotencyKey": event_key,
+                }),
+            ),
+        ], headers=codec.headers)
+
+
+def _register_cache_gauges() -> None:
+    """Export cache hit ratios and the LLM time they saved on /metrics."""
+    for name, cache in (("greeting", greeting_cache), ("response", response_cache)):
+        if cache is None:
+            continue
+        stats = cache.stats
+        metrics.gauge(f"ai_engine_{name}_cache_hit_ratio", f"Share of {name} lookups served from cache.", lambda s=stats: s.hit_ratio)
+        metrics.gauge(f"ai_engine_{name}_cache_saved_seconds", f"LLM seconds saved by {name} cache hits.", lambda s=stats: s.saved_seconds)
+    if turn_dedupe is not None:
+        metrics.gauge("ai_engine_duplicate_turns", "Duplicate events answered without generating.", lambda: turn_dedupe.coalesced + turn_dedupe.recent_hits)
+
+
+async def _log_throughput(offsets: OffsetTracker, interval: float) -> None:
+    """Print events finished per second every ``interval`` seconds until cancelled."""
+    label = f" worker {WORKER_ID}" if WORKER_ID is not None else ""
+    last = offsets.completed
+    while True:
+        await asyncio.sleep(interval)
+        completed = offsets.completed
+        print(
+            f"AI Engine{label} throughput: {(completed - last) / interval:.1f} events/s "
+            f"({completed} total, {offsets.outstanding()} outstanding)",
+            flush=True,
+        )
+        last = completed
+
+
+async def run(
+    consumer: AIOKafkaConsumer,
+    producer: AIOKafkaProducer,
+    client: Optional[LLMClient],
+    history: Optional[HistoryStore] = None,
+) -> None:
+    """Consume chat events until the consumer is exhausted or the task is cancelled.
+
+    Starts and stops ``consumer``, ``producer`` and ``client``. Without an
+    explicit ``history`` the engine's configured store (HISTORY_BACKEND) is
+    used.
+    """
+    global batcher, score_log, summaries
+    summaries = create_summaries(client)
+    if SCORE_LOG_PATH:
+        score_log = ScoreLog(SCORE_LOG_PATH)
+    batcher = create_batcher(client, lambda m: _complete_student_turn(client, m), prompt_usage.record)
+    scheduler = BoundedScheduler(MAX_IN_FLIGHT, consumer, MAX_QUEUED_EVENTS)
+    # Serialize each user's turns so history is never read and written concurrently
+    lanes = KeyedExecutor()
+    # Last offset taken from each (topic, partition), for the lag gauge
+    consumed: Dict[Tuple[str, int], int] = {}
+    # Offsets are committed only up to the oldest event not yet published
+    offsets = OffsetTracker()
+    # Readiness/liveness for the probes; not ready until warm-up is done
+    health = Health(lambda: (offsets.completed, offsets.outstanding()))
+
+    async def dead_letter(message: Any, error: BaseException) -> bool:
+        """Park a record on the dead-letter topic; False if even that failed."""
+        print(
+            f"AI Engine Error (dead letter {message.topic}:{message.partition}:{message.offset}): {error!r}",
+            flush=True,
+        )
+        metrics.count("dead_letter")
+        try:
+            await publish_records(
+                producer,
+                [(DEAD_LETTER_TOPIC, message.key, message.value or b"")],
+                headers=dead_letter_headers(error, message.topic, message.partition, message.offset, message.headers),
+            )
+        except Exception as e:
+            print(f"AI Engine Error (dead letter publish): {e!r}", flush=True)
+            return False
+        return True
+
+    async def handle(message: Any, event: ChatEvent, codec: Codec) -> None:
+        started = time.perf_counter()
+        key = idempotency_key(message.topic, message.partition, message.offset)
+        try:
+            # A turn takes a running slot only once it holds its user's lane, so a
+            # backlog from one user waits without starving everyone else
+            await lanes.run(
+                event.user_id,
+                scheduler.run, process_chat_event, producer, event, client, history, key, codec,
+            )
+        except Exception as e:
+            if not await dead_letter(message, e):
+                # Commits for this partition stop here; it is re-delivered after a restart
+                return
+        offsets.done(message.topic, message.partition, message.offset)
+        health.record_event(time.perf_counter() - started)
+
+    async def reject(message: Any, error: InvalidEvent) -> None:
+        if await dead_letter(message, error):
+            offsets.done(message.topic, message.partition, message.offset)
+
+    metrics_server = None
+    if metrics.enabled or PROBES_ENABLED:
+        # Up first so the probes see the warm-up instead of a refused connection
+        metrics_server = await serve_metrics(metrics, health=health if PROBES_ENABLED else None)
 
-    await consumer.start()
     await producer.start()
-    
-    print(f"AI Engine started. Listening on topic: {CHAT_INPUT_TOPIC}", flush=True)
+    output_topics = [CHAT_OUTPUT_TOPIC, CHAT_SCORE_TOPIC, DEAD_LETTER_TOPIC]
+    if STREAMING_ENABLED:
+        output_topics.append(CHAT_OUTPUT_PARTIAL_TOPIC)
+    warmup = await warm_up(producer, client, output_topics, HOT_TOPICS)
+
+    # Compacted-topic restores finish before joining the group, so no partition
+    # is held (and no poll interval runs) while they read; scoped history and analytics
+    # only load the partitions they are assigned, in the rebalance listener
+    history_backend = None
+    if history is None and HISTORY_BACKEND == "kafka":
+        # Shared, restart-safe history; hot-path reads stay in the local cache
+        history_backend = KafkaHistoryBackend(producer, KAFKA_BROKERS, input_topic=CHAT_INPUT_TOPIC)
+        await history_backend.start()
+        history = ReadThroughHistoryStore(history_backend)
+    elif history is None:
+        history = history_store
+
+    analytics_publisher = None
+    if analytics is not None:
+        await restore_analytics(analytics, KAFKA_BROKERS, CHAT_INPUT_TOPIC)
+        analytics_publisher = asyncio.create_task(run_publisher(producer, analytics, ANALYTICS_PUBLISH_INTERVAL))
+
+    async def assigned(partitions: Iterable[Any]) -> None:
+        numbers = [tp.partition for tp in partitions]
+        # Scoped history and analytics load the new partitions' users before their turns arrive
+        if history_backend is not None:
+            await history_backend.assign(numbers)
+        if analytics is not None:
+            await load_assigned(producer, analytics, KAFKA_BROKERS, numbers)
+
+    consumer.subscribe([CHAT_INPUT_TOPIC], listener=CommitOnRevoke(offsets, consumer, assigned))
+    await consumer.start()
+    committer = asyncio.create_task(offsets.run(consumer, OFFSET_COMMIT_INTERVAL))
+    reporter = (
+        asyncio.create_task(_log_throughput(offsets, THROUGHPUT_LOG_INTERVAL))
+        if THROUGHPUT_LOG_INTERVAL > 0 else None
+    )
+
+    if metrics.enabled:
+        metrics.gauge("ai_engine_events_running", "Events holding a running slot.", lambda: scheduler.running)
+        metrics.gauge("ai_engine_events_admitted", "Events admitted and not finished.", lambda: scheduler.in_flight)
+        metrics.gauge("ai_engine_consumer_paused", "1 while backpressure pauses the consumer.", lambda: int(scheduler.paused))
+        metrics.gauge("ai_engine_consumer_lag", "Records behind the high watermark.", lambda: consumer_lag(consumer, consumed))
+        metrics.gauge("ai_engine_history_users", "Users held in the history store.", lambda: history.stats()["users"])
+        metrics.gauge("ai_engine_startup_seconds", "Seconds from run() to ready.", lambda: health.startup_seconds or 0)
+        _register_cache_gauges()
+        metrics.gauge("ai_engine_reply_recovery_rate", "Malformed student replies still answered with a question.", reply_repairs.recovery_rate)
+        if analytics is not None:
+            metrics.gauge("ai_engine_analytics_pending", "Analytics summaries changed since the last publish.", lambda: analytics.snapshot()["pending"])
+        if router is not None:
+            metrics.gauge("ai_engine_router_escalation_rate", "Fast-tier turns redone on the strong model.", router.escalation_rate)
+            metrics.gauge("ai_engine_router_fast_cost_usd", "Estimated spend on the fast tier.", lambda: router.fast.cost)
+            metrics.gauge("ai_engine_router_strong_cost_usd", "Estimated spend on the strong tier.", lambda: router.strong.cost)
+
+    print(
+        f"AI Engine started. Listening on topic: {CHAT_INPUT_TOPIC} "
+        f"(max in-flight: {scheduler.max_in_flight}, max queued: {scheduler.max_queued})",
+        flush=True,
+    )
+    print(f"AI Engine ready in {health.mark_ready():.2f}s (warm-up: {warmup})", flush=True)
+    if client is None:
+        print("AI Engine running in fallback mode (no OPENAI_API_KEY)", flush=True)
+    elif greeting_cache is not None and HOT_TOPICS:
+        greeting_cache.prefetch(HOT_TOPICS, lambda t: _request_greeting(t, client))
     
     try:
         async for message in consumer:
-            event = json.loads(message.value.decode("utf-8"))
-            asyncio.create_task(process_chat_event(producer, event))
+            consumed[(message.topic, message.partition)] = message.offset
+            offsets.track(message.topic, message.partition, message.offset)
+            try:
+                with metrics.stage("decode"):
+                    event, codec = decode_event(message.value, message.headers)
+            except InvalidEvent as e:
+                # Malformed records are parked rather than retried forever
+                await scheduler.submit(reject(message, e))
+                continue
+            await scheduler.submit(handle(message, event, codec))
+    except asyncio.CancelledError:
+        print("AI Engine shutting down", flush=True)
     finally:
+        health.mark_stopping()
+        await scheduler.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        committer.cancel()
+        if reporter is not None:
+            reporter.cancel()
+        await offsets.commit(consumer)
+        print(f"Offset stats: {offsets.snapshot()}", flush=True)
+        if metrics_server is not None:
+            metrics_server.close()
+        if batcher is not None:
+            await batcher.close()
+            print(f"Batching stats: {batcher.snapshot()}", flush=True)
         await consumer.stop()
+        if history_backend is not None:
+            await history_backend.stop()
+        if analytics_publisher is not None:
+            analytics_publisher.cancel()
+            try:
+                await publish_analytics(producer, analytics)  # last changes before the producer goes
+            except Exception as e:
+                print(f"AI Engine Error (analytics publish): {e!r}", flush=True)
+            print(f"Analytics stats: {analytics.snapshot()}", flush=True)
         await producer.stop()
+        print(f"History store stats: {history.stats()}", flush=True)
+        if greeting_cache is not None:
+            await greeting_cache.close()
+            print(f"Greeting cache stats: {greeting_cache.snapshot()}", flush=True)
+        if summaries is not None:
+            await summaries.close()
+            print(f"Summary stats: {summaries.snapshot()}", flush=True)
+        if response_cache is not None:
+            print(f"Response cache stats: {response_cache.snapshot()}", flush=True)
+        if turn_dedupe is not None:
+            print(f"Duplicate turn stats: {turn_dedupe.snapshot()}", flush=True)
+        print(f"Prompt usage: {prompt_usage.snapshot()}", flush=True)
+        print(f"LLM guard stats: {llm_guard.snapshot()}", flush=True)
+        if router is not None:
+            print(f"Router stats: {router.snapshot()}", flush=True)
+        print(f"Reply repair stats: {reply_repairs.snapshot()}", flush=True)
+        if score_log is not None:
+            score_log.close()
+            print(f"Logged {score_log.records} scored turn(s) to {SCORE_LOG_PATH}", flush=True)
+        if client is not None:
+            print(f"LLM connection stats: {client.connection_stats()}", flush=True)
+            if client.rate_limiter is not None:
+                print(f"Rate limiter stats: {client.rate_limiter.snapshot()}", flush=True)
+            await client.close()
+
+
+async def main() -> None:
+    # Subscribed in run(); offsets are committed there once events are published
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=KAFKA_BROKERS,
+        group_id=f"{SERVICE_ID}-consumer",
+        enable_auto_commit=False,
+    )
+    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BROKERS, **producer_config())
+    # One pooled client for the lifetime of the engine; None means fallback mode
+    client = create_llm_client()
+
+    # Turn SIGTERM (docker/k8s stop) into cancellation so in-flight work drains
+    main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, main_task.cancel)
+
+    await run(consumer, producer, client)
 
 
 if __name__ == "__main__":
+    install_event_loop()
     asyncio.run(main())
@@ -0,0 +1,289 @@
+"""Conversation history stores."""
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+HISTORY_MAX_USERS = int(os.getenv("HISTORY_MAX_USERS", "10000"))
+HISTORY_TTL_SECONDS = float(os.getenv("HISTORY_TTL_SECONDS", "3600"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", "0"))  # 0 disables the byte cap
+# Messages are dropped from the front in multiples of this, keeping prompt prefixes aligned
+HISTORY_TRIM_STEP = int(os.getenv("HISTORY_TRIM_STEP", "2"))
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "memory")  # memory | kafka
+
+# Rough per-message cost of the dict and its two keys, on top of the strings
+_MESSAGE_OVERHEAD = 64
+
+Message = Dict[str, str]
+
+
+def message_size(message: Message) -> int:
+    """Approximate in-memory size of one history message, in bytes."""
+    return _MESSAGE_OVERHEAD + sum(len(value) for value in message.values())
+
+
+class HistoryStore(ABC):
+    """Per-user conversation history, oldest message first."""
+
+    @abstractmethod
+    async def get(self, user_id: str) -> List[Message]:
+        """Return a copy of the user's history (empty if unknown)."""
+
+    @abstractmethod
+    async def append(self, user_id: str, *messages: Message) -> None:
+        """Append messages to the user's history."""
+
+    @abstractmethod
+    async def clear(self, user_id: str) -> None:
+        """Forget the user's history."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss/eviction counters."""
+
+
+class _Entry:
+    __slots__ = ("messages", "size", "touched")
+
+    def __init__(self, touched: float) -> None:
+        self.messages: List[Message] = []
+        self.size = 0
+        self.touched = touched
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """Bounded in-process store with LRU eviction and idle TTL.
+
+    Keeps at most ``max_users`` histories of ``max_messages`` each. Users
+    idle for longer than ``ttl_seconds`` are dropped, and when ``max_bytes``
+    is set the least recently used users are evicted until the accounted
+    size fits.
+    """
+
+    def __init__(
+        self,
+        max_users: int = HISTORY_MAX_USERS,
+        ttl_seconds: float = HISTORY_TTL_SECONDS,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+        max_bytes: int = HISTORY_MAX_BYTES,
+        trim_step: int = HISTORY_TRIM_STEP,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_users < 1:
+            raise ValueError("max_users must be at least 1")
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.trim_step = max(1, trim_step)
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, user_id: str) -> List[Message]:
+        messages = self.lookup(user_id)
+        return messages if messages is not None else []
+
+    async def append(self, user_id: str, *messages: Message) -> None:
+        now = self._clock()
+        self._expire(now)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry(now)
+        entry.messages.extend(messages)
+        self._store(user_id, entry, now)
+
+    def lookup(self, user_id: str) -> Optional[List[Message]]:
+        """Return a copy of the user's history, or None if it is not held."""
+        now = self._clock()
+        entry = self._entries.get(user_id)
+        if entry is not None and self._expired(entry, now):
+            self._drop(user_id)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.touched = now
+        self._entries.move_to_end(user_id)
+        return list(entry.messages)
+
+    def replace(self, user_id: str, messages: List[Message]) -> None:
+        """Set the user's whole history, e.g. when filling from a backend."""
+        now = self._clock()
+        self._expire(now)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry(now)
+        entry.messages = list(messages)
+        self._store(user_id, entry, now)
+
+    def trim(self, messages: List[Message]) -> List[Message]:
+        """Drop the oldest messages, in whole trim steps, down to ``max_messages``."""
+        overflow = len(messages) - self.max_messages
+        if overflow <= 0:
+            return messages
+        return messages[-(-overflow // self.trim_step) * self.trim_step:]
+
+    def discard(self, user_id: str) -> None:
+        if user_id in self._entries:
+            self._drop(user_id)
+
+    async def clear(self, user_id: str) -> None:
+        self.discard(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._entries),
+            "messages": sum(len(e.messages) for e in self._entries.values()),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _store(self, user_id: str, entry: _Entry, now: float) -> None:
+        entry.messages = self.trim(entry.messages)
+        self._bytes -= entry.size
+        entry.size = sum(message_size(m) for m in entry.messages)
+        self._bytes += entry.size
+        entry.touched = now
+        self._entries.move_to_end(user_id)
+        self._evict(keep=user_id)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.touched > self.ttl_seconds
+
+    def _expire(self, now: float) -> None:
+        # Entries are kept in last-touched order, so expired ones sit at the front
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if not self._expired(entry, now):
+                break
+            self._drop(user_id)
+            self.expirations += 1
+
+    def _evict(self, keep: str) -> None:
+        while len(self._entries) > self.max_users or (
+            self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1
+        ):
+            user_id = next(iter(self._entries))
+            if user_id == keep:
+                break
+            self._drop(user_id)
+            self.evictions += 1
+
+    def _drop(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id)
+        self._bytes -= entry.size
+
+
+class HistoryBackend(ABC):
+    """Durable history storage shared by every engine replica."""
+
+    _listener: Optional[Callable[[str], None]] = None
+
+    async def start(self) -> None:
+        """Connect and restore state; called once before first use."""
+
+    async def stop(self) -> None:
+        """Flush and disconnect."""
+
+    @abstractmethod
+    async def load(self, user_id: str) -> Optional[List[Message]]:
+        """Return the user's stored history, or None if there is none."""
+
+    @abstractmethod
+    async def save(self, user_id: str, messages: List[Message]) -> None:
+        """Persist the user's full (already trimmed) history."""
+
+    @abstractmethod
+    async def delete(self, user_id: str) -> None:
+        """Remove the user's stored history."""
+
+    def set_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback for histories changed by another replica."""
+        self._listener = listener
+
+    def notify(self, user_id: str) -> None:
+        if self._listener is not None:
+            self._listener(user_id)
+
+
+class InMemoryHistoryBackend(HistoryBackend):
+    """Process-local backend; a stand-in for tests and single-replica runs."""
+
+    def __init__(self) -> None:
+        self._data: Dict[str, List[Message]] = {}
+        self.loads = 0
+        self.saves = 0
+
+    async def load(self, user_id: str) -> Optional[List[Message]]:
+        self.loads += 1
+        messages = self._data.get(user_id)
+        return list(messages) if messages is not None else None
+
+    async def save(self, user_id: str, messages: List[Message]) -> None:
+        self.saves += 1
+        self._data[user_id] = list(messages)
+
+    async def delete(self, user_id: str) -> None:
+        self._data.pop(user_id, None)
+
+
+class ReadThroughHistoryStore(HistoryStore):
+    """History served from a local bounded cache, written through to a backend.
+
+    Reads only reach the backend when the local cache does not hold the user
+    (first turn after a restart or a partition rebalance). Every change is
+    written through, so another replica picking the user up sees the latest
+    history.
+    """
+
+    def __init__(self, backend: HistoryBackend, cache: Optional[InMemoryHistoryStore] = None) -> None:
+        self.backend = backend
+        self.cache = cache if cache is not None else InMemoryHistoryStore()
+        self.backend_reads = 0
+        self.backend_writes = 0
+        backend.set_listener(self.cache.discard)
+
+    async def get(self, user_id: str) -> List[Message]:
+        messages = self.cache.lookup(user_id)
+        if messages is not None:
+            return messages
+        self.backend_reads += 1
+        messages = await self.backend.load(user_id) or []
+        # Cache empty histories too, so new users do not hit the backend every turn
+        messages = self.cache.trim(messages)
+        self.cache.replace(user_id, messages)
+        return list(messages)
+
+    async def append(self, user_id: str, *messages: Message) -> None:
+        current = (await self.get(user_id)) + list(messages)
+        current = self.cache.trim(current)
+        self.cache.replace(user_id, current)
+        self.backend_writes += 1
+        await self.backend.save(user_id, current)
+
+    async def clear(self, user_id: str) -> None:
+        self.cache.replace(user_id, [])
+        self.backend_writes += 1
+        await self.backend.delete(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["backend_reads"] = self.backend_reads
+        stats["backend_writes"] = self.backend_writes
+        return stats
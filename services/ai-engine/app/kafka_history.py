@@ -0,0 +1,284 @@
+"""Conversation history persisted to a compacted Kafka topic."""
+import asyncio
+import json
+import os
+import sys
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from aiokafka import AIOKafkaConsumer, TopicPartition
+from aiokafka.admin import AIOKafkaAdminClient, NewTopic
+
+from .history import HISTORY_MAX_MESSAGES, HistoryBackend, InMemoryHistoryStore, Message
+
+
+HISTORY_TOPIC = os.getenv("HISTORY_TOPIC", "chat.history")
+HISTORY_TOPIC_PARTITIONS = int(os.getenv("HISTORY_TOPIC_PARTITIONS", "6"))
+HISTORY_TOPIC_REPLICATION = int(os.getenv("HISTORY_TOPIC_REPLICATION", "1"))
+# assigned: hold only users on this worker's input partitions | all: every user in the topic
+HISTORY_VIEW_SCOPE = os.getenv("HISTORY_VIEW_SCOPE", "assigned")
+# 0 keeps every user in scope; a cap is lossy (evicted users read as new)
+HISTORY_VIEW_MAX_USERS = int(os.getenv("HISTORY_VIEW_MAX_USERS", "0"))
+HISTORY_METADATA_TIMEOUT = float(os.getenv("HISTORY_METADATA_TIMEOUT", "30"))
+
+# Kafka error code returned by CreateTopics when the topic is already there
+_TOPIC_ALREADY_EXISTS = 36
+
+
+async def ensure_compacted_topic(
+    bootstrap_servers: List[str], topic: str, partitions: int, replication: int
+) -> None:
+    """Create ``topic`` with ``cleanup.policy=compact`` unless it already exists."""
+    admin = AIOKafkaAdminClient(bootstrap_servers=bootstrap_servers)
+    await admin.start()
+    try:
+        response = await admin.create_topics([
+            NewTopic(
+                topic,
+                num_partitions=partitions,
+                replication_factor=replication,
+                topic_configs={"cleanup.policy": "compact"},
+            )
+        ])
+        for name, code, *_ in response.topic_errors:
+            if code not in (0, _TOPIC_ALREADY_EXISTS):
+                print(f"Could not create compacted topic {name} (error {code})", flush=True)
+    finally:
+        await admin.close()
+
+
+async def wait_for_partitions(consumer: AIOKafkaConsumer, topic: str, timeout: float) -> List[TopicPartition]:
+    """Partitions of ``topic``, retrying while a new topic's metadata propagates."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.1
+    while True:
+        await consumer.topics()  # refresh metadata so the partitions are known
+        found = consumer.partitions_for_topic(topic)
+        if found:
+            return [TopicPartition(topic, p) for p in sorted(found)]
+        if loop.time() >= deadline:
+            raise RuntimeError(f"No partitions for topic {topic} after {timeout}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+
+async def read_to_end(
+    consumer: AIOKafkaConsumer, partitions: Iterable[TopicPartition], apply: Callable[[Any], None]
+) -> None:
+    """Pass every record up to the current end of ``partitions`` to ``apply``."""
+    end_offsets = await consumer.end_offsets(list(partitions))
+    remaining = {tp for tp, end in end_offsets.items() if end > 0}
+    while remaining:
+        batches = await consumer.getmany(*remaining, timeout_ms=1000)
+        for records in batches.values():
+            for record in records:
+                apply(record)
+        remaining = {tp for tp in remaining if await consumer.position(tp) < end_offsets[tp]}
+
+
+class KafkaHistoryBackend(HistoryBackend):
+    """Stores each user's latest history as one record keyed by userId.
+
+    The topic is log-compacted, so it holds one snapshot per user and a
+    restarted or newly added replica rebuilds its view by reading it from the
+    beginning. Afterwards every replica tails the topic: records written by
+    other replicas refresh the view and invalidate the local cache, while the
+    replica's own writes are applied directly and skipped when they echo back.
+
+    Given ``input_topic`` (keyed by userId too, with as many partitions) the
+    view is scoped: history partition p holds the users of input partition
+    p, so only the partitions passed to ``assign`` are read and kept, and a
+    newly assigned one is read from the beginning before ``assign`` returns.
+    Memory is then proportional to this worker's share of the users, not
+    to all of them. Records on other partitions only invalidate the local
+    cache. With ``view_scope="all"`` or mismatched partition counts every
+    user is held.
+
+    With ``view_max_users`` set the view is also an LRU and an evicted user's
+    history is lost to this replica until their next write; evictions are
+    logged.
+    """
+
+    def __init__(
+        self,
+        producer: Any,
+        bootstrap_servers: List[str],
+        topic: str = HISTORY_TOPIC,
+        instance_id: Optional[str] = None,
+        view_max_users: int = HISTORY_VIEW_MAX_USERS,
+        input_topic: Optional[str] = None,
+        view_scope: str = HISTORY_VIEW_SCOPE,
+    ) -> None:
+        self._producer = producer
+        self._bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.instance_id = instance_id or uuid.uuid4().hex
+        self._origin = self.instance_id.encode("utf-8")
+        self._view = InMemoryHistoryStore(
+            max_users=view_max_users or sys.maxsize, ttl_seconds=0, max_messages=HISTORY_MAX_MESSAGES
+        )
+        self._evictions_reported = 0
+        self._consumer: Optional[AIOKafkaConsumer] = None
+        self._tail_task: Optional[asyncio.Task] = None
+        self._restored = False
+        self.input_topic = input_topic if view_scope == "assigned" else None
+        # None while the view holds every partition
+        self._owned: Optional[Set[int]] = None
+        self._loading: Set[int] = set()
+        self._partition_users: Dict[int, Set[str]] = {}
+        self.records_applied = 0
+
+    async def start(self) -> None:
+        await self._ensure_topic()
+        self._consumer = AIOKafkaConsumer(
+            bootstrap_servers=self._bootstrap_servers,
+            group_id=None,
+            enable_auto_commit=False,
+        )
+        await self._consumer.start()
+        partitions = await self._wait_for_partitions(HISTORY_METADATA_TIMEOUT)
+        self._consumer.assign(partitions)
+        if self.input_topic is not None:
+            inputs = self._consumer.partitions_for_topic(self.input_topic) or set()
+            if len(inputs) == len(partitions):
+                self._owned = set()  # filled by assign() as input partitions arrive
+            else:
+                print(
+                    f"History view holds every user: {self.input_topic} has {len(inputs)} partition(s), "
+                    f"{self.topic} has {len(partitions)}",
+                    flush=True,
+                )
+        if self._owned is None:
+            await self._consumer.seek_to_beginning(*partitions)
+            await self._restore(partitions)
+            print(
+                f"History restored from {self.topic}: {len(self._view)} user(s), "
+                f"{self.records_applied} record(s)",
+                flush=True,
+            )
+        self._restored = True
+        self._tail_task = asyncio.create_task(self._tail())
+
+    async def assign(self, partitions: Iterable[int]) -> None:
+        """Keep only the users of ``partitions``, reading newly assigned ones to the end first."""
+        if self._owned is None:
+            return
+        wanted = set(partitions)
+        for partition in self._owned - wanted:
+            for user_id in self._partition_users.pop(partition, ()):
+                self._view.discard(user_id)
+        added = sorted(wanted - self._owned)
+        self._owned = wanted
+        if not added:
+            return
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            await asyncio.gather(self._tail_task, return_exceptions=True)
+        tps = [TopicPartition(self.topic, p) for p in added]
+        self._loading.update(added)
+        try:
+            await self._consumer.seek_to_beginning(*tps)
+            await read_to_end(self._consumer, tps, self.apply)
+        finally:
+            self._loading.clear()
+            self._tail_task = asyncio.create_task(self._tail())
+        print(
+            f"History loaded from {self.topic} partition(s) {added}: {len(self._view)} user(s) in view",
+            flush=True,
+        )
+
+    async def _wait_for_partitions(self, timeout: float) -> List[TopicPartition]:
+        return await wait_for_partitions(self._consumer, self.topic, timeout)
+
+    async def stop(self) -> None:
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            await asyncio.gather(self._tail_task, return_exceptions=True)
+        if self._consumer is not None:
+            await self._consumer.stop()
+
+    async def load(self, user_id: str) -> Optional[List[Message]]:
+        return self._view.lookup(user_id)
+
+    async def save(self, user_id: str, messages: List[Message]) -> None:
+        self._view.replace(user_id, messages)
+        self._report_evictions()
+        # send() only enqueues into the producer's batch; delivery is not awaited
+        await self._producer.send(
+            self.topic,
+            key=user_id.encode("utf-8"),
+            value=json.dumps(messages).encode("utf-8"),
+            headers=[("origin", self._origin)],
+        )
+
+    async def delete(self, user_id: str) -> None:
+        self._view.discard(user_id)
+        await self._producer.send(
+            self.topic,
+            key=user_id.encode("utf-8"),
+            value=None,
+            headers=[("origin", self._origin)],
+        )
+
+    def apply(self, record: Any) -> None:
+        """Apply one consumed snapshot (or tombstone) to the local view."""
+        if record.key is None:
+            return
+        user_id = record.key.decode("utf-8")
+        if self._owned is not None:
+            if record.partition not in self._owned:
+                # Not this worker's user: nothing to hold, but a cached copy is stale now
+                self._view.discard(user_id)
+                self.notify(user_id)
+                return
+            if record.value is None:
+                self._partition_users.get(record.partition, set()).discard(user_id)
+            else:
+                self._partition_users.setdefault(record.partition, set()).add(user_id)
+        if (
+            self._restored
+            and record.partition not in self._loading
+            and dict(record.headers or ()).get("origin") == self._origin
+        ):
+            return
+        if record.value is None:
+            self._view.discard(user_id)
+        else:
+            self._view.replace(user_id, json.loads(record.value.decode("utf-8")))
+            self._report_evictions()
+        self.records_applied += 1
+        if self._restored:
+            self.notify(user_id)
+
+    def _report_evictions(self) -> None:
+        evictions = self._view.evictions
+        if evictions > self._evictions_reported:
+            if self._evictions_reported == 0 or evictions // 1000 > self._evictions_reported // 1000:
+                print(
+                    f"History view over HISTORY_VIEW_MAX_USERS={self._view.max_users}: "
+                    f"{evictions} user(s) evicted; their history is lost on this replica",
+                    flush=True,
+                )
+            self._evictions_reported = evictions
+
+    async def _restore(self, partitions: Iterable[TopicPartition]) -> None:
+        await read_to_end(self._consumer, partitions, self.apply)
+
+    async def _tail(self) -> None:
+        while True:
+            try:
+                batches = await self._consumer.getmany(timeout_ms=1000)
+                for records in batches.values():
+                    for record in records:
+                        self.apply(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"AI Engine Error (history tail): {e}", flush=True)
+                await asyncio.sleep(1)
+
+    async def _ensure_topic(self) -> None:
+        await ensure_compacted_topic(
+            self._bootstrap_servers, self.topic, HISTORY_TOPIC_PARTITIONS, HISTORY_TOPIC_REPLICATION
+        )
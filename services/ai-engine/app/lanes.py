@@ -0,0 +1,47 @@
+"""Per-key serial execution lanes."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class _Lane:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedExecutor:
+    """Runs calls for the same key one at a time, in arrival order.
+
+    Calls for different keys run in parallel. A lane exists only while it has
+    a running or waiting call, so idle users cost nothing.
+    """
+
+    def __init__(self) -> None:
+        self._lanes: Dict[Hashable, _Lane] = {}
+
+    @property
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    def pending(self, key: Hashable) -> int:
+        lane = self._lanes.get(key)
+        return lane.users if lane is not None else 0
+
+    async def run(self, key: Hashable, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.users += 1
+        try:
+            # asyncio.Lock wakes waiters FIFO, which keeps per-key arrival order
+            async with lane.lock:
+                return await fn(*args, **kwargs)
+        finally:
+            lane.users -= 1
+            if lane.users == 0 and self._lanes.get(key) is lane:
+                del self._lanes[key]
@@ -0,0 +1,180 @@
+"""Shared, pooled LLM client owned by the engine for its whole lifetime."""
+import asyncio
+import os
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import APIStatusError, AsyncOpenAI
+
+from .ratelimit import RateLimiter, create_rate_limiter, estimate_request_tokens, rate_limit_key
+
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Values shipped in the example env files; treated the same as a missing key.
+PLACEHOLDER_API_KEYS = {"", "replace-me", "your-openai-api-key-here"}
+
+
+class ConnectionStats:
+    """Counts requests against the TCP/TLS connections that served them."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections_opened = 0
+        self._seen: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def record(self, connections: Any) -> None:
+        self.requests += 1
+        for connection in connections:
+            if connection not in self._seen:
+                self._seen.add(connection)
+                self.connections_opened += 1
+
+    @property
+    def connections_reused(self) -> int:
+        return max(0, self.requests - self.connections_opened)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+        }
+
+
+class PromptUsage:
+    """Running prompt-token totals, including tokens served from the provider's prompt cache."""
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, usage: Any) -> Dict[str, int]:
+        """Add one response's ``usage`` and return that turn's counts."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        turn = {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+            "completion_tokens": usage.completion_tokens or 0,
+        }
+        self.turns += 1
+        self.prompt_tokens += turn["prompt_tokens"]
+        self.cached_tokens += turn["cached_tokens"]
+        self.completion_tokens += turn["completion_tokens"]
+        return turn
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+        }
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport that reports every request to a ConnectionStats.
+
+    With a RateLimiter, each request (SDK retries included) first waits for
+    quota and every response's rate-limit headers are fed back to it.
+    """
+
+    def __init__(self, stats: ConnectionStats, rate_limiter: Optional[RateLimiter] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._rate_limiter = rate_limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire(rate_limit_key.get(), estimate_request_tokens(request.content))
+        response = await super().handle_async_request(request)
+        self._stats.record(self._pool.connections)
+        if self._rate_limiter is not None:
+            self._rate_limiter.observe(response.status_code, response.headers)
+        return response
+
+
+class LLMClient:
+    """Long-lived OpenAI client backed by a keep-alive connection pool.
+
+    Create one at startup, pass it to every generation path and ``close()``
+    it on shutdown.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        *,
+        base_url: Optional[str] = None,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        request_timeout: float = LLM_REQUEST_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        self.stats = ConnectionStats()
+        self.rate_limiter = rate_limiter
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self._http = httpx.AsyncClient(
+            transport=_CountingTransport(self.stats, rate_limiter, limits=limits),
+            limits=limits,
+            timeout=timeout,
+        )
+        self.openai = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self._http,
+            timeout=timeout,
+            max_retries=max_retries,
+        )
+
+    @property
+    def chat(self) -> Any:
+        return self.openai.chat
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.stats.snapshot()
+
+    async def warm(self, connections: int = 1) -> int:
+        """Open up to ``connections`` pooled connections (DNS, TCP, TLS) before the first turn.
+
+        Sends that many concurrent model-listing requests, which cost no
+        tokens. Any HTTP response leaves a warm connection behind; returns how
+        many requests got one.
+        """
+        self.openai.chat.completions  # builds the SDK's lazily created resources
+        listing = self.openai.with_options(max_retries=0).models
+        results = await asyncio.gather(*(listing.list() for _ in range(connections)), return_exceptions=True)
+        return sum(1 for r in results if not isinstance(r, BaseException) or isinstance(r, APIStatusError))
+
+    async def close(self) -> None:
+        await self.openai.close()
+
+
+def create_llm_client(api_key: Optional[str] = None) -> Optional[LLMClient]:
+    """Build the engine's LLM client, or return None to run in fallback mode."""
+    if api_key is None:
+        api_key = os.getenv("OPENAI_API_KEY", "")
+    if api_key in PLACEHOLDER_API_KEYS:
+        return None
+    return LLMClient(
+        api_key,
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        rate_limiter=create_rate_limiter(),
+    )
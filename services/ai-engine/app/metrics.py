@@ -0,0 +1,218 @@
+"""Prometheus-format metrics for the engine's hot path, served over HTTP."""
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Sequence, Tuple
+
+from .startup import Health
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Seconds; spans a cached turn (~1ms) to a slow completion (~10s)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_TIMER = nullcontext()
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Bucketed observations per label value (label-less when ``label`` is empty)."""
+
+    def __init__(self, name: str, help: str, label: str = "", buckets: Sequence[float] = STAGE_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List[Any]] = {}
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        series = self._series.get(label_value)
+        if series is None:
+            # counts per bucket (last is +Inf), then sum
+            series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, label_value: str = "") -> int:
+        series = self._series.get(label_value)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = (self.label, "le") if self.label else ("le",)
+        for label_value, (counts, total) in sorted(self._series.items()):
+            prefix = (label_value,) if self.label else ()
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, (*prefix, _number(bound)))} {cumulative}")
+            own = _labels(names[:-1], prefix)
+            lines.append(f"{self.name}_sum{own} {total!r}")
+            lines.append(f"{self.name}_count{own} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic count per label value."""
+
+    def __init__(self, name: str, help: str, label: str = "") -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: Dict[str, int] = {}
+
+    def inc(self, label_value: str = "", amount: int = 1) -> None:
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str = "") -> int:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        names = (self.label,) if self.label else ()
+        for label_value, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(names, (label_value,))} {value}")
+        return lines
+
+
+class Gauge:
+    """Value read from ``read()`` at scrape time, so the hot path never updates it."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]) -> None:
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_number(self.read())}")
+        except Exception as e:
+            print(f"Metrics gauge {self.name} failed: {e!r}", flush=True)
+        return lines
+
+
+class _StageTimer:
+    __slots__ = ("_histogram", "_stage", "_started")
+
+    def __init__(self, histogram: Histogram, stage: str) -> None:
+        self._histogram = histogram
+        self._stage = stage
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, self._stage)
+
+
+class Metrics:
+    """Stage latencies, event counters and scrape-time gauges.
+
+    Disabled, ``stage`` hands back a shared no-op context manager and
+    ``count`` returns immediately, so instrumentation left in the hot path
+    costs a method call. Gauges are callables evaluated only when scraped.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED) -> None:
+        self.enabled = enabled
+        self.stages = Histogram(
+            "ai_engine_stage_seconds", "Time spent in each stage of a chat event.", label="stage"
+        )
+        self.outcomes = Counter(
+            "ai_engine_turn_outcomes_total", "Chat events by how they were answered.", label="outcome"
+        )
+        self._gauges: Dict[str, Gauge] = {}
+
+    def stage(self, name: str) -> ContextManager[None]:
+        """Time the enclosed block as stage ``name``."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self.stages, name)
+
+    def count(self, outcome: str) -> None:
+        if self.enabled:
+            self.outcomes.inc(outcome)
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> None:
+        """Register (or replace) a gauge read at scrape time."""
+        self._gauges[name] = Gauge(name, help, read)
+
+    def render(self) -> str:
+        lines = self.stages.render() + self.outcomes.render()
+        for gauge in self._gauges.values():
+            lines.extend(gauge.render())
+        return "\n".join(lines) + "\n"
+
+
+async def _handle(
+    metrics: Metrics, health: Optional[Health], reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+        parts = head.split(b" ", 2)
+        path = parts[1].split(b"?", 1)[0] if len(parts) > 1 else b""
+        content_type = "text/plain"
+        if parts[0] != b"GET":
+            status, body = "404 Not Found", b"not found\n"
+        elif path == b"/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4", metrics.render().encode("utf-8")
+        elif path == b"/readyz" and health is not None:
+            status, body = ("200 OK", b"ready\n") if health.ready else ("503 Service Unavailable", b"not ready\n")
+        elif path == b"/healthz" and health is not None:
+            status, body = ("200 OK", b"ok\n") if health.live() else ("503 Service Unavailable", b"stalled\n")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(
+    metrics: Metrics, host: str = METRICS_HOST, port: int = METRICS_PORT, health: Optional[Health] = None
+) -> asyncio.AbstractServer:
+    """Serve ``GET /metrics`` in the engine's own event loop.
+
+    With ``health``, ``/readyz`` and ``/healthz`` answer the orchestrator's
+    readiness and liveness probes (200 or 503).
+    """
+    server = await asyncio.start_server(lambda r, w: _handle(metrics, health, r, w), host, port)
+    print(f"Metrics on http://{host}:{port}/metrics", flush=True)
+    return server
+
+
+def consumer_lag(consumer: Any, consumed: Dict[Tuple[str, int], int]) -> float:
+    """Records between each assigned partition's high watermark and the last one consumed.
+
+    Partitions nothing has been consumed from yet are not counted.
+    """
+    lag = 0
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        offset = consumed.get((tp.topic, tp.partition))
+        if highwater is not None and offset is not None:
+            lag += max(0, highwater - offset - 1)
+    return lag
@@ -0,0 +1,149 @@
+"""Per-partition commit watermarks for at-least-once processing."""
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+from aiokafka import TopicPartition
+from aiokafka.abc import ConsumerRebalanceListener
+
+
+OFFSET_COMMIT_INTERVAL = float(os.getenv("OFFSET_COMMIT_INTERVAL", "1.0"))
+
+Partition = Tuple[str, int]
+
+
+def idempotency_key(topic: str, partition: int, offset: int) -> str:
+    """Stable id of an input record, the same on every redelivery."""
+    return f"{topic}:{partition}:{offset}"
+
+
+def message_idempotency_key(user_id: str, message_id: str) -> str:
+    """Stable id of a client message, the same for every copy on any worker."""
+    return f"msg:{user_id}:{message_id}"
+
+
+class _PartitionState:
+    __slots__ = ("pending", "done", "committable", "committed")
+
+    def __init__(self) -> None:
+        self.pending: Deque[int] = deque()   # consumed offsets, in order, not yet below the watermark
+        self.done: Set[int] = set()
+        self.committable: Optional[int] = None
+        self.committed: Optional[int] = None
+
+
+class OffsetTracker:
+    """Tracks which consumed offsets have been fully processed, per partition.
+
+    Events finish out of order (other users' turns run concurrently), so an
+    offset is only committable once it and every earlier offset of its
+    partition are done. ``track`` registers a consumed offset and ``done``
+    marks one finished; the watermark (next offset to commit) advances past
+    the longest finished prefix. Nothing behind an unfinished event is ever
+    committed, so a crash re-delivers it instead of losing it.
+    """
+
+    def __init__(self) -> None:
+        self._partitions: Dict[Partition, _PartitionState] = {}
+        self.commits = 0
+        self.commit_failures = 0
+        self.completed = 0
+
+    def track(self, topic: str, partition: int, offset: int) -> None:
+        state = self._partitions.setdefault((topic, partition), _PartitionState())
+        if state.pending and offset <= state.pending[-1]:
+            return  # re-delivered after a rebalance while the first copy is still in flight
+        state.pending.append(offset)
+
+    def done(self, topic: str, partition: int, offset: int) -> None:
+        state = self._partitions.get((topic, partition))
+        if state is None:
+            return  # partition revoked meanwhile; its new owner re-processes the record
+        if not state.pending or offset < state.pending[0]:
+            return  # a re-delivered copy of an offset already below the watermark
+        if offset not in state.done:
+            self.completed += 1
+        state.done.add(offset)
+        while state.pending and state.pending[0] in state.done:
+            finished = state.pending.popleft()
+            state.done.discard(finished)
+            state.committable = finished + 1
+
+    def watermark(self, topic: str, partition: int) -> Optional[int]:
+        state = self._partitions.get((topic, partition))
+        return state.committable if state is not None else None
+
+    def outstanding(self) -> int:
+        return sum(len(state.pending) for state in self._partitions.values())
+
+    def committable(self, partitions: Optional[Iterable[Partition]] = None) -> Dict[TopicPartition, int]:
+        """Watermarks that moved since the last successful commit."""
+        keys = self._partitions.keys() if partitions is None else partitions
+        offsets = {}
+        for key in keys:
+            state = self._partitions.get(key)
+            if state is not None and state.committable is not None and state.committable != state.committed:
+                offsets[TopicPartition(*key)] = state.committable
+        return offsets
+
+    async def commit(self, consumer: Any, partitions: Optional[Iterable[Partition]] = None) -> None:
+        offsets = self.committable(partitions)
+        if not offsets:
+            return
+        try:
+            await consumer.commit(offsets)
+        except Exception as e:
+            # Typically a rebalance in progress; the next commit retries
+            self.commit_failures += 1
+            print(f"AI Engine Error (offset commit): {e!r}", flush=True)
+            return
+        self.commits += 1
+        for tp, offset in offsets.items():
+            self._partitions[(tp.topic, tp.partition)].committed = offset
+
+    def forget(self, partitions: Iterable[Partition]) -> None:
+        for key in partitions:
+            self._partitions.pop(key, None)
+
+    async def run(self, consumer: Any, interval: float = OFFSET_COMMIT_INTERVAL) -> None:
+        """Commit advanced watermarks every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.commit(consumer)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "partitions": len(self._partitions),
+            "outstanding": self.outstanding(),
+            "completed": self.completed,
+            "commits": self.commits,
+            "commit_failures": self.commit_failures,
+        }
+
+
+class CommitOnRevoke(ConsumerRebalanceListener):
+    """Commits finished work of partitions being taken away, then forgets them.
+
+    ``on_assigned`` runs before any record of the new assignment is fetched,
+    e.g. to load per-partition state.
+    """
+
+    def __init__(
+        self,
+        tracker: OffsetTracker,
+        consumer: Any,
+        on_assigned: Optional[Callable[[Iterable[TopicPartition]], Awaitable[None]]] = None,
+    ) -> None:
+        self.tracker = tracker
+        self.consumer = consumer
+        self.on_assigned = on_assigned
+
+    async def on_partitions_revoked(self, revoked: Iterable[TopicPartition]) -> None:
+        keys = [(tp.topic, tp.partition) for tp in revoked]
+        await self.tracker.commit(self.consumer, keys)
+        self.tracker.forget(keys)
+
+    async def on_partitions_assigned(self, assigned: Iterable[TopicPartition]) -> None:
+        if self.on_assigned is not None:
+            await self.on_assigned(assigned)
@@ -1,3 +1,10 @@
+import os
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Sequence, Tuple
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "512"))
+
 # General Student Persona Template
 STUDENT_SYSTEM_PROMPT = """
 You are a highly curious and motivated student named Jamie. Your goal is to learn the topic of {topic} through the "Feynman Technique" - by having a teacher (the user) explain it to you.
@@ -74,8 +81,62 @@ OUTPUT FORMAT (JSON):
 }}
 """
 
+# Appended to the student prompt when several sessions share one request
+BATCH_STUDENT_INSTRUCTIONS = """
+BATCHED SESSIONS:
+You are answering for several independent sessions at once. The input is a JSON object
+{"sessions": [{"id": ..., "conversation": [...]}, ...]} where each conversation ends with the
+latest teacher message. Treat every session separately and never mix content between them.
+Your output must be a JSON object with one reply per session, each following the format above:
+{"replies": [{"id": ..., "reasoning": "...", "confusion_score": ..., "question": "..."}, ...]}
+"""
+
+# Sent after a student reply that was cut off before its question was complete
+REPLY_CONTINUATION_PROMPT = """
+Your previous reply was cut off before the question was finished. Reply with only a short
+JSON object {"confusion_score": ..., "question": "..."} completing it: no reasoning, one
+question of at most two sentences.
+"""
+
+class CompiledTemplate:
+    """A str.format template split once into literal text and field names."""
+
+    def __init__(self, template: str) -> None:
+        self._parts: List[Tuple[str, str]] = [
+            (literal, field or "") for literal, field, _, _ in Formatter().parse(template)
+        ]
+
+    def render(self, **values: str) -> str:
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field:
+                pieces.append(values[field])
+        return "".join(pieces)
+
+
+_STUDENT_TEMPLATE = CompiledTemplate(STUDENT_SYSTEM_PROMPT)
+_INITIAL_GREETING_TEMPLATE = CompiledTemplate(INITIAL_GREETING_PROMPT)
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
 def get_student_prompt(topic: str) -> str:
-    return STUDENT_SYSTEM_PROMPT.format(topic=topic)
+    return _STUDENT_TEMPLATE.render(topic=topic)
 
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
 def get_initial_greeting_prompt(topic: str) -> str:
-    return INITIAL_GREETING_PROMPT.format(topic=topic)
+    return _INITIAL_GREETING_TEMPLATE.render(topic=topic)
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _student_system_message(topic: str) -> Dict[str, str]:
+    return {"role": "system", "content": get_student_prompt(topic)}
+
+def build_student_messages(
+    topic: str, history: Sequence[Dict[str, str]], teacher_turn: str
+) -> List[Dict[str, str]]:
+    """Message list in prefix-stable order: system prompt, history, current turn.
+
+    The system message dict is shared per topic and history messages are
+    passed through as-is, so only the outer list is allocated per turn.
+    """
+    return [_student_system_message(topic), *history, {"role": "user", "content": teacher_turn}]
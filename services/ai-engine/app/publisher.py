@@ -0,0 +1,71 @@
+"""Pipelined, retrying publication of engine output records."""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "5"))
+KAFKA_MAX_BATCH_SIZE = int(os.getenv("KAFKA_MAX_BATCH_SIZE", "16384"))
+KAFKA_COMPRESSION_TYPE = os.getenv("KAFKA_COMPRESSION_TYPE", "") or None  # gzip | snappy | lz4 | zstd
+PUBLISH_RETRIES = int(os.getenv("PUBLISH_RETRIES", "3"))
+PUBLISH_RETRY_BACKOFF = float(os.getenv("PUBLISH_RETRY_BACKOFF", "0.2"))
+
+# (topic, key, value), or (topic, key, value, partition) to override the key's partition
+Record = Tuple[Any, ...]
+Headers = List[Tuple[str, bytes]]
+
+
+def producer_config() -> Dict[str, Any]:
+    """Batching settings passed to AIOKafkaProducer."""
+    return {
+        "linger_ms": KAFKA_LINGER_MS,
+        "max_batch_size": KAFKA_MAX_BATCH_SIZE,
+        "compression_type": KAFKA_COMPRESSION_TYPE,
+    }
+
+
+async def _enqueue(producer: Any, record: Record, headers: Optional[Headers]) -> "asyncio.Future[Any]":
+    topic, key, value = record[:3]
+    extra: Dict[str, Any] = {} if len(record) == 3 else {"partition": record[3]}
+    if headers:
+        extra["headers"] = headers
+    try:
+        return await producer.send(topic, value=value, key=key, **extra)
+    except Exception as e:
+        failed = asyncio.get_running_loop().create_future()
+        failed.set_exception(e)
+        return failed
+
+
+async def publish_records(
+    producer: Any,
+    records: List[Record],
+    retries: int = PUBLISH_RETRIES,
+    backoff: float = PUBLISH_RETRY_BACKOFF,
+    headers: Optional[Headers] = None,
+) -> None:
+    """Produce all records concurrently and wait for every delivery.
+
+    All records are enqueued before any acknowledgement is awaited, so they
+    share the producer's batches instead of costing one broker round-trip
+    each. Records that fail are retried with exponential backoff; only the
+    calling event waits, other users' events keep flowing. ``headers`` are
+    attached to every record.
+    """
+    pending = list(records)
+    for attempt in range(retries + 1):
+        futures = [await _enqueue(producer, record, headers) for record in pending]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        failed = [(r, res) for r, res in zip(pending, results) if isinstance(res, BaseException)]
+        if not failed:
+            return
+        if attempt == retries:
+            error = failed[0][1]
+            print(
+                f"AI Engine Error (publish): {len(failed)} record(s) undelivered "
+                f"after {retries + 1} attempt(s): {error!r}",
+                flush=True,
+            )
+            raise error
+        await asyncio.sleep(backoff * (2 ** attempt))
+        pending = [record for record, _ in failed]
@@ -0,0 +1,197 @@
+"""Client-side RPM/TPM scheduling for the LLM provider's quota."""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Mapping, Optional, Tuple
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_RPM_LIMIT = float(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = float(os.getenv("LLM_TPM_LIMIT", "150000"))
+# Fraction of the provider's advertised limits actually used
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.95"))
+
+_EPSILON = 1e-9
+_MIN_WAIT = 0.001
+
+# Whose turn an outgoing request belongs to, for fair queueing
+rate_limit_key: contextvars.ContextVar[str] = contextvars.ContextVar("rate_limit_key", default="engine")
+
+
+def estimate_request_tokens(body: bytes) -> int:
+    """Tokens a chat request counts against TPM: prompt estimate plus max_tokens."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return (len(body) + 3) // 4
+    prompt = sum(
+        (len(m.get("content") or "") + 3) // 4 + 4
+        for m in payload.get("messages", [])
+        if isinstance(m, dict) and isinstance(m.get("content", ""), str)
+    )
+    return prompt + int(payload.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """Continuously refilling budget of ``per_minute`` units."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self.per_minute = per_minute
+        self.level = per_minute
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (a request larger than the
+        whole bucket only waits for a full bucket)."""
+        self._refill()
+        amount = min(amount, self.per_minute)
+        # Refill arithmetic leaves float dust (0.9999999999999998); a wait that
+        # small would not even move the clock, so treat it as available
+        if self.level >= amount - _EPSILON:
+            return 0.0
+        return max((amount - self.level) * 60 / self.per_minute, _MIN_WAIT)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.per_minute)
+
+    def set_limit(self, per_minute: float) -> None:
+        self._refill()
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+    def clamp(self, remaining: float) -> None:
+        """Never believe we have more left than the provider says."""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """Schedules LLM requests within requests- and tokens-per-minute budgets.
+
+    ``acquire`` waits until both buckets can pay for the request. Waiting
+    requests are queued per key and served round-robin, so one busy user
+    cannot starve the others. ``observe`` adapts the budgets from the
+    provider's ``x-ratelimit-*`` headers and stops all traffic for the
+    ``Retry-After`` period of a 429.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM_LIMIT,
+        tpm: float = LLM_TPM_LIMIT,
+        headroom: float = RATE_LIMIT_HEADROOM,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.headroom = headroom
+        self._clock = clock
+        self._sleep = sleep
+        self._blocked_until = 0.0
+        self._queues: "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.queued = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+
+    def _delay(self, tokens: int) -> float:
+        blocked = max(0.0, self._blocked_until - self._clock())
+        return max(blocked, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _grant(self, tokens: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.granted += 1
+
+    async def acquire(self, key: str, tokens: int) -> None:
+        """Wait for this request's turn and budget."""
+        if not self._queues and self._delay(tokens) == 0:
+            self._grant(tokens)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append((tokens, future))
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        started = self._clock()
+        await future
+        self.waited_seconds += self._clock() - started
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            tokens, future = queue[0]
+            if not future.done():
+                delay = self._delay(tokens)
+                if delay > 0:
+                    await self._sleep(delay)
+                    continue
+                self._grant(tokens)
+                future.set_result(None)
+            queue.popleft()
+            # Round-robin: this key goes behind every other waiting key
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+
+    def observe(self, status: int, headers: Mapping[str, str]) -> None:
+        """Adapt to one provider response."""
+        limit = _header_float(headers, "x-ratelimit-limit-requests")
+        if limit:
+            self.requests.set_limit(limit * self.headroom)
+        limit = _header_float(headers, "x-ratelimit-limit-tokens")
+        if limit:
+            self.tokens.set_limit(limit * self.headroom)
+        remaining = _header_float(headers, "x-ratelimit-remaining-requests")
+        if remaining is not None:
+            self.requests.clamp(remaining)
+        remaining = _header_float(headers, "x-ratelimit-remaining-tokens")
+        if remaining is not None:
+            self.tokens.clamp(remaining)
+        if status == 429:
+            self.throttled += 1
+            retry_ms = _header_float(headers, "retry-after-ms")
+            retry = retry_ms / 1000 if retry_ms is not None else _header_float(headers, "retry-after")
+            self._blocked_until = max(self._blocked_until, self._clock() + (retry if retry is not None else 1.0))
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rpm_limit": round(self.requests.per_minute, 1),
+            "tpm_limit": round(self.tokens.per_minute, 1),
+            "granted": self.granted,
+            "queued": self.queued,
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    return RateLimiter() if RATE_LIMIT_ENABLED else None
@@ -0,0 +1,314 @@
+"""Tolerant parsing of the student reply: ``{reasoning, confusion_score, question}``."""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+REASONING_MAX_CHARS = int(os.getenv("REASONING_MAX_CHARS", "600"))
+REPLY_CONTINUATION_ENABLED = os.getenv("REPLY_CONTINUATION_ENABLED", "true").lower() in ("1", "true", "yes")
+REPLY_CONTINUATION_MODEL = os.getenv("REPLY_CONTINUATION_MODEL", "gpt-4o-mini")
+REPLY_CONTINUATION_MAX_TOKENS = int(os.getenv("REPLY_CONTINUATION_MAX_TOKENS", "150"))
+
+# How a reply was read, from best to worst
+OK = "ok"                          # valid JSON, schema as asked
+COERCED = "coerced"                # valid JSON, but fields needed fixing (types, range, length)
+REPAIRED = "repaired"              # malformed or truncated JSON, question recovered
+INCOMPLETE = "incomplete"          # an object, but the question is missing or cut off
+UNRECOVERABLE = "unrecoverable"    # no object at all
+
+Reply = Dict[str, Any]
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_WORDS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+_MISSING = object()
+
+
+class UnrecoverableReply(ValueError):
+    """The model's reply has no usable question, even after repair."""
+
+
+class _LenientParser:
+    """Recursive-descent reader for JSON-ish text that may stop anywhere.
+
+    Accepts single quotes, bare keys, Python literals, trailing commas and raw
+    newlines in strings. At end of input every open string and container is
+    closed; a key without a value is dropped. ``truncated`` names the keys
+    whose string values were cut off.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.pos = 0
+        self.truncated: Set[str] = set()
+
+    def parse_object(self) -> Optional[Dict[str, Any]]:
+        start = self.text.find("{")
+        if start < 0:
+            return None
+        self.pos = start
+        return self._object()
+
+    def _skip(self, extra: str = "") -> None:
+        while self.pos < len(self.text) and (self.text[self.pos].isspace() or self.text[self.pos] in extra):
+            self.pos += 1
+
+    def _at_end(self) -> bool:
+        return self.pos >= len(self.text)
+
+    def _object(self) -> Dict[str, Any]:
+        self.pos += 1  # "{"
+        result: Dict[str, Any] = {}
+        while True:
+            self._skip(",")
+            if self._at_end():
+                return result
+            ch = self.text[self.pos]
+            if ch == "}":
+                self.pos += 1
+                return result
+            key, closed = self._string(ch) if ch in "\"'" else (self._bare_key(), True)
+            self._skip()
+            if not closed or self._at_end() or self.text[self.pos] != ":":
+                if self._at_end():
+                    return result  # truncated inside or right after a key
+                continue  # stray text; resync on the next separator
+            self.pos += 1
+            self._skip()
+            if self._at_end():
+                return result
+            value = self._value(key)
+            if value is not _MISSING:
+                result[key] = value
+
+    def _array(self) -> List[Any]:
+        self.pos += 1  # "["
+        items: List[Any] = []
+        while True:
+            self._skip(",")
+            if self._at_end():
+                return items
+            if self.text[self.pos] == "]":
+                self.pos += 1
+                return items
+            value = self._value(None)
+            if value is not _MISSING:
+                items.append(value)
+
+    def _value(self, key: Optional[str]) -> Any:
+        ch = self.text[self.pos]
+        if ch == "{":
+            return self._object()
+        if ch == "[":
+            return self._array()
+        if ch in "\"'":
+            value, closed = self._string(ch)
+            if not closed and key is not None:
+                self.truncated.add(key)
+            return value
+        match = _NUMBER_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            try:
+                return int(number) if number.lstrip("+-").isdigit() else float(number)
+            except ValueError:
+                return _MISSING
+        word = self._bare_word()
+        if word in _WORDS:
+            return _WORDS[word]
+        return word if word else self._skip_char()
+
+    def _skip_char(self) -> Any:
+        self.pos += 1
+        return _MISSING
+
+    def _string(self, quote: str) -> Tuple[str, bool]:
+        """Read a quoted string; False as second item if the input ended inside it."""
+        self.pos += 1
+        out: List[str] = []
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            self.pos += 1
+            if ch == quote:
+                return "".join(out), True
+            if ch != "\\":
+                out.append(ch)
+                continue
+            if self.pos >= len(text):
+                break
+            esc = text[self.pos]
+            self.pos += 1
+            if esc == "u":
+                digits = text[self.pos:self.pos + 4]
+                if len(digits) < 4:
+                    self.pos = len(text)
+                    break
+                self.pos += 4
+                if not _HEX_DIGITS.issuperset(digits):
+                    out.append("\\u" + digits)  # malformed escape kept as literal text
+                    continue
+                out.append(chr(self._codepoint(int(digits, 16))))
+            else:
+                out.append(_ESCAPES.get(esc, esc))
+        return "".join(out), False
+
+    def _codepoint(self, codepoint: int) -> int:
+        """Combine a high surrogate with the ``\\uDC00``-``\\uDFFF`` escape after it.
+
+        A lone surrogate cannot be encoded as UTF-8, so it becomes U+FFFD.
+        """
+        if 0xDC00 <= codepoint <= 0xDFFF:
+            return 0xFFFD
+        if not 0xD800 <= codepoint <= 0xDBFF:
+            return codepoint
+        low = self.text[self.pos + 2:self.pos + 6]
+        if (
+            self.text.startswith("\\u", self.pos)
+            and len(low) == 4
+            and _HEX_DIGITS.issuperset(low)
+            and 0xDC00 <= int(low, 16) <= 0xDFFF
+        ):
+            self.pos += 6
+            return 0x10000 + ((codepoint - 0xD800) << 10) + (int(low, 16) - 0xDC00)
+        return 0xFFFD
+
+    def _bare_key(self) -> str:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ":,}":
+            self.pos += 1
+        return self.text[start:self.pos].strip()
+
+    def _bare_word(self) -> str:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ",}]\n":
+            self.pos += 1
+        return self.text[start:self.pos].strip()
+
+
+def _coerce_score(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match is None:
+            return None
+        value = float(match.group())
+    if not isinstance(value, (int, float)) or value != value:  # NaN
+        return None
+    return max(0, min(100, int(round(value))))
+
+
+def _encodable(text: str) -> Tuple[str, bool]:
+    """``text`` with lone surrogates (from escapes json.loads accepts) replaced by U+FFFD."""
+    try:
+        text.encode("utf-8")
+        return text, False
+    except UnicodeEncodeError:
+        return text.encode("utf-16", "surrogatepass").decode("utf-16", "replace"), True
+
+
+def _normalize(data: Dict[str, Any], reasoning_max_chars: int) -> Tuple[Reply, bool]:
+    """The reply in schema shape, and whether anything had to change."""
+    changed = False
+    question = data.get("question")
+    if question is not None and not isinstance(question, str):
+        question, changed = None, True
+    elif isinstance(question, str):
+        question, fixed = _encodable(question)
+        changed = changed or fixed
+        if question != question.strip():
+            question, changed = question.strip(), True
+
+    raw_score = data.get("confusion_score")
+    score = _coerce_score(raw_score)
+    if score != raw_score or "confusion_score" not in data:
+        changed = True
+
+    reasoning = data.get("reasoning", "")
+    if not isinstance(reasoning, str):
+        reasoning, changed = "" if reasoning is None else str(reasoning), True
+    reasoning, fixed = _encodable(reasoning)
+    changed = changed or fixed
+    if len(reasoning) > reasoning_max_chars:
+        reasoning, changed = reasoning[: reasoning_max_chars - 1].rstrip() + "…", True
+
+    return {"reasoning": reasoning, "confusion_score": score, "question": question or None}, changed
+
+
+def parse_student_reply(content: Optional[str], reasoning_max_chars: int = REASONING_MAX_CHARS) -> Tuple[Optional[Reply], str]:
+    """Best-effort read of a student reply; returns ``(reply, status)``.
+
+    ``reply`` always has ``reasoning``, ``confusion_score`` (int in 0-100 or
+    None) and ``question`` (None when not recovered). Valid JSON takes the
+    fast path; anything else goes through the lenient parser. The status is
+    INCOMPLETE when the question is missing or was cut off mid-string, and
+    UNRECOVERABLE (reply None) when there is no object at all.
+    """
+    text = content or ""
+    if text.lstrip().startswith("```"):
+        text = _FENCE_RE.sub("", text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        reply, changed = _normalize(data, reasoning_max_chars)
+        if reply["question"] is None:
+            return reply, INCOMPLETE
+        return reply, COERCED if changed else OK
+
+    parser = _LenientParser(text)
+    data = parser.parse_object()
+    if data is None:
+        return None, UNRECOVERABLE
+    reply, _ = _normalize(data, reasoning_max_chars)
+    if "question" in parser.truncated:
+        reply["question"] = None
+    if reply["question"] is None:
+        return reply, INCOMPLETE
+    return reply, REPAIRED
+
+
+def merge_continuation(partial: Reply, continuation: Reply) -> Reply:
+    """Fields recovered from the cut-off reply, completed by the continuation."""
+    merged = dict(continuation)
+    for key, value in partial.items():
+        if merged.get(key) in (None, ""):
+            merged[key] = value
+    return merged
+
+
+class RepairStats:
+    """How replies were read, and how often a continuation rescued one."""
+
+    def __init__(self) -> None:
+        self.statuses: Dict[str, int] = {OK: 0, COERCED: 0, REPAIRED: 0, INCOMPLETE: 0, UNRECOVERABLE: 0}
+        self.continuations = 0
+        self.continued = 0
+
+    def record(self, status: str) -> None:
+        self.statuses[status] += 1
+
+    def record_continuation(self, succeeded: bool) -> None:
+        self.continuations += 1
+        if succeeded:
+            self.continued += 1
+
+    def recovery_rate(self) -> float:
+        """Share of replies that were not valid as sent but still produced a question."""
+        broken = sum(n for status, n in self.statuses.items() if status != OK)
+        recovered = self.statuses[COERCED] + self.statuses[REPAIRED] + self.continued
+        return recovered / broken if broken else 1.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.statuses,
+            "continuations": self.continuations,
+            "continued": self.continued,
+            "recovery_rate": round(self.recovery_rate(), 4),
+        }
@@ -0,0 +1,219 @@
+"""Deadlines, hedged requests and a circuit breaker around LLM calls."""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+
+LLM_TURN_DEADLINE = float(os.getenv("LLM_TURN_DEADLINE", "8"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Opens when the error rate over the last calls spikes.
+
+    While open every call is rejected for ``cooldown`` seconds; then a single
+    probe is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        cooldown: float = BREAKER_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and self._clock() - self._opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        if self.state != "closed":
+            self.rejected += 1
+            return False
+        return True
+
+    def record(self, success: bool) -> None:
+        if self.state == "half_open":
+            self._probing = False
+            if success:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_calls and self.current_error_rate() >= self.error_rate:
+            self._open()
+
+    def cancelled(self) -> None:
+        """A call ended without an outcome; let the next probe through."""
+        self._probing = False
+
+    def current_error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.opens += 1
+        print(f"LLM circuit breaker open for {self.cooldown}s", flush=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "error_rate": round(self.current_error_rate(), 4),
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class LLMGuard:
+    """Runs LLM calls under a deadline, with optional hedging, behind a breaker.
+
+    ``call`` raises CircuitOpenError while the breaker is open and
+    TimeoutError once ``deadline`` passes; callers answer with their
+    fallback response in both cases. With hedging, a second identical
+    request starts if the first has not finished after the recent
+    ``hedge_percentile`` latency; whichever succeeds first wins.
+    """
+
+    def __init__(
+        self,
+        deadline: float = LLM_TURN_DEADLINE,
+        hedge: bool = HEDGE_ENABLED,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_delay: float = HEDGE_MIN_DELAY,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self.calls = 0
+        self.deadline_exceeded = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> float:
+        observed = self.latencies.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, observed or 0.0)
+
+    def turn_deadline(self) -> float:
+        """Event-loop time by which every LLM call of a turn must be done."""
+        return asyncio.get_running_loop().time() + self.deadline
+
+    async def call(
+        self, factory: Callable[[], Awaitable[T]], hedge: bool = True, deadline: Optional[float] = None
+    ) -> T:
+        """Run ``factory()`` under the guard; ``hedge=False`` for non-idempotent calls.
+
+        ``deadline`` (from ``turn_deadline``) shares one budget between the
+        calls of a turn; without it the call gets the full ``self.deadline``.
+        """
+        timeout = self.deadline if deadline is None else deadline - asyncio.get_running_loop().time()
+        if timeout <= 0:
+            # The turn's budget is already spent; the LLM is not to blame
+            self.deadline_exceeded += 1
+            raise asyncio.TimeoutError()
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            if self.hedge and hedge:
+                result = await asyncio.wait_for(self._hedged(factory), timeout)
+            else:
+                result = await asyncio.wait_for(factory(), timeout)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            self.breaker.record(False)
+            raise
+        except asyncio.CancelledError:
+            self.breaker.cancelled()
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        self.latencies.record(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, factory: Callable[[], Awaitable[T]]) -> T:
+        primary = asyncio.ensure_future(factory())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(factory()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "deadline_exceeded": self.deadline_exceeded,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "breaker": self.breaker.snapshot(),
+        }
@@ -0,0 +1,171 @@
+"""Per-turn model tier selection with escalation from the fast to the strong model."""
+import json
+import os
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .resilience import LatencyTracker
+from .scorer import ConfusionScorer
+from .window import estimate_tokens
+
+
+# Model used for every student turn when routing is off, and the strong tier when on
+STUDENT_MODEL = os.getenv("STUDENT_MODEL", "gpt-4-turbo-preview")
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "false").lower() in ("1", "true", "yes")
+ROUTER_FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "gpt-4o-mini")
+ROUTER_LONG_MESSAGE_TOKENS = int(os.getenv("ROUTER_LONG_MESSAGE_TOKENS", "120"))
+ROUTER_CONFUSION_THRESHOLD = float(os.getenv("ROUTER_CONFUSION_THRESHOLD", "60"))
+ROUTER_CLASSIFIER_THRESHOLD = float(os.getenv("ROUTER_CLASSIFIER_THRESHOLD", "70"))
+ROUTER_HARD_TOPICS = {t.strip().lower() for t in os.getenv("ROUTER_HARD_TOPICS", "").split(",") if t.strip()}
+ROUTER_SCORE_WINDOW = int(os.getenv("ROUTER_SCORE_WINDOW", "3"))
+ROUTER_MAX_USERS = int(os.getenv("ROUTER_MAX_USERS", "10000"))
+ROUTER_MIN_QUESTION_CHARS = int(os.getenv("ROUTER_MIN_QUESTION_CHARS", "15"))
+# USD per 1K (prompt, completion) tokens, for the cost report
+ROUTER_FAST_PRICES = tuple(float(p) for p in os.getenv("ROUTER_FAST_PRICES", "0.00015,0.0006").split(","))
+ROUTER_STRONG_PRICES = tuple(float(p) for p in os.getenv("ROUTER_STRONG_PRICES", "0.01,0.03").split(","))
+
+
+class Tier:
+    """One model tier and what its turns have cost so far."""
+
+    def __init__(self, name: str, model: str, prices: Tuple[float, ...]) -> None:
+        self.name = name
+        self.model = model
+        self.prompt_price, self.completion_price = prices
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def record(self, seconds: float, usage: Any) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.latency.record(seconds)
+        if usage is not None:
+            prompt = getattr(usage, "prompt_tokens", 0) or 0
+            completion = getattr(usage, "completion_tokens", 0) or 0
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cost += (prompt * self.prompt_price + completion * self.completion_price) / 1000
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "avg_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost, 4),
+        }
+
+
+class ModelRouter:
+    """Picks the fast or strong tier for each student turn.
+
+    A turn goes to the strong model when the teacher's message is long, the
+    topic is listed as hard, the user's recent confusion scores run high or
+    the optional local classifier expects a confusing turn; everything else
+    tries the fast model first. ``review`` rejects fast replies that do not
+    parse or look unreliable, and the caller escalates those to the strong
+    model.
+    """
+
+    def __init__(
+        self,
+        fast_model: str = ROUTER_FAST_MODEL,
+        strong_model: str = STUDENT_MODEL,
+        classifier: Optional[ConfusionScorer] = None,
+        long_message_tokens: int = ROUTER_LONG_MESSAGE_TOKENS,
+        confusion_threshold: float = ROUTER_CONFUSION_THRESHOLD,
+        classifier_threshold: float = ROUTER_CLASSIFIER_THRESHOLD,
+        hard_topics: Optional[set] = None,
+        score_window: int = ROUTER_SCORE_WINDOW,
+        max_users: int = ROUTER_MAX_USERS,
+        min_question_chars: int = ROUTER_MIN_QUESTION_CHARS,
+    ) -> None:
+        self.fast = Tier("fast", fast_model, ROUTER_FAST_PRICES)
+        self.strong = Tier("strong", strong_model, ROUTER_STRONG_PRICES)
+        self.classifier = classifier
+        self.long_message_tokens = long_message_tokens
+        self.confusion_threshold = confusion_threshold
+        self.classifier_threshold = classifier_threshold
+        self.hard_topics = ROUTER_HARD_TOPICS if hard_topics is None else {t.lower() for t in hard_topics}
+        self.score_window = score_window
+        self.max_users = max_users
+        self.min_question_chars = min_question_chars
+        self._scores: "OrderedDict[str, Deque[int]]" = OrderedDict()
+        self.reasons: Dict[str, int] = {}
+        self.escalations: Dict[str, int] = {}
+
+    def route(self, user_id: str, message: str, topic: str) -> Tier:
+        if estimate_tokens(message) > self.long_message_tokens:
+            reason = "long_message"
+        elif topic.lower() in self.hard_topics:
+            reason = "hard_topic"
+        elif self._recent_confusion(user_id) >= self.confusion_threshold:
+            reason = "confused_user"
+        elif self.classifier is not None and self.classifier.score(message) >= self.classifier_threshold:
+            reason = "classifier"
+        else:
+            reason = "fast"
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return self.fast if reason == "fast" else self.strong
+
+    def review(self, content: Optional[str]) -> Optional[str]:
+        """Why a fast-tier reply should be escalated, or None to keep it."""
+        try:
+            result = json.loads(content or "")
+        except ValueError:
+            return "unparseable"
+        if not isinstance(result, dict):
+            return "unparseable"
+        question = result.get("question")
+        if not isinstance(question, str) or len(question.strip()) < self.min_question_chars:
+            return "weak_question"
+        score = result.get("confusion_score")
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+            return "bad_score"
+        return None
+
+    def escalated(self, reason: str) -> None:
+        self.escalations[reason] = self.escalations.get(reason, 0) + 1
+
+    def observe(self, user_id: str, score: int) -> None:
+        """Remember a turn's confusion score for routing the user's next turns."""
+        scores = self._scores.get(user_id)
+        if scores is None:
+            scores = self._scores[user_id] = deque(maxlen=self.score_window)
+            if len(self._scores) > self.max_users:
+                self._scores.popitem(last=False)
+        else:
+            self._scores.move_to_end(user_id)
+        scores.append(score)
+
+    def _recent_confusion(self, user_id: str) -> float:
+        scores = self._scores.get(user_id)
+        return sum(scores) / len(scores) if scores else 0.0
+
+    def escalation_rate(self) -> float:
+        """Share of fast-tier attempts that had to be redone on the strong model."""
+        fast_turns = self.reasons.get("fast", 0)
+        return sum(self.escalations.values()) / fast_turns if fast_turns else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "routes": dict(self.reasons),
+            "escalations": dict(self.escalations),
+            "escalation_rate": round(self.escalation_rate(), 3),
+            "fast": self.fast.snapshot(),
+            "strong": self.strong.snapshot(),
+        }
+
+
+def create_router(classifier: Optional[ConfusionScorer] = None, enabled: bool = ROUTER_ENABLED) -> Optional[ModelRouter]:
+    """The engine's model router, or None to send every turn to STUDENT_MODEL."""
+    if not enabled:
+        return None
+    return ModelRouter(classifier=classifier)
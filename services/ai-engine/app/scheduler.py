@@ -0,0 +1,117 @@
+"""Bounded task scheduler that applies backpressure to the Kafka consumer."""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Set, TypeVar
+
+
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "64"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+# Admitted events, including those waiting behind an earlier turn of the same user
+MAX_QUEUED_EVENTS = int(os.getenv("MAX_QUEUED_EVENTS", "1024"))
+
+T = TypeVar("T")
+
+
+class BoundedScheduler:
+    """Admits at most ``max_queued`` event tasks and runs ``max_in_flight`` of them.
+
+    When the admission limit is reached the consumer's assigned partitions
+    are paused and ``submit`` waits for a slot; they are resumed as soon as
+    one frees up. Work wrapped in ``run`` additionally needs one of the
+    ``max_in_flight`` running slots, so a task can be admitted (e.g. queued
+    behind its user's previous turn) without holding one. Every task is
+    referenced until it finishes so none can be garbage collected
+    mid-flight, and ``drain`` waits for them on shutdown.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        consumer: Optional[Any] = None,
+        max_queued: Optional[int] = None,
+    ) -> None:
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.max_queued = max(max_queued or max_in_flight, max_in_flight)
+        self._running = asyncio.Semaphore(max_in_flight)
+        self.running = 0
+        self._consumer = consumer
+        self._tasks: Set[asyncio.Task] = set()
+        self._slot_freed = asyncio.Event()
+        self._paused = False
+        self.completed = 0
+        self.failed = 0
+        self.pauses = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    async def submit(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        """Schedule ``coro``, waiting for a free slot if the admission limit is reached."""
+        while len(self._tasks) >= self.max_queued:
+            self._pause()
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    async def run(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """Await ``fn(*args, **kwargs)`` while holding one running slot."""
+        async with self._running:
+            self.running += 1
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.running -= 1
+
+    async def drain(self, timeout: Optional[float] = SHUTDOWN_DRAIN_TIMEOUT) -> None:
+        """Wait for in-flight tasks, cancelling any still running after ``timeout``."""
+        if not self._tasks:
+            return
+        print(f"Draining {len(self._tasks)} in-flight event(s)", flush=True)
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Cancelled {len(pending)} event(s) still running after {timeout}s", flush=True)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            self.failed += 1
+        elif task.exception() is not None:
+            self.failed += 1
+            print(f"AI Engine Error (event task): {task.exception()!r}", flush=True)
+        else:
+            self.completed += 1
+        if len(self._tasks) < self.max_queued:
+            self._resume()
+            self._slot_freed.set()
+
+    def _pause(self) -> None:
+        if self._paused:
+            return
+        self._paused = True
+        self.pauses += 1
+        if self._consumer is not None:
+            partitions = self._consumer.assignment()
+            if partitions:
+                self._consumer.pause(*partitions)
+
+    def _resume(self) -> None:
+        if not self._paused:
+            return
+        self._paused = False
+        if self._consumer is not None:
+            partitions = self._consumer.paused()
+            if partitions:
+                self._consumer.resume(*partitions)
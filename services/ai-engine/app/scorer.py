@@ -0,0 +1,196 @@
+"""CPU-only confusion scorer: hashed n-gram features and a linear model in NumPy."""
+import json
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+
+
+LOCAL_SCORER_PATH = os.getenv("LOCAL_SCORER_PATH", "models/confusion_scorer.npz")
+LOCAL_SCORER_MODE = os.getenv("LOCAL_SCORER_MODE", "fallback")  # off | fallback | provisional
+SCORE_LOG_PATH = os.getenv("SCORE_LOG_PATH", "")
+SCORER_FEATURES = int(os.getenv("SCORER_FEATURES", str(2 ** 16)))
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+|[?!]")
+
+
+def _hash(token: str, n_features: int) -> int:
+    # crc32 rather than hash(): stable across processes, so saved models stay valid
+    return zlib.crc32(token.encode("utf-8")) % n_features
+
+
+def hashed_features(text: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sparse (indices, counts) of unigrams, bigrams and a length bucket."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    grams.append(f"__len{min(len(tokens).bit_length(), 12)}")
+    indices, counts = np.unique(
+        np.fromiter((_hash(g, n_features) for g in grams), dtype=np.int64, count=len(grams)),
+        return_counts=True,
+    )
+    return indices, counts.astype(np.float32)
+
+
+class SparseRows:
+    """Rows of hashed features in CSR layout, ready for vectorized math."""
+
+    def __init__(self, texts: Sequence[str], n_features: int) -> None:
+        rows = [hashed_features(t, n_features) for t in texts]
+        self.n_rows = len(rows)
+        self.n_features = n_features
+        self.indptr = np.zeros(self.n_rows + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(i) for i, _ in rows])
+        self.indices = np.concatenate([i for i, _ in rows]) if rows else np.zeros(0, np.int64)
+        self.counts = np.concatenate([c for _, c in rows]) if rows else np.zeros(0, np.float32)
+        self.row_of = np.repeat(np.arange(self.n_rows), np.diff(self.indptr))
+
+    def document_frequency(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=self.n_features).astype(np.float32)
+
+    def weighted(self, idf: np.ndarray) -> np.ndarray:
+        """Sublinear tf-idf values, L2-normalized per row."""
+        values = np.log1p(self.counts) * idf[self.indices]
+        norms = np.sqrt(np.bincount(self.row_of, weights=values * values, minlength=self.n_rows))
+        return (values / np.maximum(norms, 1e-12)[self.row_of]).astype(np.float32)
+
+
+class ConfusionScorer:
+    """Predicts the 0-100 confusion score the LLM would give a teacher message."""
+
+    def __init__(self, weights: np.ndarray, bias: float, idf: np.ndarray) -> None:
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.idf = idf.astype(np.float32)
+        self.n_features = len(weights)
+
+    def predict(self, texts: Sequence[str]) -> np.ndarray:
+        rows = SparseRows(texts, self.n_features)
+        values = rows.weighted(self.idf) * self.weights[rows.indices]
+        raw = np.bincount(rows.row_of, weights=values, minlength=rows.n_rows) + self.bias
+        return np.clip(raw * 100, 0, 100)
+
+    def score(self, text: str) -> int:
+        return int(round(float(self.predict([text])[0])))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias), idf=self.idf)
+
+    @classmethod
+    def load(cls, path: str) -> "ConfusionScorer":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]), data["idf"])
+
+
+def train(
+    texts: Sequence[str],
+    scores: Sequence[float],
+    n_features: int = SCORER_FEATURES,
+    epochs: int = 300,
+    learning_rate: float = 0.05,
+    l2: float = 1e-4,
+) -> ConfusionScorer:
+    """Fit a ridge-regularized linear model on (message, LLM score) pairs.
+
+    Full-batch Adam on the squared error of score/100; every step is a few
+    vectorized passes over the sparse rows.
+    """
+    rows = SparseRows(texts, n_features)
+    idf = np.log((1 + rows.n_rows) / (1 + rows.document_frequency())) + 1
+    values = rows.weighted(idf)
+    target = np.asarray(scores, dtype=np.float64) / 100
+    weights = np.zeros(n_features)
+    bias = float(target.mean()) if len(target) else 0.0
+    m, v = np.zeros(n_features), np.zeros(n_features)
+    beta1, beta2 = 0.9, 0.999
+    for step in range(1, epochs + 1):
+        pred = np.bincount(rows.row_of, weights=values * weights[rows.indices], minlength=rows.n_rows) + bias
+        error = (pred - target) / max(rows.n_rows, 1)
+        grad = np.bincount(rows.indices, weights=values * error[rows.row_of], minlength=n_features) + l2 * weights
+        bias -= learning_rate * float(error.sum())
+        m = beta1 * m + (1 - beta1) * grad
+        v = beta2 * v + (1 - beta2) * grad * grad
+        weights -= learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + 1e-8)
+    return ConfusionScorer(weights, bias, idf)
+
+
+def evaluate(scorer: ConfusionScorer, texts: Sequence[str], scores: Sequence[float]) -> Dict[str, float]:
+    """Agreement between local predictions and the LLM's scores."""
+    predicted = scorer.predict(texts)
+    actual = np.asarray(scores, dtype=np.float64)
+    error = predicted - actual
+    bands = np.array([0, 11, 26, 45, 66, 86])  # the bands in the student prompt
+    return {
+        "n": int(len(actual)),
+        "mae": round(float(np.abs(error).mean()), 2),
+        "rmse": round(float(np.sqrt((error ** 2).mean())), 2),
+        "within_10": round(float((np.abs(error) <= 10).mean()), 4),
+        "band_agreement": round(float(
+            (np.searchsorted(bands, predicted, "right") == np.searchsorted(bands, actual, "right")).mean()
+        ), 4),
+        "pearson": round(float(np.corrcoef(predicted, actual)[0, 1]), 4) if len(actual) > 1 and actual.std() else 0.0,
+    }
+
+
+def read_pairs(path: str) -> List[Dict[str, Any]]:
+    """Logged turns from a ScoreLog file, skipping malformed lines."""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record.get("message"), str) and isinstance(record.get("score"), (int, float)):
+                pairs.append(record)
+    return pairs
+
+
+class ScoreLog:
+    """Appends (message, LLM score) pairs as JSON lines for training."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self.records = 0
+
+    def record(self, topic: str, message: str, score: int, llm_seconds: float) -> None:
+        self._file.write(json.dumps({
+            "topic": topic,
+            "message": message,
+            "score": score,
+            "llm_seconds": round(llm_seconds, 4),
+        }) + "\n")
+        self.records += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def load_scorer(path: str = LOCAL_SCORER_PATH, mode: str = LOCAL_SCORER_MODE) -> Optional[ConfusionScorer]:
+    """The trained scorer at ``path``, or None when disabled or not trained yet."""
+    if mode == "off" or not os.path.exists(path):
+        return None
+    try:
+        scorer = ConfusionScorer.load(path)
+    except Exception as e:
+        print(f"AI Engine Error (local scorer {path}): {e}", flush=True)
+        return None
+    print(f"Local confusion scorer loaded from {path} (mode: {mode})", flush=True)
+    return scorer
+
+
+def split(records: Sequence[Any], holdout: float) -> Tuple[Sequence[Any], Sequence[Any]]:
+    """Deterministic train/holdout split by message hash."""
+    train_set, test_set = [], []
+    for record in records:
+        bucket = zlib.crc32(record["message"].encode("utf-8")) % 1000
+        (test_set if bucket < holdout * 1000 else train_set).append(record)
+    return train_set, test_set
+
+
+def texts_and_scores(records: Iterable[Dict[str, Any]]) -> Tuple[List[str], List[float]]:
+    records = list(records)
+    return [r["message"] for r in records], [float(r["score"]) for r in records]
@@ -0,0 +1,101 @@
+"""Startup warm-up and the readiness/liveness state behind the probes."""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .llm import LLMClient
+from .prompts import build_student_messages, get_initial_greeting_prompt
+
+
+PROBES_ENABLED = os.getenv("PROBES_ENABLED", "false").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+LIVENESS_STALL_TIMEOUT = float(os.getenv("LIVENESS_STALL_TIMEOUT", "120"))
+
+
+class Health:
+    """Readiness and liveness as the orchestrator's probes see them.
+
+    Ready from ``mark_ready`` (warm-up done, consumer started) until
+    ``mark_stopping``. Live unless events are outstanding and none has
+    finished for ``stall_timeout`` seconds; ``progress`` returns
+    ``(events finished, events outstanding)`` and is only read per probe.
+    """
+
+    def __init__(
+        self,
+        progress: Callable[[], Tuple[int, int]],
+        stall_timeout: float = LIVENESS_STALL_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._progress = progress
+        self.stall_timeout = stall_timeout
+        self._clock = clock
+        self.started = clock()
+        self.ready = False
+        self.startup_seconds: Optional[float] = None
+        self.first_event_seconds: Optional[float] = None
+        self._last_completed = -1
+        self._last_progress = self.started
+
+    def mark_ready(self) -> float:
+        """Flip to ready; returns seconds since this Health was created."""
+        self.ready = True
+        self.startup_seconds = self._clock() - self.started
+        return self.startup_seconds
+
+    def mark_stopping(self) -> None:
+        self.ready = False
+
+    def live(self) -> bool:
+        now = self._clock()
+        completed, outstanding = self._progress()
+        if completed != self._last_completed or outstanding == 0:
+            self._last_completed = completed
+            self._last_progress = now
+        return now - self._last_progress < self.stall_timeout
+
+    def record_event(self, seconds: float) -> None:
+        """Log the first answered event's latency, the one warm-up is meant to cut."""
+        if self.first_event_seconds is None:
+            self.first_event_seconds = seconds
+            print(f"AI Engine first event answered in {seconds * 1000:.1f}ms", flush=True)
+
+
+async def warm_up(
+    producer: Any,
+    client: Optional[LLMClient],
+    topics: Sequence[str],
+    hot_topics: Sequence[str],
+    connections: int = WARMUP_CONNECTIONS,
+    timeout: float = WARMUP_TIMEOUT,
+) -> Dict[str, float]:
+    """Pay first-use costs before the engine takes traffic; returns seconds per step.
+
+    Renders the hot topics' prompts, fetches metadata for the output
+    ``topics`` and opens LLM connections. A step that fails or overruns
+    ``timeout`` is logged and skipped: a cold engine beats one that never
+    becomes ready.
+    """
+    timings: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    for topic in hot_topics:
+        get_initial_greeting_prompt(topic)
+        build_student_messages(topic, [], "")
+    timings["prompts"] = time.perf_counter() - started
+
+    async def step(name: str, work: Any) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(work, timeout)
+        except Exception as e:
+            print(f"AI Engine warm-up ({name}) skipped: {e!r}", flush=True)
+        timings[name] = time.perf_counter() - started
+
+    steps = [step("producer_metadata", asyncio.gather(*(producer.partitions_for(t) for t in topics)))]
+    if client is not None and connections > 0:
+        steps.append(step("llm_connections", client.warm(connections)))
+    await asyncio.gather(*steps)
+    return {name: round(seconds, 3) for name, seconds in timings.items()}
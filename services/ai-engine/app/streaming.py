@@ -0,0 +1,154 @@
+"""Incremental extraction of the student's question from a streamed JSON reply."""
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "false").lower() in ("1", "true", "yes")
+CHAT_OUTPUT_PARTIAL_TOPIC = os.getenv("CHAT_OUTPUT_PARTIAL_TOPIC", "chat.output.partial")
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "24"))
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+
+class StreamingFieldExtractor:
+    """Pulls one top-level string field out of JSON text fed in arbitrary chunks.
+
+    ``feed`` returns the newly decoded characters of the field's value (escape
+    sequences resolved) as soon as they arrive, so the value can be shown
+    before the rest of the object has been generated. Keys of nested objects
+    are ignored.
+    """
+
+    def __init__(self, field: str = "question") -> None:
+        self.field = field
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._expect_key = False
+        self._reading_key = False
+        self._key: List[str] = []
+        self._last_key: Optional[str] = None
+        self._awaiting_value = False
+        self._capturing = False
+
+    def feed(self, chunk: str) -> str:
+        out: List[str] = []
+        for ch in chunk:
+            if self._in_string:
+                self._string_char(ch, out)
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._reading_key = True
+                    self._key = []
+                    self._expect_key = False
+                elif self._depth == 1 and self._awaiting_value and self._last_key == self.field:
+                    self._capturing = not self.complete
+                self._awaiting_value = False
+            elif ch == "{" or ch == "[":
+                self._depth += 1
+                self._expect_key = self._depth == 1 and ch == "{"
+                self._awaiting_value = False
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._expect_key = True
+            elif ch == ":" and self._depth == 1:
+                self._awaiting_value = True
+            elif not ch.isspace():
+                self._awaiting_value = False
+        return "".join(out)
+
+    def _string_char(self, ch: str, out: List[str]) -> None:
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                if _HEX_DIGITS.issuperset(self._unicode):
+                    self._emit_codepoint(int(self._unicode, 16), out)
+                else:
+                    # A malformed escape is kept as literal text rather than failing the stream
+                    self._high_surrogate = None
+                    self._emit("\\u" + self._unicode, out)
+                self._unicode = None
+            return
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(ch, ch), out)
+            return
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._reading_key:
+                self._reading_key = False
+                self._last_key = "".join(self._key)
+            if self._capturing:
+                self._capturing = False
+                self.complete = True
+        else:
+            self._emit(ch, out)
+
+    def _emit_codepoint(self, codepoint: int, out: List[str]) -> None:
+        if 0xD800 <= codepoint <= 0xDBFF:
+            self._high_surrogate = codepoint
+            return
+        if 0xDC00 <= codepoint <= 0xDFFF:
+            if self._high_surrogate is None:
+                codepoint = 0xFFFD  # a lone low surrogate cannot be encoded
+            else:
+                codepoint = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (codepoint - 0xDC00)
+        self._high_surrogate = None
+        self._emit(chr(codepoint), out)
+
+    def _emit(self, text: str, out: List[str]) -> None:
+        if self._capturing:
+            out.append(text)
+        elif self._reading_key:
+            self._key.append(text)
+
+
+async def collect_stream(
+    stream: Any,
+    on_partial: Callable[[str], Awaitable[None]],
+    field: str = "question",
+    flush_chars: int = STREAM_FLUSH_CHARS,
+) -> Tuple[str, Any]:
+    """Consume a streamed chat completion and return its full text and usage.
+
+    New characters of ``field`` are passed to ``on_partial`` in pieces of at
+    least ``flush_chars`` (the last piece may be shorter) while the rest of
+    the reply is still being generated. Usage is only present when the
+    request set ``stream_options={"include_usage": True}``.
+    """
+    extractor = StreamingFieldExtractor(field)
+    parts: List[str] = []
+    pending: List[str] = []
+    pending_len = 0
+    usage = None
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        text = extractor.feed(delta)
+        if text:
+            pending.append(text)
+            pending_len += len(text)
+        if pending and (pending_len >= flush_chars or extractor.complete):
+            await on_partial("".join(pending))
+            pending = []
+            pending_len = 0
+    if pending:
+        await on_partial("".join(pending))
+    return "".join(parts), usage
@@ -0,0 +1,172 @@
+"""Multi-process entry point: N engine workers in one consumer group.
+
+Each worker is a separate ``python -m app.consumer`` process with its own
+consumer, producer and event loop. Workers share the consumer group, so
+Kafka hands each one a disjoint set of ``chat.input`` partitions; the
+gateway keys events by ``userId``, so a user's turns (and in-memory
+history) stay on one worker until a rebalance. Workers that exit are
+restarted with exponential backoff.
+
+    WORKERS=4 python -m app.supervisor
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+WORKERS = int(os.getenv("WORKERS", "0"))  # 0: one per CPU
+EVENT_LOOP = os.getenv("EVENT_LOOP", "asyncio").lower()  # asyncio | uvloop
+WORKER_RESTART_BACKOFF = float(os.getenv("WORKER_RESTART_BACKOFF", "1.0"))
+WORKER_RESTART_MAX_BACKOFF = float(os.getenv("WORKER_RESTART_MAX_BACKOFF", "30.0"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30.0"))
+# A worker that stayed up this long is healthy again; its backoff resets
+WORKER_STABLE_AFTER = 60.0
+
+WORKER_COMMAND = [sys.executable, "-m", "app.consumer"]
+
+
+def worker_count(configured: int = WORKERS) -> int:
+    if configured > 0:
+        return configured
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+def install_event_loop(name: str = EVENT_LOOP) -> str:
+    """Use uvloop for new event loops if asked for and installed; returns the loop in use."""
+    if name != "uvloop":
+        return "asyncio"
+    try:
+        import uvloop
+    except ImportError:
+        print("EVENT_LOOP=uvloop but uvloop is not installed; using asyncio", flush=True)
+        return "asyncio"
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
+
+
+class _Worker:
+    __slots__ = ("index", "process", "started", "restarts", "backoff", "restart_at")
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.process: Optional[subprocess.Popen] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    """Starts ``workers`` copies of ``command`` and keeps them running.
+
+    Worker ``i`` gets ``WORKER_ID=i`` and, so their metrics endpoints do not
+    collide, ``METRICS_PORT`` offset by ``i``.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        command: Sequence[str] = WORKER_COMMAND,
+        env: Optional[Dict[str, str]] = None,
+        restart_backoff: float = WORKER_RESTART_BACKOFF,
+        max_backoff: float = WORKER_RESTART_MAX_BACKOFF,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.command = list(command)
+        self.env = dict(os.environ if env is None else env)
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.workers: List[_Worker] = [_Worker(i) for i in range(workers)]
+        self.stopping = False
+
+    def _worker_env(self, index: int) -> Dict[str, str]:
+        env = dict(self.env)
+        env["WORKER_ID"] = str(index)
+        env["METRICS_PORT"] = str(int(env.get("METRICS_PORT", "9100")) + index)
+        return env
+
+    def _spawn(self, worker: _Worker) -> None:
+        worker.process = subprocess.Popen(self.command, env=self._worker_env(worker.index))
+        worker.started = self.clock()
+        worker.restart_at = None
+        print(f"Supervisor: worker {worker.index} started (pid {worker.process.pid})", flush=True)
+
+    def start(self) -> None:
+        for worker in self.workers:
+            self._spawn(worker)
+
+    def poll(self) -> None:
+        """Notice exited workers and restart those whose backoff has elapsed."""
+        now = self.clock()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at and not self.stopping:
+                    worker.restarts += 1
+                    self._spawn(worker)
+                continue
+            code = worker.process.poll() if worker.process is not None else None
+            if code is None or self.stopping:
+                continue
+            if now - worker.started >= WORKER_STABLE_AFTER:
+                worker.backoff = 0.0
+            worker.backoff = min(self.max_backoff, worker.backoff * 2 or self.restart_backoff)
+            worker.restart_at = now + worker.backoff
+            print(
+                f"Supervisor: worker {worker.index} exited with code {code}; "
+                f"restarting in {worker.backoff:.1f}s",
+                flush=True,
+            )
+
+    def stop(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """SIGTERM every worker so it drains, then kill those still running after ``timeout``."""
+        self.stopping = True
+        running = [w.process for w in self.workers if w.process is not None and w.process.poll() is None]
+        for process in running:
+            process.terminate()
+        deadline = self.clock() + timeout
+        for process in running:
+            try:
+                process.wait(max(0.0, deadline - self.clock()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.workers),
+            "running": sum(1 for w in self.workers if w.process is not None and w.process.poll() is None),
+            "restarts": sum(w.restarts for w in self.workers),
+        }
+
+    def run(self, interval: float = 0.5) -> None:
+        """Supervise until SIGTERM/SIGINT, then stop the workers."""
+        def request_stop(signum: int, frame: Any) -> None:
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        self.start()
+        while not self.stopping:
+            self.poll()
+            time.sleep(interval)
+        print("Supervisor shutting down", flush=True)
+        self.stop()
+        print(f"Supervisor stats: {self.snapshot()}", flush=True)
+
+
+def main() -> None:
+    workers = worker_count()
+    print(f"Supervisor: starting {workers} worker(s), event loop {EVENT_LOOP}", flush=True)
+    Supervisor(workers).run()
+
+
+if __name__ == "__main__":
+    main()
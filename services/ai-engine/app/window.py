@@ -0,0 +1,205 @@
+"""Token-budgeted history windows and rolling summaries of older turns."""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "400"))
+TURN_MAX_TOKENS = int(os.getenv("TURN_MAX_TOKENS", "1500"))
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "off")  # off | local | llm
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+SUMMARY_MAX_USERS = int(os.getenv("SUMMARY_MAX_USERS", "10000"))
+
+# Chat formats add a few tokens of framing per message
+_MESSAGE_OVERHEAD_TOKENS = 4
+_TRUNCATION_MARK = " [...]"
+
+Message = Dict[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Message) -> int:
+    return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to roughly ``max_tokens``, marking the cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(0, max_tokens * 4 - len(_TRUNCATION_MARK))] + _TRUNCATION_MARK
+
+
+def build_window(
+    history: Sequence[Message],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    step: int = 1,
+    message_max_tokens: int = HISTORY_MESSAGE_MAX_TOKENS,
+) -> Tuple[List[Message], List[Message]]:
+    """Split history into (window, dropped) with the window within ``budget`` tokens.
+
+    The window is the newest run of messages that fits; its start is then
+    rounded up to a multiple of ``step`` so it only moves in jumps, which
+    keeps the prompt prefix stable between jumps. Single messages over
+    ``message_max_tokens`` are shortened in the window (not in storage).
+    """
+    window = [
+        m if message_tokens(m) <= message_max_tokens + _MESSAGE_OVERHEAD_TOKENS
+        else {"role": m["role"], "content": truncate_to_tokens(m["content"], message_max_tokens)}
+        for m in history
+    ]
+    used = 0
+    start = len(window)
+    while start > 0:
+        cost = message_tokens(window[start - 1])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    if start and step > 1:
+        start = min(len(window), -(-start // step) * step)
+    return window[start:], list(history[:start])
+
+
+def _question_of(message: Message) -> str:
+    """The student's question from a stored assistant reply, or the raw text."""
+    try:
+        return str(json.loads(message["content"]).get("question", ""))
+    except (ValueError, AttributeError):
+        return message["content"]
+
+
+def local_summary(previous: str, messages: Sequence[Message], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Extractive summary: the first sentence of each older turn, newest kept."""
+    lines = [line for line in previous.split("\n") if line]
+    for message in messages:
+        if message["role"] == "assistant":
+            text = _question_of(message)
+            speaker = "Student asked"
+        else:
+            text = message["content"].removeprefix("The teacher says: '").rstrip("'")
+            speaker = "Teacher said"
+        sentence = text.split(". ")[0].strip()
+        if sentence:
+            lines.append(f"- {speaker}: {truncate_to_tokens(sentence, 40)}")
+    while lines and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+Summarizer = Callable[[str, Sequence[Message]], Awaitable[str]]
+
+
+class RollingSummaries:
+    """Per-user compact memory of turns that have left the prompt window.
+
+    ``schedule`` starts a background task that folds newly dropped messages
+    into the user's summary; the request that dropped them does not wait.
+    The next turn picks the summary up through ``memory_message``.
+    """
+
+    def __init__(self, summarize: Summarizer, max_users: int = SUMMARY_MAX_USERS) -> None:
+        self._summarize = summarize
+        self.max_users = max_users
+        # user_id -> (summary, last message folded into it)
+        self._summaries: "OrderedDict[str, Tuple[str, Optional[Message]]]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.runs = 0
+        self.failures = 0
+
+    def memory_message(self, user_id: str) -> Optional[Message]:
+        item = self._summaries.get(user_id)
+        if item is None or not item[0]:
+            return None
+        self._summaries.move_to_end(user_id)
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{item[0]}"}
+
+    def schedule(self, user_id: str, dropped: Sequence[Message]) -> None:
+        if not dropped or user_id in self._tasks:
+            return
+        previous, last = self._summaries.get(user_id, ("", None))
+        new = list(dropped)
+        if last is not None:
+            # Skip what is already folded in; dropped history only grows at the back
+            for index in range(len(new) - 1, -1, -1):
+                if new[index] == last:
+                    new = new[index + 1:]
+                    break
+        if not new:
+            return
+        self._tasks[user_id] = asyncio.create_task(self._run(user_id, previous, new))
+
+    def forget(self, user_id: str) -> None:
+        self._summaries.pop(user_id, None)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"users": len(self._summaries), "runs": self.runs, "failures": self.failures}
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, user_id: str, previous: str, messages: List[Message]) -> None:
+        try:
+            summary = await self._summarize(previous, messages)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            print(f"AI Engine Error (summary for {user_id}): {e}", flush=True)
+            return
+        finally:
+            self._tasks.pop(user_id, None)
+        self.runs += 1
+        self._summaries[user_id] = (summary, messages[-1])
+        self._summaries.move_to_end(user_id)
+        while len(self._summaries) > self.max_users:
+            self._summaries.popitem(last=False)
+
+
+async def summarize_locally(previous: str, messages: Sequence[Message]) -> str:
+    return local_summary(previous, messages)
+
+
+def llm_summarizer(client: object, model: str = SUMMARY_MODEL) -> Summarizer:
+    """Summarizer that asks a small model to fold turns into the summary."""
+
+    async def summarize(previous: str, messages: Sequence[Message]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Update the running summary of a tutoring session between a teacher and "
+                        "a student. Keep the concepts explained, examples used and open "
+                        f"questions. Answer with the summary only, under {SUMMARY_MAX_TOKENS} tokens."
+                    ),
+                },
+                {"role": "user", "content": f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0,
+        )
+        return response.choices[0].message.content.strip()
+
+    return summarize
+
+
+def create_summaries(client: Optional[object], mode: str = SUMMARY_MODE) -> Optional[RollingSummaries]:
+    """Rolling summaries for ``mode`` ("off", "local" or "llm"), or None when off."""
+    if mode == "llm" and client is not None:
+        return RollingSummaries(llm_summarizer(client))
+    if mode in ("local", "llm"):
+        return RollingSummaries(summarize_locally)
+    return None
@@ -0,0 +1 @@
+# Empty file to make benchmarks directory a Python package
@@ -0,0 +1,139 @@
+"""Incremental confusion analytics at millions of score events.
+
+Feeds simulated score events (log-normal activity per user) through
+``ConfusionAnalytics``, draining and encoding the changed summaries every
+``--publish-every`` events as the periodic publisher would. The baseline is
+what a dashboard does without it: keep every score and recompute a user's
+summary by scanning them on each read. Reports ingest rate, publish volume,
+memory per key and per-read cost for both.
+
+    python -m benchmarks.bench_analytics --events 2000000 --users 100000 --topics 50
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Dict, List
+
+import numpy as np
+
+from app.analytics import ConfusionAnalytics, user_key
+from app.codec import JSON
+
+
+def simulate(events: int, users: int, topics: int, seed: int):
+    rng = np.random.default_rng(seed)
+    activity = rng.lognormal(0.0, 1.0, users)
+    user_ids = rng.choice(users, events, p=activity / activity.sum()).tolist()
+    topic_ids = rng.integers(0, topics, events).tolist()
+    scores = np.clip(rng.normal(45, 20, events), 0, 100).astype(int).tolist()
+    names = [f"user-{i}" for i in range(users)]
+    topic_names = [f"topic-{i}" for i in range(topics)]
+    return [names[u] for u in user_ids], [topic_names[t] for t in topic_ids], scores
+
+
+def recompute(scores: List[int], bins: int) -> Dict[str, object]:
+    """Summary from the full score list, as a scan-on-read dashboard would build it."""
+    histogram = [0] * bins
+    for s in scores:
+        histogram[min(bins - 1, s * bins // 100)] += 1
+    return {"turns": len(scores), "mean": sum(scores) / len(scores), "histogram": histogram}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--publish-every", type=int, default=100_000, help="events between publishes")
+    parser.add_argument("--reads", type=int, default=10_000, help="summary reads for the read-cost comparison")
+    parser.add_argument("--memory-events", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    user_ids, topic_names, scores = simulate(args.events, args.users, args.topics, args.seed)
+    analytics = ConfusionAnalytics(max_users=args.users)
+
+    published = encoded_bytes = publishes = 0
+    publish_seconds = 0.0
+    started = time.perf_counter()
+    record = analytics.record
+    for i in range(args.events):
+        record(user_ids[i], topic_names[i], scores[i])
+        if (i + 1) % args.publish_every == 0:
+            flush_started = time.perf_counter()
+            for key, summary in analytics.drain():
+                encoded_bytes += len(JSON.dumps({"key": key, **summary}))
+                published += 1
+            publish_seconds += time.perf_counter() - flush_started
+            publishes += 1
+    elapsed = time.perf_counter() - started
+
+    # Memory: aggregates are constant per key; raw score lists grow with events
+    sample = args.memory_events
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    incremental = ConfusionAnalytics(max_users=args.users)
+    for i in range(sample):
+        incremental.record(user_ids[i], topic_names[i], scores[i])
+    incremental_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    keys = incremental.snapshot()["users"] + incremental.snapshot()["topics"]
+    del incremental
+    before = tracemalloc.take_snapshot()
+    history: Dict[str, List[int]] = {}
+    for i in range(sample):
+        history.setdefault(user_ids[i], []).append(scores[i])
+    raw_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    for i in range(sample, args.events):
+        history.setdefault(user_ids[i], []).append(scores[i])
+
+    # Read cost: precomputed summary vs scan of the user's scores, for random and heaviest users
+    rng = np.random.default_rng(args.seed + 1)
+    users = list(history)
+    cohorts = {
+        "random": [users[i] for i in rng.integers(0, len(users), args.reads)],
+        "top_1pct": sorted(users, key=lambda u: -len(history[u]))[: max(1, len(users) // 100)],
+    }
+    read_us: Dict[str, Dict[str, float]] = {}
+    for name, readers in cohorts.items():
+        started = time.perf_counter()
+        for user in readers:
+            analytics.summary(user_key(user))
+        precomputed_us = (time.perf_counter() - started) / len(readers) * 1e6
+        started = time.perf_counter()
+        for user in readers:
+            recompute(history[user], analytics.bins)
+        recompute_us = (time.perf_counter() - started) / len(readers) * 1e6
+        read_us[name] = {
+            "turns_avg": round(sum(len(history[u]) for u in readers) / len(readers), 1),
+            "precomputed": round(precomputed_us, 2),
+            "recompute_scan": round(recompute_us, 2),
+        }
+
+    total_keys = analytics.snapshot()["users"] + analytics.snapshot()["topics"]
+    print(json.dumps({
+        "events": args.events,
+        "events_per_sec": round(args.events / elapsed),
+        "ingest_us_per_event": round((elapsed - publish_seconds) / args.events * 1e6, 3),
+        "publishes": publishes,
+        "records_published": published,
+        "records_per_publish": round(published / max(publishes, 1)),
+        "publish_ms_avg": round(publish_seconds / max(publishes, 1) * 1000, 1),
+        "published_bytes": encoded_bytes,
+        "keys": total_keys,
+        "memory_sample_events": sample,
+        "incremental_bytes_per_key": round(incremental_bytes / max(keys, 1)),
+        "raw_scores_bytes_per_score": round(raw_bytes / sample, 1),
+        "incremental_mb": round(incremental_bytes / max(keys, 1) * total_keys / 1e6, 1),
+        "raw_scores_mb": round(raw_bytes / sample * args.events / 1e6, 1),
+        "read_us": read_us,
+        "turns_per_user": {
+            "mean": round(args.events / len(history), 1),
+            "max": max(len(scores) for scores in history.values()),
+        },
+    }, indent=2), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Serialize/deserialize cost per chat event for each wire codec.
+
+Decode is ``bytes -> validated ChatEvent`` (parse plus schema check); encode
+is one ``chat.output`` record. The baseline is the previous path, stdlib
+``json`` with no validation.
+
+    python -m benchmarks.bench_codec --events 200000
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app import codec
+from app.codec import ChatEvent
+
+EVENT = {
+    "userId": "user-1234",
+    "topic": "Python",
+    "message": "A list keeps its items in insertion order and allows duplicates, a set does not.",
+    "timestamp": "2024-05-01T12:00:00.000Z",
+}
+OUTPUT = {
+    "userId": "user-1234",
+    "question": "Good. Why can a set answer `x in s` faster than a list can?",
+    "scores": {"accuracy": 0.8, "depth": 0.6, "clarity": 0.9},
+    "reasoning": "Correct distinction; no mention of hashing yet.",
+    "timestamp": "2024-05-01T12:00:00.000Z",
+}
+
+
+def _per_event(fn: Callable[[], Any], events: int) -> float:
+    started = time.perf_counter()
+    for _ in range(events):
+        fn()
+    return (time.perf_counter() - started) / events * 1e6
+
+
+def _backends() -> List[Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any], bool]]:
+    backends = [("json (stdlib, unvalidated)", lambda v: json.dumps(v).encode("utf-8"), lambda b: json.loads(b.decode("utf-8")), False)]
+    if codec.orjson is not None:
+        backends.append(("orjson + ChatEvent", codec.JSON.dumps, codec.JSON.loads, True))
+    if codec.MSGPACK is not None:
+        backends.append(("msgpack + ChatEvent", codec.MSGPACK.dumps, codec.MSGPACK.loads, True))
+    return backends
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, dumps, loads, validate in _backends():
+        raw = dumps(EVENT)
+        decode = (lambda: ChatEvent.from_dict(loads(raw))) if validate else (lambda: loads(raw))
+        results[name] = {
+            "decode_us": _per_event(decode, args.events),
+            "encode_us": _per_event(lambda: dumps(OUTPUT), args.events),
+            "bytes": len(dumps(OUTPUT)),
+        }
+    for name, r in results.items():
+        print(f"{name:28s} decode {r['decode_us']:6.2f}us  encode {r['encode_us']:6.2f}us  output {r['bytes']:4d}B")
+    if codec.MSGPACK is None:
+        print("msgpack not installed; pip install msgpack to include it")
+
+
+if __name__ == "__main__":
+    main()
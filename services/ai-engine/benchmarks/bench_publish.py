@@ -0,0 +1,99 @@
+"""Per-event publish latency: sequential send_and_wait vs pipelined publish_records.
+
+Uses a simulated broker in which every produce request costs one round-trip
+and records enqueued within the linger window share a request.
+
+    python -m benchmarks.bench_publish --events 2000 --concurrency 50 --rtt-ms 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from app.publisher import publish_records
+
+
+class SimulatedProducer:
+    """Batches records for ``linger`` seconds, then acks the batch after ``rtt``."""
+
+    def __init__(self, rtt: float, linger: float) -> None:
+        self.rtt = rtt
+        self.linger = linger
+        self.requests = 0
+        self._batch: List[asyncio.Future] = []
+
+    async def send(self, topic, value=None, key=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._batch:
+            loop.call_later(self.linger, self._flush)
+        self._batch.append(future)
+        return future
+
+    async def send_and_wait(self, topic, value=None, key=None):
+        return await (await self.send(topic, value=value, key=key))
+
+    def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        self.requests += 1
+
+        def ack():
+            for future in batch:
+                future.set_result(None)
+
+        asyncio.get_running_loop().call_later(self.rtt, ack)
+
+
+async def _sequential(producer, user_id: bytes) -> None:
+    await producer.send_and_wait("chat.output", value=b"{}", key=user_id)
+    await producer.send_and_wait("chat.score", value=b"{}", key=user_id)
+
+
+async def _pipelined(producer, user_id: bytes) -> None:
+    await publish_records(producer, [("chat.output", user_id, b"{}"), ("chat.score", user_id, b"{}")])
+
+
+async def _run(mode, events: int, concurrency: int, rtt: float, linger: float):
+    producer = SimulatedProducer(rtt, linger)
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await mode(producer, f"user-{i % concurrency}".encode("utf-8"))
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(events)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "events_per_sec": events / elapsed,
+        "produce_requests": producer.requests,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--linger-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    for name, mode in (("sequential send_and_wait", _sequential), ("pipelined publish_records", _pipelined)):
+        result = asyncio.run(
+            _run(mode, args.events, args.concurrency, args.rtt_ms / 1000, args.linger_ms / 1000)
+        )
+        print(
+            f"{name:28s} p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+            f"throughput={result['events_per_sec']:.0f}/s requests={result['produce_requests']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""End-to-end replay of chat sessions through the engine's main loop.
+
+Drives ``app.consumer.run`` with an in-memory Kafka and a mock LLM server
+(log-normal latency, configurable error rate). Each simulated user sends a
+turn, waits for its ``chat.output`` record, thinks, and sends the next, so
+latency is measured from input record to published question. Sessions are
+synthetic (``--users`` x ``--turns``) or replayed from a JSONL file of
+``{"userId", "message", "topic"}`` events, grouped per user in file order.
+Results are written as JSON for comparison across commits.
+
+    python -m benchmarks.bench_replay --users 200 --turns 10 --llm-median-ms 300 --out results/replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import consumer as engine
+from app.history import InMemoryHistoryStore
+from app.llm import LLMClient
+from benchmarks.harness import InMemoryConsumer, InMemoryProducer, MockLLMServer, check_history
+
+Session = List[Dict[str, Any]]
+
+
+def synthetic_sessions(users: int, turns: int, topic: str) -> Dict[str, Session]:
+    return {
+        f"user-{u}": [
+            {"userId": f"user-{u}", "topic": topic, "message": f"[user-{u} #{t}] a list keeps its items in order"}
+            for t in range(turns)
+        ]
+        for u in range(users)
+    }
+
+
+def recorded_sessions(path: str) -> Dict[str, Session]:
+    sessions: Dict[str, Session] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                event = json.loads(line)
+                sessions[str(event["userId"])].append(event)
+    return dict(sessions)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * q) - 1))]
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def replay(sessions: Dict[str, Session], args: argparse.Namespace) -> Dict[str, Any]:
+    model_medians = {engine.router.fast.model: args.fast_llm_median_ms} if engine.router is not None else None
+    llm = MockLLMServer(args.llm_median_ms, args.llm_sigma, args.llm_error_rate, args.seed, model_medians)
+    await llm.start()
+    client = LLMClient("sk-bench", base_url=llm.base_url, max_retries=args.llm_retries)
+    history = InMemoryHistoryStore()
+    source = InMemoryConsumer(engine.CHAT_INPUT_TOPIC)
+    pending: Dict[Tuple[str, int], asyncio.Future] = {}
+    outputs: Dict[Tuple[str, int], int] = defaultdict(int)
+
+    def on_record(topic: str, key: Optional[bytes], value: bytes, headers: Any) -> None:
+        if topic != engine.CHAT_OUTPUT_TOPIC:
+            return
+        record = json.loads(value)
+        turn = (record["userId"], record["timestamp"])
+        outputs[turn] += 1
+        future = pending.pop(turn, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    producer = InMemoryProducer(args.produce_ms / 1000, on_record)
+    latencies: List[float] = []
+    sent: Dict[str, List[str]] = defaultdict(list)
+    seq = iter(range(1 << 62))
+    rng = random.Random(args.seed)
+    injected = 0
+
+    async def user(user_id: str, session: Session) -> None:
+        nonlocal injected
+        loop = asyncio.get_running_loop()
+        for event in session:
+            timestamp = next(seq)
+            future = loop.create_future()
+            pending[(user_id, timestamp)] = future
+            sent[user_id].append(event.get("message", ""))
+            started = time.perf_counter()
+            source.put({**event, "userId": user_id, "timestamp": timestamp})
+            if rng.random() < args.duplicate_rate:
+                # A gateway retry: the same record published again
+                injected += 1
+                source.put({**event, "userId": user_id, "timestamp": timestamp})
+            latencies.append(await future - started)
+            if args.think_ms:
+                await asyncio.sleep(args.think_ms / 1000)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = _rss_mb()
+    engine_task = asyncio.create_task(engine.run(source, producer, client, history))
+    started = time.perf_counter()
+    await asyncio.gather(*(user(u, s) for u, s in sessions.items()))
+    elapsed = time.perf_counter() - started
+    source.close()
+    await engine_task
+    traced = tracemalloc.get_traced_memory() if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+    await llm.stop()
+
+    stored = {u: await history.get(u) for u in sessions}
+    events = len(latencies)
+    ordered = sorted(latencies)
+    return {
+        "events": events,
+        "users": len(sessions),
+        "elapsed_s": round(elapsed, 3),
+        "events_per_sec": round(events / elapsed, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(ordered) * 1000, 2),
+            "p95": round(_percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(_percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2),
+        },
+        "llm": {"requests": llm.requests, "errors": llm.errors, "models": llm.models},
+        "router": engine.router.snapshot() if engine.router is not None else None,
+        "outputs": {
+            "missing": events - len(outputs),
+            "duplicated": sum(1 for count in outputs.values() if count > 1),
+            "injected_duplicates": injected,
+        },
+        "history": check_history(stored, sent),
+        "memory": {
+            "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+            "traced_current_mb": round(traced[0] / 2 ** 20, 1) if traced else None,
+            "traced_peak_mb": round(traced[1] / 2 ** 20, 1) if traced else None,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--topic", default="Python")
+    parser.add_argument("--sessions", help="JSONL of recorded events to replay instead of synthetic sessions")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a reply and the next turn")
+    parser.add_argument("--llm-median-ms", type=float, default=300.0)
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="log-normal spread of LLM latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--fast-llm-median-ms", type=float, default=100.0, help="fast-tier latency with ROUTER_ENABLED")
+    parser.add_argument("--llm-retries", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="share of events published twice")
+    parser.add_argument("--produce-ms", type=float, default=2.0, help="simulated broker acknowledgement time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="report tracemalloc figures (slower)")
+    parser.add_argument("--out", help="write the results JSON here")
+    args = parser.parse_args()
+
+    if args.sessions:
+        sessions = recorded_sessions(args.sessions)
+    else:
+        sessions = synthetic_sessions(args.users, args.turns, args.topic)
+    result = {"commit": _commit(), "config": vars(args), **asyncio.run(replay(sessions, args))}
+    print(json.dumps(result, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
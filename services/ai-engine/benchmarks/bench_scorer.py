@@ -0,0 +1,49 @@
+"""Local scorer vs LLM: per-message latency and agreement with the LLM's scores.
+
+LLM latency comes from the ``llm_seconds`` recorded in the score log, so no
+API calls are made.
+
+    python -m benchmarks.bench_scorer --log logs/scores.jsonl --model models/confusion_scorer.npz
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from app.scorer import LOCAL_SCORER_PATH, ConfusionScorer, evaluate, read_pairs, split, texts_and_scores
+
+
+def _percentiles(seconds: List[float]) -> str:
+    seconds = sorted(seconds)
+    p95 = seconds[max(0, int(len(seconds) * 0.95) - 1)]
+    return f"p50={statistics.median(seconds) * 1000:.2f}ms p95={p95 * 1000:.2f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", required=True)
+    parser.add_argument("--model", default=LOCAL_SCORER_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    _, test_set = split(read_pairs(args.log), args.holdout)
+    if not test_set:
+        raise SystemExit(f"No held-out pairs in {args.log}")
+    scorer = ConfusionScorer.load(args.model)
+    texts, scores = texts_and_scores(test_set)
+
+    local: List[float] = []
+    for text in texts:
+        start = time.perf_counter()
+        scorer.score(text)
+        local.append(time.perf_counter() - start)
+    llm = [r["llm_seconds"] for r in test_set if isinstance(r.get("llm_seconds"), (int, float))]
+
+    print(f"local scorer  {_percentiles(local)} n={len(local)}")
+    if llm:
+        print(f"LLM (logged)  {_percentiles(llm)} n={len(llm)}")
+    print(f"agreement     {evaluate(scorer, texts, scores)}")
+
+
+if __name__ == "__main__":
+    main()
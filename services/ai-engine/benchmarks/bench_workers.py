@@ -0,0 +1,80 @@
+"""Throughput scaling of the engine with worker processes.
+
+Runs the ``bench_replay`` load in 1..N processes at once, the way
+``app.supervisor`` runs workers: users are split across processes by a hash
+of ``userId`` (as the keyed ``chat.input`` partitions split them), and each
+process drives its own main loop, in-memory Kafka and mock LLM. Reports
+aggregate events/sec per worker count and the speed-up over one worker.
+
+    python -m benchmarks.bench_workers --max-workers 4 --users 400 --turns 5 --llm-median-ms 50
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from app.supervisor import install_event_loop, worker_count
+from benchmarks.bench_replay import Session, replay, synthetic_sessions
+
+
+def shard(sessions: Dict[str, Session], workers: int) -> List[Dict[str, Session]]:
+    shards: List[Dict[str, Session]] = [{} for _ in range(workers)]
+    for user_id, session in sessions.items():
+        shards[zlib.crc32(user_id.encode("utf-8")) % workers][user_id] = session
+    return shards
+
+
+def _worker(job: Tuple[Dict[str, Session], argparse.Namespace]) -> Dict[str, Any]:
+    sessions, args = job
+    install_event_loop(args.loop)
+    return asyncio.run(replay(sessions, args))
+
+
+def run_workers(sessions: Dict[str, Session], workers: int, args: argparse.Namespace) -> Dict[str, Any]:
+    # spawn, not fork: each worker starts from a clean interpreter like a supervised one
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        results = pool.map(_worker, [(s, args) for s in shard(sessions, workers)])
+    events = sum(r["events"] for r in results)
+    elapsed = max(r["elapsed_s"] for r in results)
+    return {
+        "workers": workers,
+        "events": events,
+        "events_per_sec": round(events / elapsed, 1),
+        "per_worker_events_per_sec": [r["events_per_sec"] for r in results],
+        "p99_ms": max(r["latency_ms"]["p99"] for r in results),
+        "missing_outputs": sum(r["outputs"]["missing"] for r in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=worker_count())
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--topic", default="Python")
+    parser.add_argument("--loop", default="asyncio", choices=("asyncio", "uvloop"))
+    parser.add_argument("--think-ms", type=float, default=0.0)
+    parser.add_argument("--llm-median-ms", type=float, default=50.0)
+    parser.add_argument("--llm-sigma", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--fast-llm-median-ms", type=float, default=100.0)
+    parser.add_argument("--llm-retries", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--produce-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.trace_memory = False
+
+    sessions = synthetic_sessions(args.users, args.turns, args.topic)
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        result = run_workers(sessions, workers, args)
+        baseline = baseline or result["events_per_sec"]
+        result["speedup"] = round(result["events_per_sec"] / baseline, 2)
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
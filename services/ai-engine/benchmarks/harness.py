@@ -0,0 +1,244 @@
+"""In-memory Kafka and a mock LLM server for driving the engine offline.
+
+``InMemoryConsumer`` and ``InMemoryProducer`` implement the parts of the
+aiokafka API that ``app.consumer.run`` uses. ``MockLLMServer`` speaks just
+enough HTTP/1.1 and chat-completions JSON for ``LLMClient``; each reply
+echoes the teacher turn it answered in ``reasoning`` so stored histories can
+be checked afterwards.
+"""
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+class InMemoryConsumer:
+    """Single-partition topic fed by ``put``; iteration ends after ``close``."""
+
+    def __init__(self, topic: str) -> None:
+        self.tp = SimpleNamespace(topic=topic, partition=0)
+        self._queue: "asyncio.Queue[Optional[SimpleNamespace]]" = asyncio.Queue()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._next_offset = 0
+        self.pauses = 0
+        self.listener: Any = None
+        self.committed: Dict[Any, int] = {}
+
+    def put(self, event: Dict[str, Any]) -> None:
+        self.put_raw(json.dumps(event).encode("utf-8"))
+
+    def put_raw(self, value: Optional[bytes], headers: Tuple[Tuple[str, bytes], ...] = ()) -> None:
+        self._queue.put_nowait(SimpleNamespace(
+            topic=self.tp.topic,
+            partition=0,
+            offset=self._next_offset,
+            key=None,
+            value=value,
+            headers=headers,
+        ))
+        self._next_offset += 1
+
+    def close(self) -> None:
+        """End iteration once every queued record has been consumed."""
+        self._queue.put_nowait(None)
+
+    def subscribe(self, topics: List[str], listener: Any = None) -> None:
+        self.listener = listener
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def commit(self, offsets: Dict[Any, int]) -> None:
+        for tp, offset in offsets.items():
+            self.committed[(tp.topic, tp.partition)] = offset
+
+    def assignment(self) -> Set[Any]:
+        return {self.tp}
+
+    def pause(self, *partitions: Any) -> None:
+        self.pauses += 1
+        self._resumed.clear()
+
+    def resume(self, *partitions: Any) -> None:
+        self._resumed.set()
+
+    def paused(self) -> Set[Any]:
+        return set() if self._resumed.is_set() else {self.tp}
+
+    def highwater(self, tp: Any) -> int:
+        return self._next_offset
+
+    def __aiter__(self) -> "InMemoryConsumer":
+        return self
+
+    async def __anext__(self) -> SimpleNamespace:
+        await self._resumed.wait()
+        record = await self._queue.get()
+        if record is None:
+            raise StopAsyncIteration
+        return record
+
+
+class InMemoryProducer:
+    """Acknowledges each record after ``latency`` seconds and hands
+    ``(topic, key, value, headers)`` to ``on_record``."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        on_record: Optional[Callable[..., None]] = None,
+    ) -> None:
+        self.latency = latency
+        self.on_record = on_record
+        self.sent = 0
+        self.metadata_fetched: Set[str] = set()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def partitions_for(self, topic: str) -> Set[int]:
+        self.metadata_fetched.add(topic)
+        return {0}
+
+    async def send(
+        self,
+        topic: str,
+        value: Optional[bytes] = None,
+        key: Optional[bytes] = None,
+        headers: Any = None,
+        partition: Optional[int] = None,
+    ):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.sent += 1
+
+        def ack() -> None:
+            if self.on_record is not None:
+                self.on_record(topic, key, value, headers)
+            future.set_result(None)
+
+        if self.latency > 0:
+            loop.call_later(self.latency, ack)
+        else:
+            ack()
+        return future
+
+
+class MockLLMServer:
+    """Chat-completions endpoint with log-normal latency and a 500 error rate."""
+
+    def __init__(
+        self,
+        median_ms: float = 800.0,
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        model_median_ms: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.median = median_ms / 1000
+        # Per-model medians, for routing between fast and slow models
+        self.model_medians = {m: ms / 1000 for m, ms in (model_median_ms or {}).items()}
+        self.models: Dict[str, int] = {}
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.requests = 0
+        self.errors = 0
+        self.listings = 0
+
+    @property
+    def base_url(self) -> str:
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _reply(self, body: bytes) -> Tuple[str, bytes]:
+        self.requests += 1
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            return "500 Internal Server Error", json.dumps({"error": {"message": "mock failure"}}).encode("utf-8")
+        request = json.loads(body)
+        turn = request["messages"][-1]["content"]
+        content = json.dumps({
+            "question": f"Could you say more about that? ({len(request['messages'])})",
+            "confusion_score": self._rng.randint(10, 80),
+            "reasoning": turn,
+        })
+        return "200 OK", json.dumps({
+            "id": f"chatcmpl-mock-{self.requests}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode("utf-8")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                body = await reader.readexactly(length)
+                if head.startswith(b"GET "):
+                    # Model listing, used by connection warm-up
+                    self.listings += 1
+                    await asyncio.sleep(self.median)
+                    status, payload = "200 OK", b'{"object": "list", "data": []}'
+                else:
+                    model = json.loads(body).get("model", "")
+                    self.models[model] = self.models.get(model, 0) + 1
+                    median = self.model_medians.get(model, self.median)
+                    await asyncio.sleep(median * self._rng.lognormvariate(0, self.sigma))
+                    status, payload = self._reply(body)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def check_history(
+    stored: Dict[str, List[Dict[str, str]]], sent: Dict[str, List[str]]
+) -> Dict[str, int]:
+    """Compare each user's stored history with the turns sent for that user.
+
+    Every stored (teacher, student) pair must answer its own teacher turn,
+    and the teacher turns must be the user's own messages in sending order.
+    """
+    mismatched = 0
+    out_of_order = 0
+    for user_id, messages in stored.items():
+        own = sent.get(user_id, [])
+        position = -1
+        for teacher, student in zip(messages[::2], messages[1::2]):
+            if json.loads(student["content"]).get("reasoning") != teacher["content"]:
+                mismatched += 1
+            index = next((i for i in range(position + 1, len(own)) if own[i] in teacher["content"]), None)
+            if index is None:
+                out_of_order += 1
+            else:
+                position = index
+    return {"users_checked": len(stored), "mismatched_replies": mismatched, "out_of_order_turns": out_of_order}
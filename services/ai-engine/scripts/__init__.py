@@ -0,0 +1 @@
+# Empty file to make scripts directory a Python package
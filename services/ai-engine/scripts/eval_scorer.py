@@ -0,0 +1,24 @@
+"""Evaluate a trained local scorer against logged LLM scores.
+
+    python -m scripts.eval_scorer --log logs/scores.jsonl --model models/confusion_scorer.npz
+"""
+import argparse
+
+from app.scorer import LOCAL_SCORER_PATH, ConfusionScorer, evaluate, read_pairs, split, texts_and_scores
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", required=True)
+    parser.add_argument("--model", default=LOCAL_SCORER_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="same split as training; 1 = every pair")
+    args = parser.parse_args()
+
+    _, test_set = split(read_pairs(args.log), args.holdout)
+    if not test_set:
+        raise SystemExit(f"No held-out pairs in {args.log}")
+    print(evaluate(ConfusionScorer.load(args.model), *texts_and_scores(test_set)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Train the local confusion scorer from logged (message, LLM score) pairs.
+
+    python -m scripts.train_scorer --log logs/scores.jsonl --out models/confusion_scorer.npz
+"""
+import argparse
+
+from app.scorer import LOCAL_SCORER_PATH, SCORER_FEATURES, evaluate, read_pairs, split, texts_and_scores, train
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", required=True, help="JSONL written with SCORE_LOG_PATH")
+    parser.add_argument("--out", default=LOCAL_SCORER_PATH)
+    parser.add_argument("--features", type=int, default=SCORER_FEATURES)
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--learning-rate", type=float, default=0.05)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction kept out for evaluation")
+    args = parser.parse_args()
+
+    train_set, test_set = split(read_pairs(args.log), args.holdout)
+    if not train_set:
+        raise SystemExit(f"No usable pairs in {args.log}")
+    scorer = train(*texts_and_scores(train_set), args.features, args.epochs, args.learning_rate, args.l2)
+    scorer.save(args.out)
+    print(f"Trained on {len(train_set)} pairs, saved to {args.out}")
+    print(f"train:   {evaluate(scorer, *texts_and_scores(train_set))}")
+    if test_set:
+        print(f"holdout: {evaluate(scorer, *texts_and_scores(test_set))}")
+
+
+if __name__ == "__main__":
+    main()
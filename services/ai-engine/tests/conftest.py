@@ -0,0 +1,10 @@
+import pytest
+
+from app import consumer
+from app.cache import TurnDeduplicator
+
+
+@pytest.fixture(autouse=True)
+def fresh_turn_dedupe(monkeypatch):
+    """Each test starts without duplicate-turn memory from earlier tests."""
+    monkeypatch.setattr(consumer, "turn_dedupe", TurnDeduplicator())
@@ -0,0 +1,239 @@
+import json
+
+import pytest
+
+from app import analytics as analytics_module
+from app import consumer
+from app.analytics import (
+    ConfusionAnalytics,
+    RollingStats,
+    key_partition,
+    load_assigned,
+    partition_for,
+    publish_analytics,
+    topic_key,
+    user_key,
+)
+from app.history import InMemoryHistoryStore
+from benchmarks.harness import InMemoryProducer
+
+
+def user_on(partition, partitions=2, skip=0):
+    """A user id whose turns land on ``partition``."""
+    users = (f"u{i}" for i in range(1000) if partition_for(f"u{i}", partitions) == partition)
+    for _ in range(skip):
+        next(users)
+    return next(users)
+
+
+SUMMARY = {"sessions": 1, "turns": 4, "mean": 50.0, "ewma": 55.0, "trend": 2.0,
+           "histogram": [0] * 5 + [4] + [0] * 4, "lastScore": 60, "updatedAt": 1.0}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRollingStats:
+    """Test the online aggregates."""
+
+    def test_mean_ewma_and_histogram(self):
+        """Test that counts, mean, EWMA and histogram follow the scores."""
+        stats = RollingStats(bins=10)
+        for score in (20, 40, 100):
+            stats.add(score, alpha=0.5, trend_alpha=0.1, now=1.0)
+        summary = stats.summary()
+        assert summary["turns"] == 3
+        assert summary["mean"] == pytest.approx(53.33)
+        assert summary["ewma"] == pytest.approx(65.0)  # 20 -> 30 -> 65
+        assert summary["histogram"] == [0, 0, 1, 0, 1, 0, 0, 0, 0, 1]
+        assert summary["lastScore"] == 100
+
+    def test_trend_sign(self):
+        """Test that rising confusion gives a positive trend and falling a negative one."""
+        rising, falling = RollingStats(5), RollingStats(5)
+        for i in range(20):
+            rising.add(i * 5, 0.3, 0.05, 0)
+            falling.add(100 - i * 5, 0.3, 0.05, 0)
+        assert rising.summary()["trend"] > 10
+        assert falling.summary()["trend"] < -10
+
+    def test_summary_round_trip(self):
+        """Test that stats rebuilt from a summary continue where they left off."""
+        stats = RollingStats(10)
+        for score in (30, 60, 90):
+            stats.add(score, 0.3, 0.05, 5.0)
+        stats.sessions = 2
+        restored = RollingStats.from_summary(json.loads(json.dumps(stats.summary())), 10)
+        for s in (stats, restored):
+            s.add(10, 0.3, 0.05, 6.0)
+        assert restored.summary() == stats.summary()
+
+
+class TestConfusionAnalytics:
+    """Test per-user and per-topic aggregation and draining."""
+
+    def test_user_and_topic_keys(self):
+        """Test that a turn updates the user's and the topic's stats."""
+        analytics = ConfusionAnalytics(partitions=1, clock=FakeClock())
+        analytics.session("u1", "Python")
+        analytics.record("u1", "Python", 40)
+        analytics.record("u2", "Python", 140)  # clamped
+        assert analytics.summary(user_key("u1"))["sessions"] == 1
+        topic = analytics.summary(topic_key("Python", 0))
+        assert topic["sessions"] == 1 and topic["turns"] == 2
+        assert topic["mean"] == 70
+
+    def test_drain_returns_each_changed_key_once(self):
+        """Test that only keys changed since the last drain are handed out."""
+        analytics = ConfusionAnalytics(partitions=1)
+        analytics.record("u1", "Python", 40)
+        analytics.record("u1", "Python", 50)
+        assert sorted(key for key, _ in analytics.drain()) == ["topic:Python@0", "user:u1"]
+        assert analytics.drain() == []
+        analytics.record("u2", "Python", 10)
+        assert len(analytics.drain()) == 2
+
+    def test_full_table_stops_tracking_instead_of_evicting(self):
+        """Test that a user past the cap is not tracked, so no summary restarts from zero."""
+        analytics = ConfusionAnalytics(partitions=1, max_users=2)
+        analytics.apply("user:a", SUMMARY)
+        for user in ("a", "b", "c"):
+            analytics.record(user, "Python", 50)
+        assert analytics.summary("user:a")["turns"] == 5
+        assert analytics.summary("user:c") is None
+        assert analytics.snapshot()["untracked"] == 1
+        assert {key for key, _ in analytics.drain()} == {"user:a", "user:b", "topic:Python@0"}
+
+    def test_restore_continues_counts(self):
+        """Test that restored users and topic records continue, and old-style topic keys are skipped."""
+        analytics = ConfusionAnalytics(partitions=1)
+        assert analytics.apply("user:u1", SUMMARY)
+        assert analytics.apply("topic:Python@0", SUMMARY)
+        assert not analytics.apply("topic:Python@w1", SUMMARY)
+        analytics.record("u1", "Python", 50)
+        assert analytics.summary("user:u1")["turns"] == 5
+        assert analytics.summary("topic:Python@0")["turns"] == 5
+        assert analytics.snapshot()["restored"] == 2
+        assert analytics.apply("user:u1", None)  # tombstone
+        assert analytics.summary("user:u1") is None
+
+
+class TestAssignedPartitions:
+    """Test holding only the keys of the input partitions this worker consumes."""
+
+    def test_turns_of_other_partitions_are_ignored(self):
+        """Test that only users and topic records of assigned partitions are kept and published."""
+        mine, other = user_on(0), user_on(1)
+        analytics = ConfusionAnalytics(partitions=2)
+        analytics.scope()
+        assert analytics.assign([0]) == [0]
+        analytics.record(mine, "Python", 40)
+        analytics.record(other, "Python", 60)
+        assert {key for key, _ in analytics.drain()} == {user_key(mine), topic_key("Python", 0)}
+        assert analytics.snapshot()["ignored"] == 1
+        assert not analytics.apply(user_key(other), SUMMARY)
+
+    def test_unassigned_partition_is_dropped(self):
+        """Test that keys of a partition given up leave memory and are not published later."""
+        mine = user_on(1)
+        analytics = ConfusionAnalytics(partitions=2)
+        analytics.scope()
+        analytics.assign([0, 1])
+        analytics.record(mine, "Python", 40)
+        assert analytics.assign([0]) == []
+        assert analytics.summary(user_key(mine)) is None
+        assert analytics.summary(topic_key("Python", 1)) is None
+        assert analytics.drain() == []
+
+    def test_records_go_to_the_users_partition(self):
+        """Test that summaries are published to the partition of the turns they count."""
+        user = user_on(1)
+        assert key_partition(user_key(user), 2) == 1
+        assert key_partition(topic_key("Python", 1), 2) == 1
+
+
+@pytest.mark.asyncio
+class TestPublish:
+    """Test publishing summaries to the compacted topic."""
+
+    async def test_records_keyed_by_user_and_topic(self):
+        """Test that each changed key goes out once as a keyed JSON record."""
+        records = []
+        producer = InMemoryProducer(on_record=lambda topic, key, value, headers: records.append((topic, key, value)))
+        analytics = ConfusionAnalytics(partitions=1)
+        analytics.record("u1", "Python", 40)
+        assert await publish_analytics(producer, analytics, topic="chat.analytics") == 2
+        assert await publish_analytics(producer, analytics, topic="chat.analytics") == 0
+        by_key = {key: json.loads(value) for topic, key, value in records}
+        assert set(by_key) == {b"user:u1", b"topic:Python@0"}
+        assert by_key[b"user:u1"]["key"] == "user:u1" and by_key[b"user:u1"]["turns"] == 1
+
+    async def test_failed_publish_is_retried(self):
+        """Test that summaries from a failed publish are sent on the next one."""
+        class FailingProducer(InMemoryProducer):
+            async def send(self, *args, **kwargs):
+                raise RuntimeError("broker down")
+
+        analytics = ConfusionAnalytics()
+        analytics.record("u1", "Python", 40)
+        with pytest.raises(RuntimeError):
+            await publish_analytics(FailingProducer(), analytics)
+        assert analytics.snapshot()["pending"] == 2
+
+    async def test_engine_records_turns_and_sessions(self, monkeypatch):
+        """Test that process_chat_event feeds greetings and scored turns to analytics."""
+        analytics = ConfusionAnalytics()
+        monkeypatch.setattr(consumer, "analytics", analytics)
+        producer, history = InMemoryProducer(), InMemoryHistoryStore()
+        for message in ("[INITIAL_GREETING]", "Sets use hashing."):
+            event = {"userId": "u1", "message": message, "topic": "Python", "timestamp": message}
+            await consumer.process_chat_event(producer, event, None, history)
+        summary = analytics.summary("user:u1")
+        assert summary["sessions"] == 1 and summary["turns"] == 1
+        assert summary["lastScore"] == 25  # fallback score without an LLM
+
+
+    async def test_explicit_partitions(self):
+        """Test that each record is sent to its key's partition."""
+        sent = []
+
+        class PartitionProducer(InMemoryProducer):
+            async def send(self, topic, value=None, key=None, headers=None, partition=None):
+                sent.append((key, partition))
+                return await super().send(topic, value, key, headers)
+
+        user = user_on(1)
+        analytics = ConfusionAnalytics(partitions=2)
+        analytics.record(user, "Python", 40)
+        await publish_analytics(PartitionProducer(), analytics)
+        assert sorted(sent) == [(b"topic:Python@1", 1), (user_key(user).encode(), 1)]
+
+    async def test_rebalance_publishes_then_loads_new_partitions(self, monkeypatch):
+        """Test that a rebalance publishes pending changes before dropping and loads only new partitions."""
+        loaded, records = [], []
+
+        async def load(analytics, bootstrap_servers, topic, partitions):
+            loaded.append(partitions)
+            analytics.apply(user_key(user_on(1)), SUMMARY)
+
+        monkeypatch.setattr(analytics_module, "_load", load)
+        producer = InMemoryProducer(on_record=lambda topic, key, value, headers: records.append(key))
+        analytics = ConfusionAnalytics(partitions=2)
+        analytics.scope()
+        await load_assigned(producer, analytics, ["kafka:9092"], [0])
+        analytics.record(user_on(0), "Python", 40)
+        await load_assigned(producer, analytics, ["kafka:9092"], [1])
+        assert loaded == [[0], [1]]
+        assert user_key(user_on(0)).encode() in records  # published before partition 0 was given up
+        assert analytics.summary(user_key(user_on(0))) is None
+        analytics.record(user_on(1), "Python", 40)
+        assert analytics.summary(user_key(user_on(1)))["turns"] == 5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app import batching
+from app.batching import BatchBackend, ConcurrentBatchBackend, MicroBatcher, PackedBatchBackend, create_batcher
+from app.history import InMemoryHistoryStore
+from app.prompts import build_student_messages
+
+
+def reply_for(messages, score=20):
+    return json.dumps({"reasoning": "r", "confusion_score": score, "question": f"re: {messages[-1]['content']}"})
+
+
+class LocalBatchBackend(BatchBackend):
+    """Batch-capable stand-in: one simulated round-trip per batch."""
+
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.batches = []
+
+    async def complete(self, topic, conversations):
+        self.batches.append((topic, len(conversations)))
+        await asyncio.sleep(self.latency)
+        return [reply_for(c) for c in conversations]
+
+
+@pytest.mark.asyncio
+class TestMicroBatcher:
+    """Test batching windows and fan-out."""
+
+    async def test_groups_by_topic_and_fans_out(self):
+        """Test that concurrent turns share batches per topic and get their own replies."""
+        backend = LocalBatchBackend()
+        batcher = MicroBatcher(backend, max_size=8, max_wait=0.02)
+        turns = [(f"topic{i % 2}", [{"role": "user", "content": f"m{i}"}]) for i in range(8)]
+        replies = await asyncio.gather(*(batcher.submit(t, m) for t, m in turns))
+        assert [json.loads(r)["question"] for r in replies] == [f"re: m{i}" for i in range(8)]
+        assert sorted(backend.batches) == [("topic0", 4), ("topic1", 4)]
+
+    async def test_full_batch_sent_without_waiting(self):
+        """Test that reaching max_size flushes before the window ends."""
+        backend = LocalBatchBackend(latency=0)
+        batcher = MicroBatcher(backend, max_size=4, max_wait=10)
+        started = time.perf_counter()
+        await asyncio.gather(*(batcher.submit("t", [{"role": "user", "content": str(i)}]) for i in range(4)))
+        assert time.perf_counter() - started < 1
+        assert backend.batches == [("t", 4)]
+
+    async def test_wait_bounded_by_window(self):
+        """Test that a lone turn is sent after max_wait."""
+        backend = LocalBatchBackend(latency=0)
+        batcher = MicroBatcher(backend, max_size=8, max_wait=0.05)
+        started = time.perf_counter()
+        await batcher.submit("t", [{"role": "user", "content": "solo"}])
+        assert 0.04 <= time.perf_counter() - started < 0.5
+        assert batcher.snapshot()["batches"] == 1
+
+    async def test_errors_reach_every_caller(self):
+        """Test that a failed batch raises in each waiting turn."""
+        class Failing(BatchBackend):
+            async def complete(self, topic, conversations):
+                raise RuntimeError("quota")
+
+        batcher = MicroBatcher(Failing(), max_size=2, max_wait=0.01)
+        results = await asyncio.gather(
+            batcher.submit("t", []), batcher.submit("t", []), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def test_throughput_beats_one_request_per_turn(self):
+        """Test that 64 turns over 2 topics need far fewer round-trips than turns."""
+        backend = LocalBatchBackend(latency=0.01)
+        batcher = MicroBatcher(backend, max_size=16, max_wait=0.01)
+        await asyncio.gather(*(
+            batcher.submit(f"t{i % 2}", [{"role": "user", "content": str(i)}]) for i in range(64)
+        ))
+        assert len(backend.batches) <= 8
+        assert batcher.snapshot()["mean_size"] >= 8
+
+
+class FakeCompletions:
+    def __init__(self, drop=()):
+        self.calls = []
+        self.drop = set(drop)
+
+    async def create(self, messages, **kwargs):
+        self.calls.append(messages)
+        sessions = json.loads(messages[1]["content"])["sessions"]
+        replies = [
+            {"id": s["id"], "reasoning": "r", "confusion_score": 40, "question": s["conversation"][-1]["content"]}
+            for s in sessions if s["id"] not in self.drop
+        ]
+        content = json.dumps({"replies": replies})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.mark.asyncio
+class TestBackends:
+    """Test the packed and concurrent backends."""
+
+    async def test_packed_sends_one_request(self):
+        """Test that a batch becomes one completion with the system prompt sent once."""
+        completions = FakeCompletions()
+        singles = []
+
+        async def complete_one(messages):
+            singles.append(messages)
+            return reply_for(messages), None
+
+        backend = PackedBatchBackend(SimpleNamespace(chat=SimpleNamespace(completions=completions)), complete_one)
+        conversations = [build_student_messages("Python", [], f"turn {i}") for i in range(3)]
+        replies = await backend.complete("Python", conversations)
+
+        assert len(completions.calls) == 1 and not singles
+        assert completions.calls[0][0]["content"].count("Jamie") == conversations[0][0]["content"].count("Jamie")
+        assert [json.loads(r)["question"] for r in replies] == [f"turn {i}" for i in range(3)]
+        assert all("id" not in json.loads(r) for r in replies)
+
+    async def test_packed_retries_missing_sessions(self):
+        """Test that sessions the model skipped are completed on their own."""
+        completions = FakeCompletions(drop={1})
+
+        async def complete_one(messages):
+            return reply_for(messages, score=70), None
+
+        backend = PackedBatchBackend(SimpleNamespace(chat=SimpleNamespace(completions=completions)), complete_one)
+        replies = await backend.complete("Python", [build_student_messages("Python", [], str(i)) for i in range(3)])
+        assert json.loads(replies[1])["confusion_score"] == 70
+        assert backend.missing == 1
+
+    async def test_concurrent_records_usage(self):
+        """Test that the concurrent backend reports each usage."""
+        seen = []
+
+        async def complete_one(messages):
+            return reply_for(messages), "usage"
+
+        backend = ConcurrentBatchBackend(complete_one, seen.append)
+        assert len(await backend.complete("t", [[{"role": "user", "content": "a"}]] * 3)) == 3
+        assert seen == ["usage"] * 3
+
+
+class TestCreateBatcher:
+    """Test the engine's batcher configuration."""
+
+    def test_concurrent_by_default(self, monkeypatch):
+        """Test that batching defaults to the backend that does not slow turns down."""
+        monkeypatch.setattr(batching, "BATCHING_ENABLED", True)
+        batcher = create_batcher(SimpleNamespace(), None)
+        assert isinstance(batcher.backend, ConcurrentBatchBackend)
+        assert batcher.max_size == batching.BATCH_MAX_SIZE
+
+    def test_packed_batches_are_capped(self, monkeypatch):
+        """Test that packed batches stay small, since their latency grows with size."""
+        monkeypatch.setattr(batching, "BATCHING_ENABLED", True)
+        monkeypatch.setattr(batching, "BATCH_BACKEND", "packed")
+        monkeypatch.setattr(batching, "BATCH_MAX_SIZE", 8)
+        monkeypatch.setattr(batching, "BATCH_PACKED_MAX_SIZE", 3)
+        batcher = create_batcher(SimpleNamespace(), None)
+        assert isinstance(batcher.backend, PackedBatchBackend)
+        assert batcher.max_size == 3
+
+
+@pytest.mark.asyncio
+class TestBatchedStudentTurns:
+    """Test batching through generate_student_response."""
+
+    async def test_turns_from_many_users_are_batched(self, monkeypatch):
+        """Test that concurrent users on one topic share batches and keep their own history."""
+        backend = LocalBatchBackend()
+        monkeypatch.setattr(consumer, "batcher", MicroBatcher(backend, max_size=8, max_wait=0.02))
+        store = InMemoryHistoryStore()
+        client = SimpleNamespace()
+
+        results = await asyncio.gather(*(
+            consumer.generate_student_response(f"msg {u}", "Python", f"u{u}", client, store) for u in range(8)
+        ))
+
+        assert backend.batches == [("Python", 8)]
+        for u, result in enumerate(results):
+            assert result["question"] == f"re: The teacher says: 'msg {u}'"
+            assert (await store.get(f"u{u}"))[0]["content"] == f"The teacher says: 'msg {u}'"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,252 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.cache import GreetingCache, ResponseCache, TurnDeduplicator, response_key, turn_key
+from app.history import InMemoryHistoryStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class GreetingGenerator:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self, topic):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("LLM down")
+        return {"question": f"Hi, teach me {topic} #{self.calls}", "score": 0, "reasoning": ""}
+
+
+@pytest.mark.asyncio
+class TestGreetingCache:
+    """Test pooled greeting variants and background refill."""
+
+    async def test_miss_then_background_refill(self):
+        """Test that the first miss fills the pool to the variant target."""
+        cache = GreetingCache(variants=3)
+        generate = GreetingGenerator()
+
+        first = await cache.get("Python", generate)
+        await asyncio.sleep(0.01)
+
+        assert first["question"] == "Hi, teach me Python #1"
+        assert generate.calls == 3
+        assert cache.stats.misses == 1
+
+    async def test_hits_serve_variants(self):
+        """Test that later sessions are served from the pool with variety."""
+        cache = GreetingCache(variants=4)
+        generate = GreetingGenerator()
+        cache.prefetch(["Python"], generate)
+        await asyncio.sleep(0.01)
+
+        questions = {(await cache.get("Python", generate))["question"] for _ in range(50)}
+
+        assert generate.calls == 4
+        assert len(questions) > 1
+        assert cache.stats.hits == 50
+        assert cache.snapshot()["hit_ratio"] == 1.0
+
+    async def test_expired_variants_are_regenerated(self):
+        """Test that variants older than the TTL are not served."""
+        clock = FakeClock()
+        cache = GreetingCache(variants=1, ttl=10, clock=clock)
+        generate = GreetingGenerator()
+        await cache.get("Python", generate)
+        clock.now = 11
+        second = await cache.get("Python", generate)
+        assert second["question"] == "Hi, teach me Python #2"
+        assert cache.stats.misses == 2
+
+    async def test_topic_count_is_bounded(self):
+        """Test that least recently used topics are dropped."""
+        cache = GreetingCache(variants=1, max_topics=2)
+        generate = GreetingGenerator()
+        for topic in ("a", "b", "c"):
+            await cache.get(topic, generate)
+        assert cache.snapshot()["topics"] == 2
+        assert cache.stats.evictions == 1
+
+    async def test_failures_propagate_and_are_not_cached(self):
+        """Test that a failing generator raises and leaves no entry."""
+        cache = GreetingCache()
+        with pytest.raises(RuntimeError):
+            await cache.get("Python", GreetingGenerator(fail=True))
+        assert cache.snapshot()["topics"] == 0
+
+    async def test_close_cancels_refills(self):
+        """Test that close stops background refills."""
+        cache = GreetingCache(variants=100)
+
+        async def slow(topic):
+            await asyncio.sleep(10)
+
+        cache.prefetch(["Python"], slow)
+        await cache.close()
+        assert cache._refills == {}
+
+
+class TestResponseCache:
+    """Test the exact-match turn cache."""
+
+    def test_key_depends_on_all_inputs(self):
+        """Test that topic, history and message all change the key."""
+        history = [{"role": "user", "content": "x"}]
+        base = response_key("Python", history, "hi")
+        assert base == response_key("Python", list(history), "hi")
+        assert base != response_key("Rust", history, "hi")
+        assert base != response_key("Python", [], "hi")
+        assert base != response_key("Python", history, "hello")
+
+    def test_hit_miss_and_saved_latency(self):
+        """Test hit ratio and saved-latency accounting."""
+        cache = ResponseCache()
+        assert cache.get("k") is None
+        cache.put("k", "{}", seconds=2.0)
+        assert cache.get("k") == "{}"
+        assert cache.get("k") == "{}"
+        assert cache.snapshot()["saved_seconds"] == 4.0
+
+    def test_ttl_and_lru(self):
+        """Test expiry and the entry cap."""
+        clock = FakeClock()
+        cache = ResponseCache(max_entries=2, ttl=5, clock=clock)
+        cache.put("a", "1", 0.1)
+        cache.put("b", "2", 0.1)
+        cache.put("c", "3", 0.1)
+        assert cache.get("a") is None
+        clock.now = 6
+        assert cache.get("b") is None
+
+
+@pytest.mark.asyncio
+class TestResponseCacheInConsumer:
+    """Test exact-match caching in generate_student_response."""
+
+    async def test_identical_turn_skips_llm_but_records_history(self, monkeypatch):
+        """Test that a repeated turn is served from cache and still stored."""
+        monkeypatch.setattr(consumer, "response_cache", ResponseCache())
+        calls = 0
+
+        async def create(**kwargs):
+            nonlocal calls
+            calls += 1
+            content = json.dumps({"reasoning": "", "confusion_score": 12, "question": "Example?"})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        first_user, second_user = InMemoryHistoryStore(), InMemoryHistoryStore()
+
+        first = await consumer.generate_student_response("Lists are mutable", "Python", "a", client, first_user)
+        second = await consumer.generate_student_response("Lists are mutable", "Python", "b", client, second_user)
+
+        assert calls == 1
+        assert first == second
+        assert len(await second_user.get("b")) == 2
+
+
+class Generation:
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("publish failed")
+        return {"question": f"answer #{self.calls}"}
+
+
+@pytest.mark.asyncio
+class TestTurnDeduplicator:
+    """Test singleflight and recent-result sharing between copies of one event."""
+
+    async def test_concurrent_copies_share_one_generation(self):
+        """Test that copies arriving while the first runs await its result."""
+        dedupe = TurnDeduplicator()
+        generate = Generation(delay=0.01)
+        key = turn_key("u1", "m1", "Python", "a list keeps order")
+        results = await asyncio.gather(*(dedupe.run(key, generate) for _ in range(5)))
+        assert generate.calls == 1
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert {r["question"] for r, _ in results} == {"answer #1"}
+        assert dedupe.snapshot() == {"generated": 1, "coalesced": 4, "recent_hits": 0, "entries": 1}
+
+    async def test_recent_copies_reuse_result_until_ttl(self):
+        """Test that a late copy within the TTL is answered from memory."""
+        clock = FakeClock()
+        dedupe = TurnDeduplicator(ttl=60, clock=clock)
+        generate = Generation()
+        await dedupe.run("k", generate)
+        clock.now = 59
+        assert await dedupe.run("k", generate) == ({"question": "answer #1"}, True)
+        clock.now = 120
+        assert await dedupe.run("k", generate) == ({"question": "answer #2"}, False)
+
+    async def test_key_prefers_message_id(self):
+        """Test that a message id identifies an event and otherwise user, topic and text do."""
+        assert turn_key("u1", "m1", "Python", "hi") == turn_key("u1", "m1", "Python", "hi again")
+        keyed = {turn_key("u1", "m1", "Python", "hi"), turn_key("u2", "m1", "Python", "hi"), turn_key("u1", "m2", "Python", "hi")}
+        assert len(keyed) == 3
+        base = turn_key("u1", None, "Python", "hi")
+        assert base == turn_key("u1", None, "Python", "hi")
+        unkeyed = {base, turn_key("u2", None, "Python", "hi"), turn_key("u1", None, "Java", "hi"), turn_key("u1", None, "Python", "hi!")}
+        assert len(unkeyed) == 4 and not unkeyed & keyed
+
+    async def test_per_call_ttl(self):
+        """Test that a shorter TTL given to run applies to that key only."""
+        clock = FakeClock()
+        dedupe = TurnDeduplicator(ttl=60, clock=clock)
+        generate = Generation()
+        await dedupe.run("unkeyed", generate, ttl=10)
+        await dedupe.run("keyed", generate)
+        clock.now = 11
+        assert (await dedupe.run("unkeyed", generate))[1] is False
+        assert (await dedupe.run("keyed", generate))[1] is True
+
+    async def test_failure_is_shared_but_not_remembered(self):
+        """Test that waiting copies see the failure and a later copy retries."""
+        dedupe = TurnDeduplicator()
+        failing = Generation(delay=0.01, fail=True)
+        results = await asyncio.gather(dedupe.run("k", failing), dedupe.run("k", failing), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert failing.calls == 1
+        assert await dedupe.run("k", Generation()) == ({"question": "answer #1"}, False)
+
+    async def test_cancelled_copy_does_not_cancel_first(self):
+        """Test that cancelling a waiting duplicate leaves the generation running."""
+        dedupe = TurnDeduplicator()
+        generate = Generation(delay=0.02)
+        first = asyncio.create_task(dedupe.run("k", generate))
+        await asyncio.sleep(0)
+        copy = asyncio.create_task(dedupe.run("k", generate))
+        await asyncio.sleep(0)
+        copy.cancel()
+        assert await first == ({"question": "answer #1"}, False)
+
+    async def test_memory_is_bounded(self):
+        """Test that only the most recent results are kept."""
+        dedupe = TurnDeduplicator(max_entries=2)
+        for key in ("a", "b", "c"):
+            await dedupe.run(key, Generation())
+        assert dedupe.snapshot()["entries"] == 2
+        assert (await dedupe.run("a", Generation()))[1] is False
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+
+from app import consumer
+from app.codec import JSON, ChatEvent, InvalidEvent, codec_for, dead_letter_headers, decode_event
+from app.history import InMemoryHistoryStore
+from benchmarks.harness import InMemoryConsumer, InMemoryProducer
+
+
+def encoded(event):
+    return json.dumps(event).encode("utf-8")
+
+
+class TestDecodeEvent:
+    """Test decoding and validation of inbound records."""
+
+    def test_valid_event(self):
+        """Test that fields are mapped and defaults applied."""
+        event, codec = decode_event(encoded({"userId": "u1", "message": "hi", "timestamp": "t"}))
+        assert event == ChatEvent("u1", "hi", "Computer Science", "t", False)
+        assert codec is JSON
+
+    def test_message_id(self):
+        """Test that the client's messageId is carried and an empty one reads as not given."""
+        event, _ = decode_event(encoded({"userId": "u1", "message": "hi", "messageId": "m1"}))
+        assert event.message_id == "m1"
+        event, _ = decode_event(encoded({"userId": "u1", "message": "hi", "messageId": ""}))
+        assert event.message_id is None
+
+    def test_initial_greeting_needs_no_message(self):
+        """Test that a session start may omit the message."""
+        event, _ = decode_event(encoded({"userId": "u1", "isInitial": True, "topic": "Rust"}))
+        assert event.is_initial and event.message == "" and event.topic == "Rust"
+
+    def test_null_optional_fields_use_defaults(self):
+        """Test that null topic, isInitial and initial message read as not given."""
+        event, _ = decode_event(encoded({"userId": "u1", "message": "hi", "topic": None, "isInitial": None}))
+        assert event.topic == "Computer Science" and not event.is_initial
+        event, _ = decode_event(encoded({"userId": "u1", "message": None, "topic": " ", "isInitial": True}))
+        assert event.message == "" and event.topic == "Computer Science"
+
+    def test_numeric_user_id_is_a_string(self):
+        """Test that an integer userId becomes the same string key."""
+        event, _ = decode_event(encoded({"userId": 42, "message": "hi"}))
+        assert event.user_id == "42"
+
+    @pytest.mark.parametrize("value", [
+        b"{not json",
+        encoded(["a list"]),
+        encoded({"message": "no user"}),
+        encoded({"userId": "", "message": "hi"}),
+        encoded({"userId": "u1"}),
+        encoded({"userId": "u1", "message": 3}),
+        encoded({"userId": "u1", "message": "hi", "isInitial": "yes"}),
+        encoded({"userId": "u1", "message": "hi", "topic": 7}),
+        encoded({"userId": "u1", "message": "hi", "messageId": 7}),
+        None,
+    ])
+    def test_rejects_invalid(self, value):
+        """Test that malformed or incomplete records raise InvalidEvent."""
+        with pytest.raises(InvalidEvent):
+            decode_event(value)
+
+    def test_slots(self):
+        """Test that events carry no per-instance dict."""
+        assert not hasattr(ChatEvent("u1", "hi"), "__dict__")
+
+
+class TestCodecNegotiation:
+    """Test content-type header handling."""
+
+    def test_json_without_header(self):
+        """Test that JSON is the default and is sent without a header."""
+        assert codec_for(None) is JSON
+        assert codec_for([("content-type", b"application/json; charset=utf-8")]) is JSON
+        assert JSON.headers is None
+
+    def test_unknown_content_type(self):
+        """Test that an unsupported framing is rejected, not guessed."""
+        with pytest.raises(InvalidEvent):
+            codec_for([("content-type", b"application/xml")])
+
+    def test_msgpack_round_trip(self):
+        """Test MessagePack decoding when msgpack is installed."""
+        msgpack = pytest.importorskip("msgpack")
+        headers = [("content-type", b"application/msgpack")]
+        event, codec = decode_event(msgpack.packb({"userId": "u1", "message": "hi"}), headers)
+        assert event.user_id == "u1"
+        assert codec.headers == headers
+        assert codec.loads(codec.dumps({"a": 1})) == {"a": 1}
+
+    def test_dead_letter_headers(self):
+        """Test that the reason and source are appended to the original headers."""
+        headers = dead_letter_headers(InvalidEvent("bad"), "chat.input", 2, 9, [("trace", b"x")])
+        assert headers == [("trace", b"x"), ("dlq-error", b"InvalidEvent: bad"), ("dlq-source", b"chat.input:2:9")]
+
+
+@pytest.mark.asyncio
+class TestDeadLetters:
+    """Test that bad records are parked instead of crashing the engine."""
+
+    async def run_engine(self, monkeypatch, records):
+        for name in ("response_cache", "batcher", "summaries", "score_log"):
+            monkeypatch.setattr(consumer, name, None)
+        source = InMemoryConsumer(consumer.CHAT_INPUT_TOPIC)
+        sent = []
+        producer = InMemoryProducer(on_record=lambda topic, key, value, headers: sent.append((topic, value, headers)))
+        for value in records:
+            source.put_raw(value)
+        source.close()
+        await asyncio.wait_for(consumer.run(source, producer, None, InMemoryHistoryStore()), 10)
+        return source, sent
+
+    async def test_invalid_records_go_to_dlq_and_are_committed(self, monkeypatch):
+        """Test that invalid records are dead-lettered while valid ones are answered."""
+        source, sent = await self.run_engine(monkeypatch, [
+            b"{oops",
+            encoded({"userId": "u1", "message": "a list keeps order", "timestamp": 1}),
+            encoded({"message": "who am I"}),
+        ])
+        dead = [(value, dict(headers)) for topic, value, headers in sent if topic == consumer.DEAD_LETTER_TOPIC]
+        assert [value for value, _ in dead] == [b"{oops", encoded({"message": "who am I"})]
+        assert dead[1][1]["dlq-source"] == f"{consumer.CHAT_INPUT_TOPIC}:0:2".encode()
+        assert [topic for topic, _, _ in sent].count(consumer.CHAT_OUTPUT_TOPIC) == 1
+        assert source.committed == {(consumer.CHAT_INPUT_TOPIC, 0): 3}
+
+    async def test_failed_event_is_dead_lettered(self, monkeypatch):
+        """Test that an event whose processing raises is parked and its offset released."""
+        async def failing(*args, **kwargs):
+            raise ConnectionError("broker unavailable")
+
+        monkeypatch.setattr(consumer, "process_chat_event", failing)
+        source, sent = await self.run_engine(monkeypatch, [encoded({"userId": "u1", "message": "hi"})])
+        (topic, _, headers), = sent
+        assert topic == consumer.DEAD_LETTER_TOPIC
+        assert dict(headers)["dlq-error"].startswith(b"ConnectionError")
+        assert source.committed == {(consumer.CHAT_INPUT_TOPIC, 0): 1}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
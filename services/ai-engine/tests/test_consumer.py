@@ -83,11 +83,14 @@ class TestProcessChatEvent:
     @pytest.mark.asyncio
     async def test_process_chat_event_structure(self):
         """Test that process_chat_event handles event structure correctly."""
+        import asyncio
         from unittest.mock import AsyncMock, MagicMock
         from app.consumer import process_chat_event
 
+        delivered = asyncio.get_running_loop().create_future()
+        delivered.set_result(None)
         mock_producer = AsyncMock()
-        mock_producer.send_and_wait = AsyncMock()
+        mock_producer.send = AsyncMock(return_value=delivered)
 
         event = {
             "userId": "test_user",
@@ -97,8 +100,8 @@ class TestProcessChatEvent:
 
         await process_chat_event(mock_producer, event)
 
-        # Should have been called twice (output and score)
-        assert mock_producer.send_and_wait.call_count == 2
+        # Should have been called twice (output and score), pipelined
+        assert mock_producer.send.call_count == 2
 
 
 if __name__ == "__main__":
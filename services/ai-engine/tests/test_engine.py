@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.llm import LLMClient
+from app.offsets import OffsetTracker
+from benchmarks.harness import InMemoryConsumer, InMemoryProducer, MockLLMServer, check_history
+
+
+@pytest.mark.asyncio
+class TestRunLoop:
+    """Test the engine's main loop against an in-memory broker and mock LLM."""
+
+    async def test_replays_sessions_end_to_end(self, monkeypatch):
+        """Test that every turn is answered once and histories stay per-user and ordered."""
+        # run() installs its own batcher, summaries and score log; restore them afterwards
+        for name in ("response_cache", "batcher", "summaries", "score_log"):
+            monkeypatch.setattr(consumer, name, None)
+        llm = MockLLMServer(median_ms=5, sigma=0.2)
+        await llm.start()
+        client = LLMClient("sk-test", base_url=llm.base_url, max_retries=0)
+        history = InMemoryHistoryStore()
+        source = InMemoryConsumer(consumer.CHAT_INPUT_TOPIC)
+        outputs = []
+        producer = InMemoryProducer(
+            on_record=lambda topic, key, value, headers: outputs.append(json.loads(value))
+            if topic == consumer.CHAT_OUTPUT_TOPIC else None
+        )
+        sent = {}
+        for turn in range(3):
+            for user in ("u1", "u2", "u3"):
+                message = f"[{user} #{turn}] explanation"
+                sent.setdefault(user, []).append(message)
+                source.put({"userId": user, "message": message, "topic": "Python", "timestamp": f"{user}-{turn}"})
+        source.close()
+
+        try:
+            await asyncio.wait_for(consumer.run(source, producer, client, history), 10)
+        finally:
+            await llm.stop()
+
+        assert sorted(o["timestamp"] for o in outputs) == sorted(f"{u}-{t}" for u in sent for t in range(3))
+        stored = {user: await history.get(user) for user in sent}
+        assert all(len(messages) == 6 for messages in stored.values())
+        assert check_history(stored, sent) == {"users_checked": 3, "mismatched_replies": 0, "out_of_order_turns": 0}
+        assert source.committed == {(consumer.CHAT_INPUT_TOPIC, 0): 9}
+        keys = sorted(o["idempotencyKey"] for o in outputs)
+        assert keys == sorted(f"{consumer.CHAT_INPUT_TOPIC}:0:{offset}" for offset in range(9))
+
+    async def test_duplicate_events_are_answered_once(self, monkeypatch):
+        """Test that repeated copies of an event cost one LLM call and one history turn."""
+        for name in ("response_cache", "batcher", "summaries", "score_log"):
+            monkeypatch.setattr(consumer, name, None)
+        llm = MockLLMServer(median_ms=5, sigma=0.2)
+        await llm.start()
+        client = LLMClient("sk-test", base_url=llm.base_url, max_retries=0)
+        history = InMemoryHistoryStore()
+        source = InMemoryConsumer(consumer.CHAT_INPUT_TOPIC)
+        outputs = []
+        producer = InMemoryProducer(
+            on_record=lambda topic, key, value, headers: outputs.append(json.loads(value))
+            if topic == consumer.CHAT_OUTPUT_TOPIC else None
+        )
+        event = {"userId": "u1", "message": "a set has no order", "topic": "Python", "messageId": "m1"}
+        for resend in range(3):  # reconnect resends get a new gateway timestamp; a redelivery too
+            source.put({**event, "timestamp": f"t1-{resend}"})
+        source.put({**event, "messageId": "m2", "timestamp": "t2"})  # the same words sent again are a new turn
+        source.close()
+
+        try:
+            await asyncio.wait_for(consumer.run(source, producer, client, history), 10)
+        finally:
+            await llm.stop()
+
+        assert llm.requests == 2
+        assert len(await history.get("u1")) == 4
+        # Keyed on the message id, so a copy answered on another worker is dropped by the gateway too
+        assert [o["idempotencyKey"] for o in outputs] == ["msg:u1:m1"] * 3 + ["msg:u1:m2"]
+        assert source.committed == {(consumer.CHAT_INPUT_TOPIC, 0): 4}
+
+    async def test_events_without_message_id_match_on_text(self, monkeypatch):
+        """Test that id-less copies with fresh gateway timestamps are still answered once."""
+        for name in ("response_cache", "batcher", "summaries", "score_log"):
+            monkeypatch.setattr(consumer, name, None)
+        llm = MockLLMServer(median_ms=5, sigma=0.2)
+        await llm.start()
+        client = LLMClient("sk-test", base_url=llm.base_url, max_retries=0)
+        history = InMemoryHistoryStore()
+        source = InMemoryConsumer(consumer.CHAT_INPUT_TOPIC)
+        event = {"userId": "u1", "message": "a set has no order", "topic": "Python"}
+        for resend in range(2):
+            source.put({**event, "timestamp": f"t{resend}"})
+        source.put({**event, "topic": "Java", "timestamp": "t2"})
+        source.close()
+
+        try:
+            await asyncio.wait_for(consumer.run(source, InMemoryProducer(), client, history), 10)
+        finally:
+            await llm.stop()
+
+        assert llm.requests == 2
+        assert len(await history.get("u1")) == 4
+
+
+@pytest.mark.asyncio
+class TestThroughputLog:
+    """Test the periodic per-worker throughput line."""
+
+    async def test_reports_events_per_interval(self, monkeypatch, capsys):
+        """Test that the rate counts events finished since the previous line."""
+        monkeypatch.setattr(consumer, "WORKER_ID", "2")
+        offsets = OffsetTracker()
+        for offset in range(5):
+            offsets.track("chat.input", 0, offset)
+            offsets.done("chat.input", 0, offset)
+        reporter = asyncio.create_task(consumer._log_throughput(offsets, 0.05))
+        await asyncio.sleep(0)
+        offsets.track("chat.input", 0, 5)
+        offsets.done("chat.input", 0, 5)
+        offsets.track("chat.input", 0, 6)
+        await asyncio.sleep(0.07)
+        reporter.cancel()
+        line = capsys.readouterr().out.strip().splitlines()[0]
+        assert line == "AI Engine worker 2 throughput: 20.0 events/s (6 total, 1 outstanding)"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,173 @@
+import pytest
+
+from app.history import (
+    InMemoryHistoryBackend,
+    InMemoryHistoryStore,
+    ReadThroughHistoryStore,
+    message_size,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def msg(content, role="user"):
+    return {"role": role, "content": content}
+
+
+class TestInMemoryHistoryStoreInit:
+    """Test store construction."""
+
+    def test_rejects_zero_users(self):
+        """Test that a store must hold at least one user."""
+        with pytest.raises(ValueError):
+            InMemoryHistoryStore(max_users=0)
+
+
+@pytest.mark.asyncio
+class TestInMemoryHistoryStore:
+    """Test bounds, eviction and stats of the in-process store."""
+
+    async def test_get_unknown_user_is_miss(self):
+        """Test that an unknown user returns an empty history and counts a miss."""
+        store = InMemoryHistoryStore()
+        assert await store.get("nobody") == []
+        assert store.stats()["misses"] == 1
+        assert len(store) == 0
+
+    async def test_append_and_get_returns_copy(self):
+        """Test that history round-trips and callers cannot mutate it."""
+        store = InMemoryHistoryStore()
+        await store.append("u1", msg("a"), msg("b", "assistant"))
+        history = await store.get("u1")
+        history.append(msg("c"))
+        assert [m["content"] for m in await store.get("u1")] == ["a", "b"]
+        assert store.stats()["hits"] == 2
+
+    async def test_messages_capped_per_user(self):
+        """Test that only the newest max_messages are kept."""
+        store = InMemoryHistoryStore(max_messages=3, trim_step=1)
+        for i in range(5):
+            await store.append("u1", msg(str(i)))
+        assert [m["content"] for m in await store.get("u1")] == ["2", "3", "4"]
+
+    async def test_trim_in_steps(self):
+        """Test that overflow is dropped in whole trim steps."""
+        store = InMemoryHistoryStore(max_messages=6, trim_step=4)
+        for i in range(7):
+            await store.append("u1", msg(str(i)))
+        assert [m["content"] for m in await store.get("u1")] == ["4", "5", "6"]
+
+    async def test_lru_eviction(self):
+        """Test that the least recently used user is evicted at capacity."""
+        store = InMemoryHistoryStore(max_users=2)
+        await store.append("a", msg("a"))
+        await store.append("b", msg("b"))
+        await store.get("a")
+        await store.append("c", msg("c"))
+        assert await store.get("b") == []
+        assert await store.get("a") != []
+        assert store.stats()["evictions"] == 1
+
+    async def test_idle_ttl(self):
+        """Test that idle users expire on read and during writes."""
+        clock = FakeClock()
+        store = InMemoryHistoryStore(ttl_seconds=10, clock=clock)
+        await store.append("a", msg("a"))
+        await store.append("b", msg("b"))
+        clock.now = 5
+        await store.get("b")
+        clock.now = 12
+        await store.append("c", msg("c"))
+        assert len(store) == 2
+        clock.now = 20
+        assert await store.get("b") == []
+        assert store.stats()["expirations"] == 2
+
+    async def test_byte_accounting_and_cap(self):
+        """Test that sizes are tracked and the byte cap evicts old users."""
+        one = message_size(msg("x" * 100))
+        store = InMemoryHistoryStore(max_bytes=one * 2)
+        await store.append("a", msg("x" * 100))
+        await store.append("b", msg("x" * 100))
+        assert store.stats()["bytes"] == one * 2
+        await store.append("c", msg("x" * 100))
+        assert store.stats()["bytes"] == one * 2
+        assert await store.get("a") == []
+
+    async def test_clear(self):
+        """Test that clear forgets the user and releases its bytes."""
+        store = InMemoryHistoryStore()
+        await store.append("a", msg("hello"))
+        await store.clear("a")
+        await store.clear("missing")
+        assert store.stats()["users"] == 0
+        assert store.stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+class TestReadThroughHistoryStore:
+    """Test the cached store over a shared backend."""
+
+    async def test_hot_reads_stay_local(self):
+        """Test that repeat reads are served from the cache."""
+        backend = InMemoryHistoryBackend()
+        store = ReadThroughHistoryStore(backend)
+        await store.append("u1", msg("a"))
+        for _ in range(5):
+            assert [m["content"] for m in await store.get("u1")] == ["a"]
+        assert backend.loads == 1
+        assert store.stats()["backend_writes"] == 1
+
+    async def test_new_users_do_not_repeat_backend_reads(self):
+        """Test that an empty history is cached after one miss."""
+        backend = InMemoryHistoryBackend()
+        store = ReadThroughHistoryStore(backend)
+        await store.get("new")
+        await store.get("new")
+        assert backend.loads == 1
+
+    async def test_history_survives_restart(self):
+        """Test that a fresh store over the same backend sees prior turns."""
+        backend = InMemoryHistoryBackend()
+        first = ReadThroughHistoryStore(backend)
+        await first.append("u1", msg("a"), msg("b", "assistant"))
+        restarted = ReadThroughHistoryStore(backend)
+        assert [m["content"] for m in await restarted.get("u1")] == ["a", "b"]
+
+    async def test_rebalance_to_other_replica(self):
+        """Test that a second replica continues the conversation."""
+        backend = InMemoryHistoryBackend()
+        replica_a = ReadThroughHistoryStore(backend)
+        replica_b = ReadThroughHistoryStore(backend)
+        await replica_a.append("u1", msg("turn 1"))
+        await replica_b.append("u1", msg("turn 2"))
+        assert [m["content"] for m in await replica_b.get("u1")] == ["turn 1", "turn 2"]
+
+    async def test_remote_update_invalidates_cache(self):
+        """Test that a backend notification drops the stale cached copy."""
+        backend = InMemoryHistoryBackend()
+        store = ReadThroughHistoryStore(backend)
+        await store.append("u1", msg("old"))
+        await backend.save("u1", [msg("new")])
+        backend.notify("u1")
+        assert [m["content"] for m in await store.get("u1")] == ["new"]
+
+    async def test_trims_and_clears(self):
+        """Test that writes are trimmed to the cache cap and clear deletes."""
+        backend = InMemoryHistoryBackend()
+        store = ReadThroughHistoryStore(backend, InMemoryHistoryStore(max_messages=2, trim_step=1))
+        await store.append("u1", msg("a"), msg("b"), msg("c"))
+        assert [m["content"] for m in await backend.load("u1")] == ["b", "c"]
+        await store.clear("u1")
+        assert await backend.load("u1") is None
+        assert await store.get("u1") == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
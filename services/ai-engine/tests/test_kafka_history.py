@@ -0,0 +1,219 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.history import ReadThroughHistoryStore
+from app.kafka_history import KafkaHistoryBackend
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value=None, key=None, headers=None):
+        self.sent.append(SimpleNamespace(topic=topic, key=key, value=value, headers=headers))
+
+
+def record(user_id, messages, origin=b"other-replica", partition=0):
+    value = None if messages is None else json.dumps(messages).encode("utf-8")
+    return SimpleNamespace(key=user_id.encode("utf-8"), value=value, headers=[("origin", origin)], partition=partition)
+
+
+def msg(content):
+    return {"role": "user", "content": content}
+
+
+@pytest.mark.asyncio
+class TestKafkaHistoryBackend:
+    """Test snapshot records, restore and cross-replica updates."""
+
+    async def test_save_and_delete_produce_keyed_records(self):
+        """Test that saves are keyed snapshots and deletes are tombstones."""
+        producer = FakeProducer()
+        backend = KafkaHistoryBackend(producer, ["kafka:9092"], topic="chat.history", instance_id="me")
+        await backend.save("u1", [msg("a")])
+        await backend.delete("u1")
+
+        saved, deleted = producer.sent
+        assert saved.topic == "chat.history"
+        assert saved.key == b"u1"
+        assert json.loads(saved.value) == [msg("a")]
+        assert saved.headers == [("origin", b"me")]
+        assert deleted.value is None
+        assert await backend.load("u1") is None
+
+    async def test_restore_rebuilds_view(self):
+        """Test that replayed snapshots and tombstones rebuild the latest state."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me")
+        backend.apply(record("u1", [msg("a")], origin=b"me"))
+        backend.apply(record("u1", [msg("a"), msg("b")], origin=b"me"))
+        backend.apply(record("u2", [msg("x")]))
+        backend.apply(record("u2", None))
+
+        assert await backend.load("u1") == [msg("a"), msg("b")]
+        assert await backend.load("u2") is None
+
+    async def test_own_echo_is_ignored_after_restore(self):
+        """Test that the replica's own records do not overwrite newer state."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me")
+        backend._restored = True
+        await backend.save("u1", [msg("a"), msg("b")])
+        backend.apply(record("u1", [msg("a")], origin=b"me"))
+        assert await backend.load("u1") == [msg("a"), msg("b")]
+
+    async def test_remote_write_invalidates_read_through_cache(self):
+        """Test that another replica's write is visible on the next read."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me")
+        backend._restored = True
+        store = ReadThroughHistoryStore(backend)
+        await store.append("u1", msg("mine"))
+
+        backend.apply(record("u1", [msg("mine"), msg("theirs")]))
+
+        assert await store.get("u1") == [msg("mine"), msg("theirs")]
+
+    async def test_view_unbounded_by_default(self):
+        """Test that the restored view does not forget users without a cap."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me", view_max_users=0)
+        for i in range(50):
+            backend.apply(record(f"u{i}", [msg("a")]))
+        assert await backend.load("u0") == [msg("a")]
+
+    async def test_capped_view_logs_evictions(self, capsys):
+        """Test that a capped view reports the users it drops."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me", view_max_users=2)
+        for i in range(3):
+            backend.apply(record(f"u{i}", [msg("a")]))
+        assert await backend.load("u0") is None
+        assert "1 user(s) evicted" in capsys.readouterr().out
+
+
+class FakeLogConsumer:
+    """The history topic as per-partition record lists, read the way aiokafka would."""
+
+    def __init__(self, partitions):
+        self.log = {p: [] for p in range(partitions)}
+        self.positions = {}
+
+    def put(self, rec):
+        self.log[rec.partition].append(rec)
+
+    async def stop(self):
+        pass
+
+    async def seek_to_beginning(self, *tps):
+        for tp in tps:
+            self.positions[tp.partition] = 0
+
+    async def end_offsets(self, tps):
+        return {tp: len(self.log[tp.partition]) for tp in tps}
+
+    async def position(self, tp):
+        return self.positions[tp.partition]
+
+    async def getmany(self, *tps, timeout_ms=0):
+        if not tps:
+            await asyncio.sleep(timeout_ms / 1000)
+            return {}
+        batches = {}
+        for tp in tps:
+            start = self.positions[tp.partition]
+            batches[tp] = self.log[tp.partition][start:]
+            self.positions[tp.partition] = len(self.log[tp.partition])
+        return batches
+
+
+@pytest.mark.asyncio
+class TestScopedView:
+    """Test holding only the users of the assigned input partitions."""
+
+    def scoped(self):
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me", input_topic="chat.input")
+        backend._consumer = FakeLogConsumer(partitions=2)
+        backend._owned = set()
+        backend._restored = True
+        return backend
+
+    async def test_assign_loads_only_assigned_partitions(self):
+        """Test that a newly assigned partition is read from the start, own writes included."""
+        backend = self.scoped()
+        backend._consumer.put(record("u1", [msg("a")], origin=b"me", partition=0))
+        backend._consumer.put(record("u2", [msg("x")], partition=1))
+        await backend.assign([0])
+        try:
+            assert await backend.load("u1") == [msg("a")]
+            assert await backend.load("u2") is None
+        finally:
+            await backend.stop()
+
+    async def test_unassigned_partition_is_dropped(self):
+        """Test that users of a partition taken away leave the view."""
+        backend = self.scoped()
+        backend._consumer.put(record("u1", [msg("a")], partition=0))
+        backend._consumer.put(record("u2", [msg("x")], partition=1))
+        await backend.assign([0, 1])
+        await backend.assign([1])
+        try:
+            assert await backend.load("u1") is None
+            assert await backend.load("u2") == [msg("x")]
+        finally:
+            await backend.stop()
+
+    async def test_other_partitions_only_invalidate_cache(self):
+        """Test that a write on a partition not held is not kept but evicts the cached copy."""
+        backend = self.scoped()
+        await backend.assign([0])
+        store = ReadThroughHistoryStore(backend)
+        await store.append("u2", msg("old"))
+        backend.apply(record("u2", [msg("old"), msg("new")], partition=1))
+        try:
+            assert store.cache.lookup("u2") is None
+            assert await backend.load("u2") is None
+        finally:
+            await backend.stop()
+
+    async def test_unscoped_backend_ignores_assign(self):
+        """Test that a view holding every partition keeps its users on rebalance."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], instance_id="me")
+        backend.apply(record("u1", [msg("a")], partition=1))
+        await backend.assign([0])
+        assert await backend.load("u1") == [msg("a")]
+
+
+class FakeMetadataConsumer:
+    def __init__(self, empty_lookups):
+        self.empty_lookups = empty_lookups
+
+    async def topics(self):
+        return set()
+
+    def partitions_for_topic(self, topic):
+        if self.empty_lookups:
+            self.empty_lookups -= 1
+            return None
+        return {1, 0}
+
+
+@pytest.mark.asyncio
+class TestPartitionMetadata:
+    """Test waiting for the history topic's partitions."""
+
+    async def test_retries_until_partitions_appear(self):
+        """Test that missing metadata right after topic creation is retried."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], topic="chat.history")
+        backend._consumer = FakeMetadataConsumer(empty_lookups=2)
+        partitions = await backend._wait_for_partitions(timeout=5)
+        assert [tp.partition for tp in partitions] == [0, 1]
+
+    async def test_fails_loudly_without_partitions(self):
+        """Test that startup errors instead of assigning no partitions."""
+        backend = KafkaHistoryBackend(FakeProducer(), ["kafka:9092"], topic="chat.history")
+        backend._consumer = FakeMetadataConsumer(empty_lookups=10 ** 6)
+        with pytest.raises(RuntimeError):
+            await backend._wait_for_partitions(timeout=0.2)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
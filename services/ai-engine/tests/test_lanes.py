@@ -0,0 +1,166 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.lanes import KeyedExecutor
+from app.scheduler import BoundedScheduler
+
+
+class FakeCompletions:
+    """Echoes the teacher message back after a random delay."""
+
+    def __init__(self, seed):
+        self._random = random.Random(seed)
+        self.seen = []
+
+    async def create(self, messages, **kwargs):
+        self.seen.append([dict(m) for m in messages])
+        await asyncio.sleep(self._random.uniform(0, 0.005))
+        teacher = messages[-1]["content"]
+        content = json.dumps({"reasoning": "", "confusion_score": 10, "question": f"ack {teacher}"})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value, key=None):
+        self.sent.append((topic, json.loads(value.decode("utf-8"))))
+        delivered = asyncio.get_running_loop().create_future()
+        delivered.set_result(None)
+        return delivered
+
+
+@pytest.mark.asyncio
+class TestKeyedExecutor:
+    """Test per-key ordering and lane reclamation."""
+
+    async def test_same_key_runs_serially_in_order(self):
+        """Test that calls on one key never overlap and keep arrival order."""
+        executor = KeyedExecutor()
+        order = []
+        running = 0
+
+        async def work(i):
+            nonlocal running
+            running += 1
+            assert running == 1
+            await asyncio.sleep(0.001 * (5 - i))
+            order.append(i)
+            running -= 1
+
+        await asyncio.gather(*(executor.run("u1", work, i) for i in range(5)))
+        assert order == [0, 1, 2, 3, 4]
+
+    async def test_different_keys_run_in_parallel(self):
+        """Test that distinct keys do not wait for each other."""
+        executor = KeyedExecutor()
+        gate = asyncio.Event()
+        started = []
+
+        async def work(key):
+            started.append(key)
+            await gate.wait()
+
+        tasks = [asyncio.create_task(executor.run(key, work, key)) for key in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        assert sorted(started) == ["a", "b", "c"]
+        assert executor.active_lanes == 3
+        gate.set()
+        await asyncio.gather(*tasks)
+
+    async def test_idle_lanes_are_reclaimed(self):
+        """Test that a lane disappears once its last call finishes."""
+        executor = KeyedExecutor()
+
+        async def boom():
+            raise RuntimeError("boom")
+
+        await executor.run("a", asyncio.sleep, 0)
+        with pytest.raises(RuntimeError):
+            await executor.run("b", boom)
+        assert executor.active_lanes == 0
+
+
+@pytest.mark.asyncio
+class TestHotUserBacklog:
+    """Test that one user's queued turns do not hold running slots."""
+
+    async def test_backlog_does_not_block_other_users(self):
+        """Test that another user's turn runs while a hot user has a long backlog."""
+        scheduler = BoundedScheduler(4, max_queued=256)
+        lanes = KeyedExecutor()
+        release = asyncio.Event()
+        done = []
+
+        async def hot(i):
+            await release.wait()
+            done.append(("hot", i))
+
+        async def cold():
+            done.append(("cold", 0))
+
+        for i in range(64):
+            await scheduler.submit(lanes.run("hot", scheduler.run, hot, i))
+        task = await scheduler.submit(lanes.run("cold", scheduler.run, cold))
+        await asyncio.wait_for(task, 1)
+
+        assert done == [("cold", 0)]
+        assert scheduler.running == 1
+        assert not scheduler.paused
+        release.set()
+        await scheduler.drain()
+        assert [i for who, i in done if who == "hot"] == list(range(64))
+
+
+@pytest.mark.asyncio
+class TestOrderedHistoryStress:
+    """Fire interleaved turns for many users and check history order."""
+
+    async def test_interleaved_users_keep_history_order(self):
+        """Test that every user's history and outputs follow send order."""
+        users = [f"user-{i}" for i in range(40)]
+        turns = 8
+        history = InMemoryHistoryStore()
+        completions = FakeCompletions(seed=7)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        producer = FakeProducer()
+        scheduler = BoundedScheduler(32)
+        lanes = KeyedExecutor()
+
+        for turn in range(turns):
+            for user in users:
+                event = {"userId": user, "message": f"{user} turn {turn}", "topic": "Python"}
+                await scheduler.submit(
+                    lanes.run(user, consumer.process_chat_event, producer, event, client, history)
+                )
+        await scheduler.drain()
+
+        assert lanes.active_lanes == 0
+        for user in users:
+            messages = await history.get(user)
+            teacher_turns = [m["content"] for m in messages if m["role"] == "user"]
+            assert teacher_turns == [f"The teacher says: '{user} turn {t}'" for t in range(turns)]
+            questions = [
+                event["question"]
+                for topic, event in producer.sent
+                if topic == consumer.CHAT_OUTPUT_TOPIC and event["userId"] == user
+            ]
+            assert questions == [f"ack The teacher says: '{user} turn {t}'" for t in range(turns)]
+
+        # Each request saw the previous turn of the same user as its latest history
+        for messages in completions.seen:
+            current = messages[-1]["content"]
+            user, turn = current.split("'")[1].rsplit(" turn ", 1)
+            if int(turn) > 0:
+                assert messages[-3]["content"] == f"The teacher says: '{user} turn {int(turn) - 1}'"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from app.llm import ConnectionStats, LLMClient, create_llm_client
+
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4-turbo-preview",
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {
+                "role": "assistant",
+                "content": json.dumps({"reasoning": "ok", "confusion_score": 10, "question": "Why?"}),
+            },
+        }
+    ],
+}
+
+
+async def _serve_completions(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Minimal keep-alive HTTP/1.1 server answering every request with COMPLETION."""
+    body = json.dumps(COMPLETION).encode("utf-8")
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+class TestCreateLLMClient:
+    """Test the client factory."""
+
+    @pytest.mark.parametrize("key", ["", "replace-me", "your-openai-api-key-here"])
+    def test_placeholder_keys_return_none(self, key):
+        """Test that missing or example keys select fallback mode."""
+        assert create_llm_client(key) is None
+
+    @pytest.mark.asyncio
+    async def test_real_key_returns_client(self):
+        """Test that a real key builds a pooled client."""
+        client = create_llm_client("sk-test")
+        assert isinstance(client, LLMClient)
+        await client.close()
+
+
+class TestConnectionStats:
+    """Test the connection reuse counters."""
+
+    def test_reuse_counts(self):
+        """Test that requests on a known connection count as reused."""
+        stats = ConnectionStats()
+        connection = type("Connection", (), {})()
+        stats.record([connection])
+        stats.record([connection])
+        stats.record([connection])
+        assert stats.snapshot() == {"requests": 3, "connections_opened": 1, "connections_reused": 2}
+
+
+@pytest.mark.asyncio
+class TestLLMClientPooling:
+    """Test that sequential calls share one keep-alive connection."""
+
+    async def test_sequential_calls_reuse_connection(self):
+        """Test that only the first request opens a connection."""
+        server = await asyncio.start_server(_serve_completions, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = LLMClient("sk-test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+        try:
+            for _ in range(5):
+                response = await client.chat.completions.create(
+                    model="gpt-4-turbo-preview",
+                    messages=[{"role": "user", "content": "hi"}],
+                )
+                assert json.loads(response.choices[0].message.content)["question"] == "Why?"
+            stats = client.connection_stats()
+            assert stats["requests"] == 5
+            assert stats["connections_opened"] == 1
+            assert stats["connections_reused"] == 4
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
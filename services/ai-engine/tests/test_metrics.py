@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.cache import ResponseCache
+from app.history import InMemoryHistoryStore
+from app.metrics import Histogram, Metrics, consumer_lag, serve_metrics
+
+
+class TestHistogram:
+    """Test bucket accounting and exposition format."""
+
+    def test_cumulative_buckets(self):
+        """Test that buckets are cumulative and end with +Inf, sum and count."""
+        histogram = Histogram("h_seconds", "Help.", label="stage", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, "llm")
+        lines = histogram.render()
+        assert 'h_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+        assert 'h_seconds_bucket{stage="llm",le="1.0"} 3' in lines
+        assert 'h_seconds_bucket{stage="llm",le="+Inf"} 4' in lines
+        assert 'h_seconds_sum{stage="llm"} 4.05' in lines
+        assert 'h_seconds_count{stage="llm"} 4' in lines
+
+
+class TestMetrics:
+    """Test enabled and disabled instrumentation."""
+
+    def test_disabled_records_nothing(self):
+        """Test that a disabled registry shares one no-op timer and counts nothing."""
+        metrics = Metrics(enabled=False)
+        assert metrics.stage("llm") is metrics.stage("parse")
+        with metrics.stage("llm"):
+            pass
+        metrics.count("llm")
+        assert metrics.stages.count("llm") == 0
+        assert metrics.outcomes.value("llm") == 0
+
+    def test_gauges_read_at_scrape(self):
+        """Test that gauges report the current value when rendered."""
+        metrics = Metrics(enabled=True)
+        depth = [3]
+        metrics.gauge("queue_depth", "Depth.", lambda: depth[0])
+        depth[0] = 7
+        assert "queue_depth 7" in metrics.render()
+
+    def test_cache_gauges(self, monkeypatch):
+        """Test that cache hit ratios and saved seconds are exported."""
+        metrics = Metrics(enabled=True)
+        cache = ResponseCache()
+        cache.put("k", "reply", 1.5)
+        cache.get("k")
+        cache.get("missing")
+        monkeypatch.setattr(consumer, "metrics", metrics)
+        monkeypatch.setattr(consumer, "response_cache", cache)
+        monkeypatch.setattr(consumer, "greeting_cache", None)
+        consumer._register_cache_gauges()
+        rendered = metrics.render()
+        assert "ai_engine_response_cache_hit_ratio 0.5" in rendered
+        assert "ai_engine_response_cache_saved_seconds 1.5" in rendered
+        assert "ai_engine_greeting_cache_hit_ratio" not in rendered
+
+    def test_consumer_lag(self):
+        """Test lag as the distance from each partition's high watermark."""
+        tps = [SimpleNamespace(topic="chat.input", partition=0), SimpleNamespace(topic="chat.input", partition=1)]
+        fake = SimpleNamespace(assignment=lambda: tps, highwater=lambda tp: {0: 10, 1: 5}[tp.partition])
+        assert consumer_lag(fake, {("chat.input", 0): 6, ("chat.input", 1): 4}) == 3
+        assert consumer_lag(fake, {("chat.input", 0): 9}) == 0
+
+
+@pytest.mark.asyncio
+class TestEndpoint:
+    """Test the HTTP exposition endpoint."""
+
+    async def test_scrape(self):
+        """Test that GET /metrics returns the text format and other paths 404."""
+        metrics = Metrics(enabled=True)
+        metrics.count("llm")
+        server = await serve_metrics(metrics, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def get(path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+
+        try:
+            scraped = await get("/metrics")
+            missing = await get("/other")
+        finally:
+            server.close()
+            await server.wait_closed()
+        assert scraped.startswith("HTTP/1.1 200")
+        assert 'ai_engine_turn_outcomes_total{outcome="llm"} 1' in scraped
+        assert missing.startswith("HTTP/1.1 404")
+
+
+class FakeProducer:
+    async def send(self, topic, value=None, key=None):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+
+class FakeCompletions:
+    async def create(self, **kwargs):
+        message = SimpleNamespace(content='{"question": "Why?", "confusion_score": 40, "reasoning": "r"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.mark.asyncio
+class TestConsumerStages:
+    """Test that process_chat_event times each stage."""
+
+    async def test_stages_recorded(self, monkeypatch):
+        """Test history read, prompt build, LLM, parse and produce timings and the outcome."""
+        metrics = Metrics(enabled=True)
+        monkeypatch.setattr(consumer, "metrics", metrics)
+        monkeypatch.setattr(consumer, "response_cache", None)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+        event = {"userId": "u1", "message": "a list keeps order", "topic": "Python", "timestamp": 1}
+        await consumer.process_chat_event(FakeProducer(), event, client, InMemoryHistoryStore())
+
+        for stage in ("history_read", "prompt_build", "llm", "parse", "produce"):
+            assert metrics.stages.count(stage) == 1, stage
+        assert metrics.outcomes.value("llm") == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
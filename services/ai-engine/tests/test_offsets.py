@@ -0,0 +1,130 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.offsets import CommitOnRevoke, OffsetTracker, idempotency_key
+
+
+class FakeConsumer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.commits = []
+
+    async def commit(self, offsets):
+        if self.fail:
+            raise RuntimeError("rebalance in progress")
+        self.commits.append({(tp.topic, tp.partition): offset for tp, offset in offsets.items()})
+
+
+class TestWatermark:
+    """Test per-partition watermark advancement."""
+
+    def test_waits_for_earlier_offsets(self):
+        """Test that a finished later offset is not committable before earlier ones."""
+        tracker = OffsetTracker()
+        for offset in (10, 11, 12):
+            tracker.track("chat.input", 0, offset)
+        tracker.done("chat.input", 0, 12)
+        tracker.done("chat.input", 0, 11)
+        assert tracker.watermark("chat.input", 0) is None
+        tracker.done("chat.input", 0, 10)
+        assert tracker.watermark("chat.input", 0) == 13
+        assert tracker.outstanding() == 0
+
+    def test_partitions_are_independent(self):
+        """Test that a stuck event only holds back its own partition."""
+        tracker = OffsetTracker()
+        tracker.track("chat.input", 0, 0)
+        tracker.track("chat.input", 1, 0)
+        tracker.done("chat.input", 1, 0)
+        assert tracker.watermark("chat.input", 0) is None
+        assert tracker.watermark("chat.input", 1) == 1
+
+    def test_random_completion_order(self):
+        """Test that the watermark is always the first unfinished offset under concurrency."""
+        rng = random.Random(7)
+        tracker = OffsetTracker()
+        offsets = list(range(5000))
+        for offset in offsets:
+            tracker.track("chat.input", 3, offset)
+        order = offsets[:]
+        rng.shuffle(order)
+        finished = set()
+        first_open = 0
+        for offset in order:
+            tracker.done("chat.input", 3, offset)
+            finished.add(offset)
+            while first_open in finished:
+                first_open += 1
+            assert tracker.watermark("chat.input", 3) == (first_open or None)
+        assert tracker.watermark("chat.input", 3) == 5000
+
+    def test_redelivered_offsets_are_ignored(self):
+        """Test that duplicates from a rebalance neither stall nor rewind the watermark."""
+        tracker = OffsetTracker()
+        tracker.track("chat.input", 0, 0)
+        tracker.track("chat.input", 0, 1)
+        tracker.track("chat.input", 0, 1)
+        tracker.done("chat.input", 0, 0)
+        tracker.done("chat.input", 0, 0)
+        tracker.done("chat.input", 0, 1)
+        assert tracker.watermark("chat.input", 0) == 2
+        assert tracker.completed == 2
+
+    def test_idempotency_key_is_stable(self):
+        """Test that the same record always gets the same key."""
+        assert idempotency_key("chat.input", 2, 41) == idempotency_key("chat.input", 2, 41) == "chat.input:2:41"
+
+
+@pytest.mark.asyncio
+class TestCommit:
+    """Test committing watermarks."""
+
+    async def test_commits_only_moved_watermarks(self):
+        """Test that an unchanged watermark is not committed again."""
+        tracker = OffsetTracker()
+        consumer = FakeConsumer()
+        tracker.track("chat.input", 0, 5)
+        tracker.done("chat.input", 0, 5)
+        await tracker.commit(consumer)
+        await tracker.commit(consumer)
+        assert consumer.commits == [{("chat.input", 0): 6}]
+
+    async def test_failed_commit_is_retried(self):
+        """Test that a failed commit leaves the watermark pending."""
+        tracker = OffsetTracker()
+        tracker.track("chat.input", 0, 0)
+        tracker.done("chat.input", 0, 0)
+        await tracker.commit(FakeConsumer(fail=True))
+        consumer = FakeConsumer()
+        await tracker.commit(consumer)
+        assert consumer.commits == [{("chat.input", 0): 1}]
+        assert tracker.snapshot()["commit_failures"] == 1
+
+    async def test_revoke_commits_and_forgets(self):
+        """Test that revoked partitions commit their progress and ignore late completions."""
+        tracker = OffsetTracker()
+        consumer = FakeConsumer()
+        tracker.track("chat.input", 0, 0)
+        tracker.track("chat.input", 0, 1)
+        tracker.done("chat.input", 0, 0)
+        await CommitOnRevoke(tracker, consumer).on_partitions_revoked([SimpleNamespace(topic="chat.input", partition=0)])
+        tracker.done("chat.input", 0, 1)
+        assert consumer.commits == [{("chat.input", 0): 1}]
+        assert tracker.watermark("chat.input", 0) is None
+
+    async def test_assign_hook_runs(self):
+        """Test that the assignment hook gets the newly assigned partitions."""
+        seen = []
+
+        async def on_assigned(partitions):
+            seen.extend(tp.partition for tp in partitions)
+
+        listener = CommitOnRevoke(OffsetTracker(), FakeConsumer(), on_assigned)
+        await listener.on_partitions_assigned([SimpleNamespace(topic="chat.input", partition=2)])
+        assert seen == [2]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
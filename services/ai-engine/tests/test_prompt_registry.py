@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.history import InMemoryHistoryStore
+from app.llm import PromptUsage
+from app.prompts import (
+    INITIAL_GREETING_PROMPT,
+    STUDENT_SYSTEM_PROMPT,
+    CompiledTemplate,
+    build_student_messages,
+    get_initial_greeting_prompt,
+    get_student_prompt,
+)
+from app.window import build_window
+
+
+class TestCompiledTemplate:
+    """Test that compiled templates render exactly like str.format."""
+
+    @pytest.mark.parametrize("topic", ["Python", "C++ {templates}", ""])
+    def test_matches_format(self, topic):
+        """Test byte-identical output, including escaped braces."""
+        assert get_student_prompt(topic) == STUDENT_SYSTEM_PROMPT.format(topic=topic)
+        assert get_initial_greeting_prompt(topic) == INITIAL_GREETING_PROMPT.format(topic=topic)
+
+    def test_missing_field_raises(self):
+        """Test that an unfilled field is an error, as with str.format."""
+        with pytest.raises(KeyError):
+            CompiledTemplate("Hello {name}").render()
+
+    def test_rendered_prompt_is_memoized(self):
+        """Test that the same topic returns the same string object."""
+        assert get_student_prompt("Rust") is get_student_prompt("Rust")
+
+
+class TestBuildStudentMessages:
+    """Test the prefix-stable message layout."""
+
+    def test_layout(self):
+        """Test system prompt first, history in order, current turn last."""
+        history = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+        messages = build_student_messages("Python", history, "The teacher says: 'c'")
+        assert messages[0] == {"role": "system", "content": get_student_prompt("Python")}
+        assert messages[1:3] == history
+        assert messages[-1] == {"role": "user", "content": "The teacher says: 'c'"}
+
+    def test_system_message_is_shared(self):
+        """Test that turns on one topic reuse the same system message."""
+        first = build_student_messages("Python", [], "x")
+        second = build_student_messages("Python", [], "y")
+        assert first[0] is second[0]
+
+    @pytest.mark.asyncio
+    async def test_prefix_reused_across_turns_with_store_trimming(self):
+        """Test that aligned store trims keep request prefixes stable for most turns."""
+        store = InMemoryHistoryStore(max_messages=20, trim_step=6)
+        previous = None
+        stable = 0
+        turns = 30
+        for turn in range(turns):
+            window, _ = build_window(await store.get("u"), budget=60, step=6)
+            messages = build_student_messages("Python", window, f"turn {turn}")
+            if previous is not None and messages[: len(previous) - 1] == previous[:-1]:
+                stable += 1
+            previous = messages
+            await store.append("u", {"role": "user", "content": f"t{turn}"}, {"role": "assistant", "content": f"a{turn}"})
+        assert stable >= turns * 0.6
+
+
+class TestPromptUsage:
+    """Test per-turn prompt token accounting."""
+
+    def test_records_cached_tokens(self):
+        """Test totals and the cached-token ratio."""
+        usage = PromptUsage()
+        turn = usage.record(SimpleNamespace(
+            prompt_tokens=1200,
+            completion_tokens=80,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=1024),
+        ))
+        usage.record(SimpleNamespace(prompt_tokens=800, completion_tokens=20, prompt_tokens_details=None))
+        assert turn == {"prompt_tokens": 1200, "cached_tokens": 1024, "completion_tokens": 80}
+        snapshot = usage.snapshot()
+        assert snapshot["prompt_tokens"] == 2000
+        assert snapshot["cached_ratio"] == 0.512
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
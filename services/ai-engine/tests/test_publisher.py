@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.publisher import producer_config, publish_records
+
+
+class FlakyProducer:
+    """Acknowledges records after a delay; fails the first ``failures`` sends."""
+
+    def __init__(self, failures=0, delay=0.01):
+        self.failures = failures
+        self.delay = delay
+        self.sent = []
+        self.max_outstanding = 0
+        self._outstanding = 0
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, key, value))
+        future = asyncio.get_running_loop().create_future()
+        self._outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self._outstanding)
+        fail = self.failures > 0
+        self.failures -= 1
+
+        def ack():
+            self._outstanding -= 1
+            if fail:
+                future.set_exception(ConnectionError("broker unavailable"))
+            else:
+                future.set_result(None)
+
+        asyncio.get_running_loop().call_later(self.delay, ack)
+        return future
+
+
+class TestProducerConfig:
+    """Test the batching configuration."""
+
+    def test_has_batching_keys(self):
+        """Test that linger, batch size and compression are exposed."""
+        assert set(producer_config()) == {"linger_ms", "max_batch_size", "compression_type"}
+
+
+@pytest.mark.asyncio
+class TestPublishRecords:
+    """Test pipelined delivery and retries."""
+
+    async def test_records_are_in_flight_together(self):
+        """Test that both records are sent before either is acknowledged."""
+        producer = FlakyProducer()
+        await publish_records(producer, [("chat.output", b"u1", b"q"), ("chat.score", b"u1", b"s")])
+        assert producer.max_outstanding == 2
+        assert [topic for topic, _, _ in producer.sent] == ["chat.output", "chat.score"]
+
+    async def test_failed_record_is_retried(self):
+        """Test that only the failed record is sent again."""
+        producer = FlakyProducer(failures=1)
+        await publish_records(
+            producer, [("chat.output", b"u1", b"q"), ("chat.score", b"u1", b"s")], backoff=0
+        )
+        assert [topic for topic, _, _ in producer.sent] == ["chat.output", "chat.score", "chat.output"]
+
+    async def test_gives_up_after_retries(self):
+        """Test that the delivery error is raised once retries run out."""
+        producer = FlakyProducer(failures=10)
+        with pytest.raises(ConnectionError):
+            await publish_records(producer, [("chat.output", None, b"q")], retries=2, backoff=0)
+        assert len(producer.sent) == 3
+
+    async def test_enqueue_error_is_retried(self):
+        """Test that an exception raised by send itself is treated as a failure."""
+        calls = 0
+        delivered = asyncio.get_running_loop().create_future()
+        delivered.set_result(None)
+
+        class BufferFullProducer:
+            async def send(self, topic, value=None, key=None):
+                nonlocal calls
+                calls += 1
+                if calls == 1:
+                    raise BufferError("buffer full")
+                return delivered
+
+        await publish_records(BufferFullProducer(), [("chat.output", None, b"q")], backoff=0)
+        assert calls == 2
+
+
+@pytest.mark.asyncio
+class TestProcessChatEvent:
+    """Test that a turn's records are published together."""
+
+    async def test_question_and_score_pipelined_by_user(self, monkeypatch):
+        """Test that output and score are in flight together, keyed by userId."""
+        monkeypatch.setattr(consumer, "local_scorer", None)
+        producer = FlakyProducer()
+        event = {"userId": "u1", "message": "a list keeps items in order", "topic": "Python", "timestamp": 7}
+        await consumer.process_chat_event(producer, event, None, InMemoryHistoryStore())
+
+        assert producer.max_outstanding == 2
+        (out_topic, out_key, out_value), (score_topic, score_key, score_value) = producer.sent
+        assert (out_topic, score_topic) == (consumer.CHAT_OUTPUT_TOPIC, consumer.CHAT_SCORE_TOPIC)
+        assert out_key == score_key == b"u1"
+        output, score = json.loads(out_value), json.loads(score_value)
+        assert output["userId"] == score["userId"] == "u1"
+        assert output["question"] and isinstance(score["score"], int)
+        assert output["timestamp"] == score["timestamp"] == 7
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
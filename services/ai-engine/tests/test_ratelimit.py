@@ -0,0 +1,202 @@
+import asyncio
+import json
+
+import pytest
+
+from app.llm import LLMClient
+from app.ratelimit import RateLimiter, TokenBucket, estimate_request_tokens
+
+
+class FakeTime:
+    """Clock and sleep that advance simulated time instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+class TestTokenBucket:
+    """Test bucket refill, waits and clamping."""
+
+    def test_float_dust_counts_as_available(self):
+        """Test that a refill a hair short of a unit needs no (clock-invisible) wait."""
+        t = FakeTime()
+        bucket = TokenBucket(114, t.clock)
+        bucket.level = 1 - 2e-16
+        assert bucket.wait_time(1) == 0.0
+        bucket.level = 0.5
+        assert bucket.wait_time(1) >= 0.001
+
+    def test_refills_per_minute(self):
+        """Test that an empty bucket refills at per_minute / 60 per second."""
+        t = FakeTime()
+        bucket = TokenBucket(600, t.clock)
+        bucket.take(600)
+        assert bucket.wait_time(10) == pytest.approx(1.0)
+        t.now = 1.0
+        assert bucket.wait_time(10) == 0.0
+
+    def test_oversized_request_waits_for_full_bucket(self):
+        """Test that a request above the limit is not blocked forever."""
+        t = FakeTime()
+        bucket = TokenBucket(100, t.clock)
+        assert bucket.wait_time(1000) == 0.0
+
+    def test_clamp_to_remaining(self):
+        """Test that the provider's remaining count caps the local level."""
+        bucket = TokenBucket(1000, FakeTime().clock)
+        bucket.clamp(50)
+        assert bucket.level == 50
+
+
+class TestEstimate:
+    """Test request token estimates."""
+
+    def test_prompt_plus_max_tokens(self):
+        """Test that the estimate covers the prompt and the completion cap."""
+        body = json.dumps({"messages": [{"role": "user", "content": "a" * 400}], "max_tokens": 500}).encode()
+        assert estimate_request_tokens(body) == 100 + 4 + 500
+
+    def test_non_json_body(self):
+        """Test a size-based estimate for unparseable bodies."""
+        assert estimate_request_tokens(b"x" * 40) == 10
+
+
+@pytest.mark.asyncio
+class TestRateLimiter:
+    """Test scheduling, fairness and adaptation."""
+
+    async def test_fair_across_users(self):
+        """Test that a user with a backlog does not starve a newcomer."""
+        t = FakeTime()
+        limiter = RateLimiter(rpm=60, tpm=1e9, clock=t.clock, sleep=t.sleep)
+        limiter.requests.take(60)
+        order = []
+
+        async def request(key, i):
+            await limiter.acquire(key, 1)
+            order.append(f"{key}{i}")
+
+        heavy = [asyncio.create_task(request("a", i)) for i in range(5)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(request("b", 0))
+        await asyncio.wait_for(asyncio.gather(*heavy, light), 5)
+        assert order.index("b0") <= 1
+        assert order[0] == "a0"
+
+    async def test_tokens_budget_limits_rate(self):
+        """Test that big requests are spaced by the token budget."""
+        t = FakeTime()
+        limiter = RateLimiter(rpm=1e6, tpm=6000, clock=t.clock, sleep=t.sleep)
+        await asyncio.wait_for(asyncio.gather(*(limiter.acquire("u", 1000) for _ in range(12))), 5)
+        # 6000 available at once, then 6000 more at 100 tokens/s
+        assert t.now == pytest.approx(60, rel=0.05)
+
+    async def test_retry_after_blocks_everyone(self):
+        """Test that a 429 stops all requests for the Retry-After period."""
+        t = FakeTime()
+        limiter = RateLimiter(rpm=1e6, tpm=1e9, clock=t.clock, sleep=t.sleep)
+        limiter.observe(429, {"retry-after": "7"})
+        await asyncio.wait_for(limiter.acquire("u", 1), 5)
+        assert t.now >= 7
+        assert limiter.snapshot()["throttled"] == 1
+
+    async def test_adapts_to_headers(self):
+        """Test that advertised limits (with headroom) and remaining counts are applied."""
+        limiter = RateLimiter(rpm=500, tpm=150000, headroom=0.9, clock=FakeTime().clock)
+        limiter.observe(200, {
+            "x-ratelimit-limit-requests": "10000",
+            "x-ratelimit-limit-tokens": "2000000",
+            "x-ratelimit-remaining-tokens": "1234",
+        })
+        assert limiter.requests.per_minute == 9000
+        assert limiter.tokens.per_minute == 1800000
+        assert limiter.tokens.level == 1234
+
+    async def test_goodput_near_quota_without_429s(self):
+        """Test that a burst from many users runs near the provider quota with no 429s."""
+        t = FakeTime()
+        quota_rpm = 120
+        provider = TokenBucket(quota_rpm, t.clock)
+        limiter = RateLimiter(rpm=quota_rpm, tpm=1e9, headroom=0.95, clock=t.clock, sleep=t.sleep)
+        limiter.observe(200, {"x-ratelimit-limit-requests": str(quota_rpm)})
+        rejected = 0
+
+        async def call(user):
+            nonlocal rejected
+            await limiter.acquire(user, 10)
+            if provider.wait_time(1) > 0:
+                rejected += 1
+            else:
+                provider.take(1)
+
+        requests = 600
+        # Real-time guard: a dispatcher that stops advancing the clock fails, not hangs
+        await asyncio.wait_for(asyncio.gather(*(call(f"u{i % 20}") for i in range(requests))), 10)
+        assert rejected == 0
+        # Requests beyond the initial burst are served at ~95% of the quota
+        rate = (requests - quota_rpm) / (t.now / 60)
+        assert rate >= quota_rpm * 0.9
+
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4-turbo-preview",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+}
+
+
+async def _serve_with_limits(reader, writer):
+    """HTTP/1.1 server answering with a completion and rate-limit headers."""
+    body = json.dumps(COMPLETION).encode("utf-8")
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"x-ratelimit-limit-requests: 1000\r\nx-ratelimit-limit-tokens: 400000\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_client_requests_pass_through_limiter():
+    """Test that LLMClient requests are counted and headers adapt the limiter."""
+    server = await asyncio.start_server(_serve_with_limits, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    limiter = RateLimiter(rpm=10, tpm=10000, headroom=1.0)
+    client = LLMClient("sk-test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0, rate_limiter=limiter)
+    try:
+        await client.chat.completions.create(
+            model="gpt-4-turbo-preview", messages=[{"role": "user", "content": "hi"}], max_tokens=50
+        )
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+    assert limiter.granted == 1
+    assert limiter.requests.per_minute == 1000
+    assert limiter.tokens.per_minute == 400000
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
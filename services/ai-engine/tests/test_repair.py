@@ -0,0 +1,153 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.codec import JSON
+from app.history import InMemoryHistoryStore
+from app.repair import (
+    COERCED,
+    INCOMPLETE,
+    OK,
+    REPAIRED,
+    UNRECOVERABLE,
+    RepairStats,
+    merge_continuation,
+    parse_student_reply,
+)
+
+# Malformed student replies seen from the model, with how each should be read
+CORPUS = [json.loads(line) for line in (Path(__file__).parent / "data" / "student_replies.jsonl").open()]
+
+
+class TestCorpus:
+    """Test the parser against the corpus of malformed replies."""
+
+    @pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+    def test_case(self, case):
+        """Test that each reply gets the expected status, question and score."""
+        reply, status = parse_student_reply(case["raw"])
+        assert status == case["status"]
+        if status == UNRECOVERABLE:
+            assert reply is None
+            return
+        assert reply["question"] == case["question"]
+        assert reply["confusion_score"] == case["confusion_score"]
+        assert isinstance(reply["reasoning"], str)
+        JSON.dumps(reply)  # publishable: no lone surrogates left
+
+    def test_recovery_rate(self):
+        """Test that most of the corpus is answered without another LLM call."""
+        stats = RepairStats()
+        for case in CORPUS:
+            stats.record(parse_student_reply(case["raw"])[1])
+        assert stats.statuses[OK] >= 2
+        assert stats.recovery_rate() >= 0.7
+
+
+class TestNormalize:
+    """Test field coercion."""
+
+    def test_long_reasoning_is_trimmed(self):
+        """Test that over-long reasoning is cut to the limit."""
+        content = json.dumps({"reasoning": "x" * 50, "confusion_score": 10, "question": "Why?"})
+        reply, status = parse_student_reply(content, reasoning_max_chars=20)
+        assert status == COERCED
+        assert len(reply["reasoning"]) == 20 and reply["reasoning"].endswith("…")
+
+    def test_truncated_long_reasoning_is_trimmed(self):
+        """Test that reasoning cut off by max_tokens is trimmed too, question intact."""
+        content = '{"confusion_score": 10, "question": "Why?", "reasoning": "' + "x" * 50
+        reply, status = parse_student_reply(content, reasoning_max_chars=20)
+        assert status == REPAIRED
+        assert len(reply["reasoning"]) == 20
+
+
+class TestMerge:
+    """Test combining a cut-off reply with its continuation."""
+
+    def test_continuation_fills_gaps(self):
+        """Test that the continuation supplies the question and the partial keeps its reasoning."""
+        partial = {"reasoning": "I follow hashing", "confusion_score": None, "question": None}
+        continuation = {"reasoning": "", "confusion_score": 35, "question": "Why?"}
+        assert merge_continuation(partial, continuation) == {
+            "reasoning": "I follow hashing", "confusion_score": 35, "question": "Why?",
+        }
+
+    def test_stats(self):
+        """Test that continuations count towards recovery."""
+        stats = RepairStats()
+        for status in (OK, REPAIRED, INCOMPLETE, INCOMPLETE):
+            stats.record(status)
+        stats.record_continuation(True)
+        stats.record_continuation(False)
+        snapshot = stats.snapshot()
+        assert snapshot["continued"] == 1 and snapshot["continuations"] == 2
+        assert snapshot["recovery_rate"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+class ScriptedCompletions:
+    """Answers chat completions with the given replies in order."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.replies.pop(0)))],
+            usage=None,
+        )
+
+
+@pytest.mark.asyncio
+class TestStudentTurn:
+    """Test repair inside generate_student_response."""
+
+    async def run_turn(self, monkeypatch, *replies):
+        for name in ("response_cache", "batcher", "summaries", "score_log", "router"):
+            monkeypatch.setattr(consumer, name, None)
+        monkeypatch.setattr(consumer, "reply_repairs", RepairStats())
+        completions = ScriptedCompletions(*replies)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        history = InMemoryHistoryStore()
+        result = await consumer.generate_student_response("Sets use hashing.", "Python", "u1", client, history)
+        return result, completions.calls, await history.get("u1")
+
+    async def test_repaired_reply_is_stored_as_json(self, monkeypatch):
+        """Test that a malformed reply is answered and history holds valid JSON."""
+        result, calls, stored = await self.run_turn(
+            monkeypatch, "Sure! {'reasoning': 'ok', 'confusion_score': '55%', 'question': 'Why hashing?',}"
+        )
+        assert result == {"question": "Why hashing?", "score": 55, "reasoning": "ok"}
+        assert len(calls) == 1
+        assert json.loads(stored[-1]["content"])["question"] == "Why hashing?"
+        assert consumer.reply_repairs.statuses[REPAIRED] == 1
+
+    async def test_cut_off_reply_is_continued(self, monkeypatch):
+        """Test that a reply cut off before its question gets one short continuation request."""
+        result, calls, _ = await self.run_turn(
+            monkeypatch,
+            '{"reasoning": "I think hashing means", "confusion_score": 40, "question": "Does hash',
+            '{"confusion_score": 45, "question": "Does hashing lose the order?"}',
+        )
+        assert result == {"question": "Does hashing lose the order?", "score": 45, "reasoning": "I think hashing means"}
+        assert calls[1]["model"] == consumer.REPLY_CONTINUATION_MODEL
+        assert calls[1]["max_tokens"] == consumer.REPLY_CONTINUATION_MAX_TOKENS
+        assert calls[1]["messages"][-2]["role"] == "assistant"
+        assert consumer.reply_repairs.snapshot()["continued"] == 1
+
+    async def test_unrecoverable_reply_falls_back(self, monkeypatch):
+        """Test that a reply still unusable after the continuation gets the canned question."""
+        result, calls, stored = await self.run_turn(monkeypatch, "I cannot answer that.", "Still no JSON.")
+        assert len(calls) == 2
+        assert result["question"] == "I'm having trouble processing that. Could you rephrase it?"
+        assert stored == []
+        assert consumer.reply_repairs.snapshot()["recovery_rate"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.resilience import CircuitBreaker, CircuitOpenError, LLMGuard
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def slow(seconds, value="ok"):
+    async def run():
+        await asyncio.sleep(seconds)
+        return value
+    return run
+
+
+async def failing():
+    raise RuntimeError("500")
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions."""
+
+    def test_opens_on_error_spike_and_recovers(self):
+        """Test closed -> open -> half-open probe -> closed."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5, cooldown=30, clock=clock)
+        for success in (True, False, False, True):
+            assert breaker.allow()
+            breaker.record(success)
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+        clock.now = 31
+        assert breaker.allow()          # single probe
+        assert not breaker.allow()
+        breaker.record(True)
+        assert breaker.state == "closed"
+        assert breaker.snapshot()["opens"] == 1
+        assert breaker.snapshot()["rejected"] == 2
+
+    def test_failed_probe_reopens(self):
+        """Test that a failed half-open probe starts a new cool-down."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(window=4, min_calls=2, error_rate=0.5, cooldown=10, clock=clock)
+        breaker.record(False)
+        breaker.record(False)
+        clock.now = 11
+        assert breaker.allow()
+        breaker.record(False)
+        assert breaker.state == "open"
+        clock.now = 15
+        assert not breaker.allow()
+
+    def test_below_min_calls_stays_closed(self):
+        """Test that a few early errors do not trip the breaker."""
+        breaker = CircuitBreaker(window=10, min_calls=5, error_rate=0.5)
+        for _ in range(4):
+            breaker.record(False)
+        assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+class TestLLMGuard:
+    """Test deadlines and hedging."""
+
+    async def test_deadline_raises_promptly(self):
+        """Test that a slow call is abandoned at the deadline."""
+        guard = LLMGuard(deadline=0.05)
+        started = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await guard.call(slow(5))
+        assert time.perf_counter() - started < 1
+        assert guard.snapshot()["deadline_exceeded"] == 1
+
+    async def test_turn_deadline_is_shared(self):
+        """Test that calls given one turn deadline share it instead of each getting a full one."""
+        guard = LLMGuard(deadline=0.3)
+        deadline = guard.turn_deadline()
+        started = time.perf_counter()
+        assert await guard.call(slow(0.2), hedge=False, deadline=deadline) == "ok"
+        with pytest.raises(asyncio.TimeoutError):
+            await guard.call(slow(0.2), hedge=False, deadline=deadline)
+        assert time.perf_counter() - started < 0.45
+        with pytest.raises(asyncio.TimeoutError):
+            await guard.call(slow(0), deadline=deadline)  # spent: not even started
+        snapshot = guard.snapshot()
+        assert snapshot["deadline_exceeded"] == 2 and snapshot["calls"] == 2
+
+    async def test_hedge_wins_when_primary_stalls(self):
+        """Test that a hedged second request answers when the first is stuck."""
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return slow(5 if len(calls) == 1 else 0.01, f"call{len(calls)}")()
+
+        guard = LLMGuard(deadline=2, hedge=True, hedge_min_delay=0.05)
+        assert await guard.call(factory) == "call2"
+        snapshot = guard.snapshot()
+        assert snapshot["hedges"] == 1 and snapshot["hedge_win_rate"] == 1.0
+
+    async def test_fast_primary_is_not_hedged(self):
+        """Test that no hedge is sent when the first request is quick."""
+        guard = LLMGuard(deadline=2, hedge=True, hedge_min_delay=0.2)
+        assert await guard.call(slow(0.01)) == "ok"
+        assert guard.snapshot()["hedges"] == 0
+
+    async def test_hedge_disabled_per_call(self):
+        """Test that hedge=False never duplicates a request."""
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return slow(0.1)()
+
+        guard = LLMGuard(deadline=2, hedge=True, hedge_min_delay=0.01)
+        await guard.call(factory, hedge=False)
+        assert len(calls) == 1
+
+    async def test_breaker_rejects_after_errors(self):
+        """Test that repeated failures open the breaker and later calls are rejected."""
+        guard = LLMGuard(deadline=1, breaker=CircuitBreaker(window=4, min_calls=4, error_rate=0.5))
+        for _ in range(4):
+            with pytest.raises(RuntimeError):
+                await guard.call(failing)
+        with pytest.raises(CircuitOpenError):
+            await guard.call(slow(0))
+        assert guard.snapshot()["breaker"]["state"] == "open"
+
+
+class StalledCompletions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(5)
+
+
+class SlowCutOffCompletions:
+    """Every reply takes ``seconds`` and stops before its question."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        content = '{"reasoning": "I think", "confusion_score": 40, "question": "Does'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.mark.asyncio
+class TestStudentTurnFallback:
+    """Test graceful fallback in generate_student_response."""
+
+    async def test_deadline_returns_fallback(self, monkeypatch):
+        """Test that a stalled LLM yields the fallback reply within the deadline."""
+        monkeypatch.setattr(consumer, "llm_guard", LLMGuard(deadline=0.05))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=StalledCompletions()))
+        store = InMemoryHistoryStore()
+        started = time.perf_counter()
+        result = await consumer.generate_student_response("hi", "Python", "u1", client, store)
+        assert time.perf_counter() - started < 1
+        assert result["score"] == 25
+        assert "deadline" in result["reasoning"]
+        assert await store.get("u1") == []
+
+    async def test_continuation_shares_turn_deadline(self, monkeypatch):
+        """Test that the continuation of a cut-off reply only gets what the first call left."""
+        for name in ("response_cache", "batcher", "summaries", "score_log", "router"):
+            monkeypatch.setattr(consumer, name, None)
+        monkeypatch.setattr(consumer, "llm_guard", LLMGuard(deadline=0.4))
+        completions = SlowCutOffCompletions(0.3)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        started = time.perf_counter()
+        result = await consumer.generate_student_response("hi", "Python", "u1", client, InMemoryHistoryStore())
+        assert time.perf_counter() - started < 0.55  # one deadline, not 0.3 + 0.3
+        assert completions.calls == 2
+        assert result["question"] == "I'm having trouble processing that. Could you rephrase it?"
+
+    async def test_open_breaker_skips_llm(self, monkeypatch):
+        """Test that an open breaker answers from fallback without calling the LLM."""
+        breaker = CircuitBreaker(min_calls=1, error_rate=0.1)
+        breaker.record(False)
+        monkeypatch.setattr(consumer, "llm_guard", LLMGuard(breaker=breaker))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=None))
+        result = await consumer.generate_student_response("hi", "Python", "u1", client, InMemoryHistoryStore())
+        assert "circuit breaker" in result["reasoning"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
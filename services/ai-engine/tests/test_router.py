@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.resilience import LLMGuard
+from app.router import ModelRouter, Tier, create_router
+
+VALID = json.dumps({"question": "Why does a set not keep order?", "confusion_score": 40, "reasoning": "ok"})
+
+
+class FixedClassifier:
+    def __init__(self, score):
+        self.value = score
+
+    def score(self, message):
+        return self.value
+
+
+class TestRoute:
+    """Test tier selection."""
+
+    def test_short_message_goes_fast(self):
+        """Test that an ordinary turn tries the fast model."""
+        router = ModelRouter(fast_model="small", strong_model="big")
+        assert router.route("u1", "ok", "Python").model == "small"
+        assert router.reasons == {"fast": 1}
+
+    def test_strong_signals(self):
+        """Test that long messages, hard topics and the classifier pick the strong model."""
+        router = ModelRouter(long_message_tokens=10, hard_topics={"Compilers"}, classifier=FixedClassifier(0))
+        assert router.route("u1", "word " * 20, "Python") is router.strong
+        assert router.route("u1", "ok", "compilers") is router.strong
+        router.classifier = FixedClassifier(90)
+        assert router.route("u1", "ok", "Python") is router.strong
+        assert router.reasons == {"long_message": 1, "hard_topic": 1, "classifier": 1}
+
+    def test_confused_user_goes_strong(self):
+        """Test that a user whose recent turns scored high is routed to the strong model."""
+        router = ModelRouter(confusion_threshold=60, score_window=2)
+        router.observe("u1", 90)
+        router.observe("u1", 50)
+        assert router.route("u1", "ok", "Python") is router.strong
+        router.observe("u1", 20)  # window now (50, 20)
+        assert router.route("u1", "ok", "Python") is router.fast
+        assert router.route("u2", "ok", "Python") is router.fast
+
+    def test_score_memory_is_bounded(self):
+        """Test that the least recently seen users are forgotten."""
+        router = ModelRouter(max_users=2)
+        for user in ("a", "b", "a", "c"):
+            router.observe(user, 99)
+        assert set(router._scores) == {"a", "c"}
+
+    def test_disabled_by_default(self):
+        """Test that no router is built unless enabled."""
+        assert create_router(enabled=False) is None
+        assert isinstance(create_router(enabled=True), ModelRouter)
+
+
+class TestReview:
+    """Test acceptance of fast-tier replies."""
+
+    @pytest.mark.parametrize("content, reason", [
+        (VALID, None),
+        ("{not json", "unparseable"),
+        ("[1, 2]", "unparseable"),
+        (None, "unparseable"),
+        (json.dumps({"question": "Huh?", "confusion_score": 40}), "weak_question"),
+        (json.dumps({"question": "Why does a set not keep order?"}), "bad_score"),
+        (json.dumps({"question": "Why does a set not keep order?", "confusion_score": 140}), "bad_score"),
+    ])
+    def test_review(self, content, reason):
+        """Test that unparseable or implausible replies are escalated."""
+        assert ModelRouter().review(content) == reason
+
+
+class TestTier:
+    """Test per-tier accounting."""
+
+    def test_cost_from_usage(self):
+        """Test that token usage is priced per 1K prompt and completion tokens."""
+        tier = Tier("fast", "small", (0.001, 0.002))
+        tier.record(0.2, SimpleNamespace(prompt_tokens=1000, completion_tokens=500))
+        tier.record(0.4, None)
+        snapshot = tier.snapshot()
+        assert snapshot["calls"] == 2 and snapshot["avg_ms"] == pytest.approx(300.0)
+        assert snapshot["cost_usd"] == pytest.approx(0.002)
+
+
+class ModelCompletions:
+    """Answers each model with a fixed reply and records the models asked."""
+
+    def __init__(self, replies, seconds=0.0):
+        self.replies = replies
+        self.seconds = seconds
+        self.models = []
+
+    async def create(self, model, **kwargs):
+        self.models.append(model)
+        await asyncio.sleep(self.seconds)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.replies[model]))],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_tokens_details=None),
+        )
+
+
+@pytest.mark.asyncio
+class TestRoutedTurn:
+    """Test routing inside generate_student_response."""
+
+    async def run_turn(self, monkeypatch, replies, seconds=0.0):
+        router = ModelRouter(fast_model="small", strong_model="big")
+        monkeypatch.setattr(consumer, "router", router)
+        for name in ("response_cache", "batcher", "summaries", "score_log"):
+            monkeypatch.setattr(consumer, name, None)
+        completions = ModelCompletions(replies, seconds)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        result = await consumer.generate_student_response("ok", "Python", "u1", client, InMemoryHistoryStore())
+        return router, completions.models, result
+
+    async def test_fast_reply_is_kept(self, monkeypatch):
+        """Test that an acceptable fast reply is used without calling the strong model."""
+        router, models, result = await self.run_turn(monkeypatch, {"small": VALID})
+        assert models == ["small"]
+        assert result["score"] == 40
+        assert router.snapshot()["escalation_rate"] == 0
+        assert router._recent_confusion("u1") == 40
+
+    async def test_unparseable_fast_reply_escalates(self, monkeypatch):
+        """Test that a fast reply that does not parse is redone on the strong model."""
+        router, models, result = await self.run_turn(monkeypatch, {"small": "Sure! {", "big": VALID})
+        assert models == ["small", "big"]
+        assert result["question"] == "Why does a set not keep order?"
+        snapshot = router.snapshot()
+        assert snapshot["escalations"] == {"unparseable": 1}
+        assert snapshot["escalation_rate"] == 1.0
+        assert snapshot["fast"]["calls"] == snapshot["strong"]["calls"] == 1
+        assert snapshot["fast"]["prompt_tokens"] == 100
+
+
+    async def test_escalation_shares_turn_deadline(self, monkeypatch):
+        """Test that an escalated turn gives up at one LLM_TURN_DEADLINE, not one per tier."""
+        monkeypatch.setattr(consumer, "llm_guard", LLMGuard(deadline=0.4))
+        started = time.perf_counter()
+        _, models, result = await self.run_turn(monkeypatch, {"small": "Sure! {", "big": VALID}, seconds=0.3)
+        assert time.perf_counter() - started < 0.55  # not 0.3 + 0.3
+        assert models == ["small", "big"]
+        assert "deadline" in result["reasoning"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import BoundedScheduler
+
+
+class FakeConsumer:
+    """Records pause/resume calls the way AIOKafkaConsumer exposes them."""
+
+    def __init__(self):
+        self.partitions = {"chat.input-0", "chat.input-1"}
+        self._paused = set()
+        self.pause_calls = 0
+        self.resume_calls = 0
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def paused(self):
+        return set(self._paused)
+
+    def pause(self, *partitions):
+        self.pause_calls += 1
+        self._paused.update(partitions)
+
+    def resume(self, *partitions):
+        self.resume_calls += 1
+        self._paused.difference_update(partitions)
+
+
+class TestBoundedSchedulerInit:
+    """Test scheduler construction."""
+
+    def test_rejects_zero_limit(self):
+        """Test that a limit below one is refused."""
+        with pytest.raises(ValueError):
+            BoundedScheduler(0)
+
+
+@pytest.mark.asyncio
+class TestBoundedScheduler:
+    """Test the in-flight limit and consumer backpressure."""
+
+    async def test_never_exceeds_limit(self):
+        """Test that concurrent tasks stay at or below max_in_flight."""
+        scheduler = BoundedScheduler(3)
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(20):
+            await scheduler.submit(work())
+        await scheduler.drain()
+
+        assert peak == 3
+        assert scheduler.completed == 20
+        assert scheduler.in_flight == 0
+
+    async def test_pauses_and_resumes_consumer(self):
+        """Test that partitions are paused at the limit and resumed after."""
+        consumer = FakeConsumer()
+        scheduler = BoundedScheduler(1, consumer)
+        release = asyncio.Event()
+
+        await scheduler.submit(release.wait())
+        blocked = asyncio.create_task(scheduler.submit(asyncio.sleep(0)))
+        await asyncio.sleep(0)
+
+        assert scheduler.paused
+        assert consumer.paused() == consumer.partitions
+
+        release.set()
+        await blocked
+        await scheduler.drain()
+
+        assert not scheduler.paused
+        assert consumer.paused() == set()
+        assert consumer.pause_calls == 1
+        assert consumer.resume_calls == 1
+
+    async def test_failed_task_frees_slot(self):
+        """Test that an exception in a task is counted and releases its slot."""
+        scheduler = BoundedScheduler(1)
+
+        async def boom():
+            raise RuntimeError("boom")
+
+        await scheduler.submit(boom())
+        await scheduler.submit(asyncio.sleep(0))
+        await scheduler.drain()
+
+        assert scheduler.failed == 1
+        assert scheduler.completed == 1
+
+    async def test_drain_cancels_after_timeout(self):
+        """Test that drain cancels tasks that outlive the timeout."""
+        scheduler = BoundedScheduler(2)
+        task = await scheduler.submit(asyncio.sleep(10))
+
+        await scheduler.drain(timeout=0.01)
+
+        assert task.cancelled()
+        assert scheduler.in_flight == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
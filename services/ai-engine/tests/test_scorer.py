@@ -0,0 +1,148 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.scorer import ScoreLog, evaluate, hashed_features, load_scorer, read_pairs, split, train
+
+
+CLEAR = [
+    "for example imagine a library where each book is a component you can reuse",
+    "think of it like a recipe step by step first you mix then you bake",
+    "an analogy is a post office each letter has an address so it reaches the right house",
+    "for instance a list keeps items in order so index zero is always the first element",
+]
+VAGUE = [
+    "it just works",
+    "stuff happens and the computer does it",
+    "you know it is like that thing",
+    "basically magic",
+]
+
+
+def corpus(n, seed=0):
+    """Synthetic logged pairs: detailed explanations score low, vague ones high."""
+    rng = random.Random(seed)
+    pairs = []
+    for i in range(n):
+        if i % 2:
+            pairs.append({"message": f"{rng.choice(CLEAR)} {rng.choice(CLEAR)}", "score": rng.randint(5, 25)})
+        else:
+            pairs.append({"message": rng.choice(VAGUE), "score": rng.randint(65, 90)})
+    return pairs
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    pairs = corpus(400)
+    return train([p["message"] for p in pairs], [p["score"] for p in pairs], n_features=2 ** 12, epochs=200)
+
+
+class TestFeatures:
+    """Test hashed feature extraction."""
+
+    def test_stable_and_sparse(self):
+        """Test that the same text hashes identically and indices are unique."""
+        a_idx, a_cnt = hashed_features("Hello world? hello", 1024)
+        b_idx, b_cnt = hashed_features("hello WORLD? hello", 1024)
+        assert np.array_equal(a_idx, b_idx) and np.array_equal(a_cnt, b_cnt)
+        assert len(np.unique(a_idx)) == len(a_idx)
+        assert a_idx.max() < 1024
+
+
+class TestScorer:
+    """Test training, prediction and persistence."""
+
+    def test_learns_llm_scores(self, scorer):
+        """Test agreement with held-out LLM scores."""
+        held_out = corpus(100, seed=1)
+        report = evaluate(scorer, [p["message"] for p in held_out], [p["score"] for p in held_out])
+        assert report["mae"] < 15
+        assert report["pearson"] > 0.8
+
+    def test_scores_in_range(self, scorer):
+        """Test that predictions are clamped to 0-100."""
+        assert 0 <= scorer.score("") <= 100
+        assert scorer.score("basically magic") > scorer.score(f"{CLEAR[0]} {CLEAR[1]}")
+
+    def test_save_and_load(self, scorer, tmp_path):
+        """Test that a saved model predicts identically."""
+        path = str(tmp_path / "models" / "scorer.npz")
+        scorer.save(path)
+        loaded = load_scorer(path, mode="fallback")
+        assert np.allclose(loaded.predict(VAGUE), scorer.predict(VAGUE))
+
+    def test_missing_model_or_off(self, scorer, tmp_path):
+        """Test that no scorer is loaded when disabled or untrained."""
+        assert load_scorer(str(tmp_path / "none.npz")) is None
+        path = str(tmp_path / "scorer.npz")
+        scorer.save(path)
+        assert load_scorer(path, mode="off") is None
+
+
+class TestScoreLog:
+    """Test the training-pair log."""
+
+    def test_round_trip_and_split(self, tmp_path):
+        """Test that logged pairs are read back, bad lines skipped, and split deterministically."""
+        path = str(tmp_path / "scores.jsonl")
+        log = ScoreLog(path)
+        for i in range(50):
+            log.record("Python", f"message {i}", i, 1.5)
+        log.close()
+        with open(path, "a") as f:
+            f.write("not json\n")
+        pairs = read_pairs(path)
+        assert len(pairs) == 50
+        train_set, test_set = split(pairs, 0.2)
+        assert len(train_set) + len(test_set) == 50
+        assert split(pairs, 0.2) == (train_set, test_set)
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, json.loads(value.decode("utf-8"))))
+
+
+@pytest.mark.asyncio
+class TestConsumerIntegration:
+    """Test the local scorer in the engine."""
+
+    async def test_fallback_mode_uses_local_score(self, scorer, monkeypatch):
+        """Test that fallback mode returns a real estimate instead of a constant."""
+        monkeypatch.setattr(consumer, "local_scorer", scorer)
+        vague = await consumer.generate_student_response("basically magic", "Python", "u1", None, InMemoryHistoryStore())
+        clear = await consumer.generate_student_response(
+            f"{CLEAR[0]} {CLEAR[2]}", "Python", "u1", None, InMemoryHistoryStore()
+        )
+        assert vague["score"] > clear["score"]
+
+    async def test_provisional_score_published_first(self, scorer, monkeypatch):
+        """Test that provisional mode publishes a local score before the LLM result."""
+        monkeypatch.setattr(consumer, "local_scorer", scorer)
+        monkeypatch.setattr(consumer, "LOCAL_SCORER_MODE", "provisional")
+        published = []
+
+        async def fake_publish(producer, records, *args, **kwargs):
+            published.extend(topic for topic, _, _ in records)
+
+        monkeypatch.setattr(consumer, "publish_records", fake_publish)
+        producer = FakeProducer()
+        event = {"userId": "u1", "message": "basically magic", "timestamp": 1}
+        await consumer.process_chat_event(producer, event, None, InMemoryHistoryStore())
+
+        topic, provisional = producer.sent[0]
+        assert topic == consumer.CHAT_SCORE_TOPIC
+        assert provisional["provisional"] is True
+        assert provisional["score"] == scorer.score("basically magic")
+        assert published == [consumer.CHAT_OUTPUT_TOPIC, consumer.CHAT_SCORE_TOPIC]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.llm import LLMClient
+from app.metrics import Metrics, serve_metrics
+from app.prompts import get_initial_greeting_prompt
+from app.startup import Health, warm_up
+from benchmarks.harness import InMemoryProducer, MockLLMServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHealth:
+    """Test readiness and liveness state."""
+
+    def test_ready_between_warm_up_and_shutdown(self):
+        """Test that readiness covers warm-up done until shutdown starts."""
+        clock = FakeClock()
+        health = Health(lambda: (0, 0), clock=clock)
+        assert not health.ready
+        clock.now = 2.5
+        assert health.mark_ready() == 2.5
+        assert health.ready
+        health.mark_stopping()
+        assert not health.ready
+
+    def test_stalled_work_fails_liveness(self):
+        """Test that outstanding events with no completions eventually fail liveness."""
+        clock = FakeClock()
+        progress = [0, 3]
+        health = Health(lambda: tuple(progress), stall_timeout=30, clock=clock)
+        assert health.live()
+        clock.now = 29
+        assert health.live()
+        progress[0] = 1  # one finished: the clock restarts
+        clock.now = 40
+        assert health.live()
+        clock.now = 70
+        assert not health.live()
+
+    def test_idle_engine_stays_live(self):
+        """Test that having nothing to do is not a stall."""
+        clock = FakeClock()
+        health = Health(lambda: (5, 0), stall_timeout=30, clock=clock)
+        clock.now = 1000
+        assert health.live()
+
+    def test_first_event_logged_once(self, capsys):
+        """Test that only the first event's latency is recorded."""
+        health = Health(lambda: (0, 0))
+        health.record_event(0.25)
+        health.record_event(0.01)
+        assert health.first_event_seconds == 0.25
+        assert capsys.readouterr().out.count("first event answered") == 1
+
+
+@pytest.mark.asyncio
+class TestWarmUp:
+    """Test the startup warm-up steps."""
+
+    async def test_warms_metadata_connections_and_prompts(self):
+        """Test that output topic metadata, LLM connections and hot prompts are ready."""
+        llm = MockLLMServer(median_ms=50)  # slow enough that the listings overlap
+        await llm.start()
+        client = LLMClient("sk-test", base_url=llm.base_url, max_retries=0)
+        producer = InMemoryProducer()
+        get_initial_greeting_prompt.cache_clear()
+        try:
+            timings = await warm_up(producer, client, ["chat.output", "chat.score"], ["Rust"], connections=3)
+            assert client.connection_stats()["connections_opened"] == 3
+        finally:
+            await client.close()
+            await llm.stop()
+        assert set(timings) == {"prompts", "producer_metadata", "llm_connections"}
+        assert producer.metadata_fetched == {"chat.output", "chat.score"}
+        assert llm.listings == 3 and llm.requests == 0
+        assert get_initial_greeting_prompt.cache_info().currsize == 1
+
+    async def test_failing_step_is_skipped(self):
+        """Test that a broker that cannot be reached delays but does not block startup."""
+        class SlowProducer(InMemoryProducer):
+            async def partitions_for(self, topic):
+                await asyncio.sleep(10)
+
+        timings = await warm_up(SlowProducer(), None, ["chat.output"], [], timeout=0.05)
+        assert 0.05 <= timings["producer_metadata"] < 1
+        assert "llm_connections" not in timings
+
+
+@pytest.mark.asyncio
+class TestProbes:
+    """Test the probe endpoints."""
+
+    async def test_probe_status_codes(self):
+        """Test that /readyz and /healthz answer 503 until ready or when stalled."""
+        clock = FakeClock()
+        progress = [0, 1]
+        health = Health(lambda: tuple(progress), stall_timeout=30, clock=clock)
+        server = await serve_metrics(Metrics(enabled=False), "127.0.0.1", 0, health=health)
+        port = server.sockets[0].getsockname()[1]
+
+        async def status(path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return int(response.split(b" ", 2)[1])
+
+        try:
+            assert await status("/readyz") == 503
+            assert await status("/healthz") == 200
+            health.mark_ready()
+            assert await status("/readyz") == 200
+            clock.now = 31
+            assert await status("/healthz") == 503
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
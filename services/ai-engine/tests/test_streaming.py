@@ -0,0 +1,130 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.streaming import StreamingFieldExtractor, collect_stream
+
+
+REPLY = {
+    "reasoning": "The teacher said \"question\": skip this, {nested} [1, 2]",
+    "confusion_score": 20,
+    "question": "Why does \"async\" help?\nAlso: café \U0001F600 / done",
+}
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def stream_of(parts):
+    async def gen():
+        for part in parts:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+    return gen()
+
+
+class TestStreamingFieldExtractor:
+    """Test incremental extraction across arbitrary chunk boundaries."""
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+    def test_extracts_question_for_any_chunking(self, size):
+        """Test that every chunk size yields the exact decoded value."""
+        text = json.dumps(REPLY)
+        extractor = StreamingFieldExtractor("question")
+        extracted = "".join(extractor.feed(part) for part in chunks(text, size))
+        assert extracted == REPLY["question"]
+        assert extractor.complete
+
+    def test_escaped_unicode_and_surrogates(self):
+        """Test that \\u escapes, including surrogate pairs, are decoded."""
+        text = json.dumps(REPLY, ensure_ascii=True)
+        extractor = StreamingFieldExtractor("question")
+        extracted = "".join(extractor.feed(ch) for ch in text)
+        assert extracted == REPLY["question"]
+
+    def test_malformed_escape_is_literal(self):
+        """Test that a bad \\u escape or lone surrogate does not abort the stream."""
+        extractor = StreamingFieldExtractor("question")
+        extracted = extractor.feed('{"question": "Why \\uZZ12 and \\udc00?"}')
+        assert extracted == "Why \\uZZ12 and \ufffd?"
+        assert extractor.complete
+
+    def test_nested_keys_are_ignored(self):
+        """Test that a same-named key inside a nested object is not captured."""
+        text = json.dumps({"meta": {"question": "no"}, "question": "yes"})
+        extractor = StreamingFieldExtractor("question")
+        assert extractor.feed(text) == "yes"
+
+    def test_incomplete_value_is_streamed(self):
+        """Test that a truncated reply still yields what was generated."""
+        extractor = StreamingFieldExtractor("question")
+        assert extractor.feed('{"reasoning": "x", "question": "How do') == "How do"
+        assert not extractor.complete
+
+
+@pytest.mark.asyncio
+class TestCollectStream:
+    """Test the stream consumer."""
+
+    async def test_partials_concatenate_to_question(self):
+        """Test that partial pieces rebuild the question and the full text is returned."""
+        text = json.dumps(REPLY)
+        partials = []
+
+        async def on_partial(delta):
+            partials.append(delta)
+
+        full, usage = await collect_stream(stream_of(chunks(text, 3)), on_partial, flush_chars=10)
+        assert full == text
+        assert usage is None
+        assert "".join(partials) == REPLY["question"]
+        assert len(partials) > 1
+        assert all(len(p) >= 10 for p in partials[:-1])
+
+
+class FakeStreamingCompletions:
+    async def create(self, messages, stream=False, **kwargs):
+        assert stream
+        return stream_of(chunks(json.dumps(REPLY), 5))
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, json.loads(value.decode("utf-8"))))
+        delivered = asyncio.get_running_loop().create_future()
+        delivered.set_result(None)
+        return delivered
+
+
+@pytest.mark.asyncio
+class TestStreamingMode:
+    """Test streaming through process_chat_event."""
+
+    async def test_partials_then_final(self, monkeypatch):
+        """Test that partial records precede the final question and score."""
+        monkeypatch.setattr(consumer, "STREAMING_ENABLED", True)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=FakeStreamingCompletions()))
+        producer = FakeProducer()
+        event = {"userId": "u1", "message": "async is cooperative", "timestamp": 1}
+
+        await consumer.process_chat_event(producer, event, client, InMemoryHistoryStore())
+
+        topics = [topic for topic, _ in producer.sent]
+        partials = [e for topic, e in producer.sent if topic == consumer.CHAT_OUTPUT_PARTIAL_TOPIC]
+        assert topics[-2:] == [consumer.CHAT_OUTPUT_TOPIC, consumer.CHAT_SCORE_TOPIC]
+        assert [p["seq"] for p in partials] == list(range(len(partials)))
+        assert "".join(p["delta"] for p in partials) == REPLY["question"]
+        assert producer.sent[-2][1]["question"] == REPLY["question"]
+        assert producer.sent[-1][1]["score"] == 20
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from app.supervisor import Supervisor, install_event_loop, worker_count
+
+
+def wait_exited(supervisor, timeout=10):
+    deadline = time.monotonic() + timeout
+    while any(w.process.poll() is None for w in supervisor.workers):
+        assert time.monotonic() < deadline, "workers did not exit"
+        time.sleep(0.01)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSupervisor:
+    """Test worker start, restart and shutdown."""
+
+    def test_worker_environment(self, tmp_path):
+        """Test that each worker gets its own id and metrics port."""
+        script = f"import os; open(os.path.join({str(tmp_path)!r}, os.environ['WORKER_ID']), 'w').write(os.environ['METRICS_PORT'])"
+        supervisor = Supervisor(3, [sys.executable, "-c", script], env={**os.environ, "METRICS_PORT": "9100"})
+        supervisor.start()
+        wait_exited(supervisor)
+        assert {name: (tmp_path / name).read_text() for name in os.listdir(tmp_path)} == {
+            "0": "9100", "1": "9101", "2": "9102",
+        }
+
+    def test_crashed_worker_restarts_with_backoff(self):
+        """Test that a crashing worker is restarted after a doubling delay."""
+        clock = FakeClock()
+        supervisor = Supervisor(1, [sys.executable, "-c", "raise SystemExit(3)"], restart_backoff=1.0, max_backoff=3.0, clock=clock)
+        supervisor.start()
+        delays = []
+        for _ in range(3):
+            wait_exited(supervisor)
+            supervisor.poll()
+            worker = supervisor.workers[0]
+            delays.append(worker.restart_at - clock.now)
+            supervisor.poll()
+            assert worker.restart_at is not None  # not before the backoff elapsed
+            clock.now = worker.restart_at
+            supervisor.poll()
+        assert delays == [1.0, 2.0, 3.0]
+        assert supervisor.snapshot()["restarts"] == 3
+        supervisor.stop(5)
+
+    def test_stop_terminates_workers(self):
+        """Test that stop sends SIGTERM and nothing is restarted afterwards."""
+        supervisor = Supervisor(2, [sys.executable, "-c", "import time; time.sleep(60)"])
+        supervisor.start()
+        supervisor.stop(5)
+        supervisor.poll()
+        assert supervisor.snapshot() == {"workers": 2, "running": 0, "restarts": 0}
+        assert all(w.restart_at is None for w in supervisor.workers)
+
+    def test_worker_count(self):
+        """Test that an explicit count wins and 0 means one per CPU."""
+        assert worker_count(3) == 3
+        assert worker_count(0) >= 1
+
+
+class TestEventLoop:
+    """Test event loop selection."""
+
+    def test_asyncio_by_default(self):
+        """Test that the default loop is left alone."""
+        assert install_event_loop("asyncio") == "asyncio"
+
+    def test_uvloop_when_installed(self):
+        """Test that uvloop is used if it is importable."""
+        pytest.importorskip("uvloop")
+        try:
+            assert install_event_loop("uvloop") == "uvloop"
+        finally:
+            asyncio.set_event_loop_policy(None)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,185 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import consumer
+from app.history import InMemoryHistoryStore
+from app.window import (
+    RollingSummaries,
+    build_window,
+    create_summaries,
+    estimate_tokens,
+    local_summary,
+    message_tokens,
+    truncate_to_tokens,
+)
+
+
+def exchange(turn, size=40):
+    return [
+        {"role": "user", "content": f"The teacher says: '{'x' * size} {turn}'"},
+        {"role": "assistant", "content": json.dumps({"question": f"Question {turn}. More.", "confusion_score": 20})},
+    ]
+
+
+def history_of(turns, size=40):
+    return [m for turn in range(turns) for m in exchange(turn, size)]
+
+
+class TestEstimate:
+    """Test the local token estimate and truncation."""
+
+    def test_estimate_scales_with_length(self):
+        """Test roughly four characters per token."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("a" * 400) == 100
+
+    def test_truncate(self):
+        """Test that long text is cut to the limit and marked."""
+        assert truncate_to_tokens("short", 10) == "short"
+        cut = truncate_to_tokens("y" * 1000, 50)
+        assert estimate_tokens(cut) <= 50
+        assert cut.endswith("[...]")
+
+
+class TestBuildWindow:
+    """Test token-budgeted windows."""
+
+    def test_short_exchanges_keep_more_context(self):
+        """Test that short turns fit more messages than a fixed last-6 slice."""
+        window, dropped = build_window(history_of(10, size=10), budget=1200, step=2)
+        assert len(window) == 20
+        assert dropped == []
+
+    def test_window_stays_within_budget(self):
+        """Test that the window never exceeds the budget and drops the oldest."""
+        history = history_of(20, size=200)
+        for budget in (100, 300, 700, 1500):
+            window, dropped = build_window(history, budget=budget, step=2)
+            assert sum(message_tokens(m) for m in window) <= budget
+            assert dropped + window == history
+
+    def test_start_aligned_to_step(self):
+        """Test that the number of dropped messages is a multiple of the step."""
+        for turns in range(1, 20):
+            _, dropped = build_window(history_of(turns, size=150), budget=500, step=4)
+            assert len(dropped) % 4 == 0
+
+    def test_pasted_essay_is_shortened(self):
+        """Test that one huge message is truncated instead of blowing the budget."""
+        history = [{"role": "user", "content": "z" * 40000}, {"role": "assistant", "content": "ok"}]
+        window, dropped = build_window(history, budget=1200, step=2, message_max_tokens=400)
+        assert dropped == []
+        assert message_tokens(window[0]) <= 404
+        assert history[0]["content"] == "z" * 40000
+
+
+class TestLocalSummary:
+    """Test the extractive summary."""
+
+    def test_extracts_first_sentences(self):
+        """Test teacher points and student questions become short lines."""
+        summary = local_summary("", exchange(1))
+        assert "Teacher said:" in summary
+        assert "Student asked: Question 1" in summary
+
+    def test_summary_is_bounded(self):
+        """Test that the oldest lines are dropped past the limit."""
+        summary = local_summary("", history_of(50), max_tokens=60)
+        assert estimate_tokens(summary) <= 60
+        assert "Question 49" in summary
+
+
+@pytest.mark.asyncio
+class TestRollingSummaries:
+    """Test background summarization."""
+
+    async def test_summary_built_off_hot_path(self):
+        """Test that schedule returns at once and the summary appears later."""
+        release = asyncio.Event()
+        seen = []
+
+        async def summarize(previous, messages):
+            seen.append(list(messages))
+            await release.wait()
+            return previous + f"{len(messages)} messages"
+
+        summaries = RollingSummaries(summarize)
+        summaries.schedule("u", history_of(2))
+        await asyncio.sleep(0)
+        assert summaries.memory_message("u") is None
+        release.set()
+        await asyncio.sleep(0)
+        assert summaries.memory_message("u")["content"].endswith("4 messages")
+
+        # Only messages not yet folded in are summarized next time
+        summaries.schedule("u", history_of(3))
+        await asyncio.sleep(0)
+        assert seen[-1] == exchange(2)
+        await summaries.close()
+
+    async def test_failure_keeps_previous_summary(self):
+        """Test that a failed run is counted and leaves no summary."""
+        async def summarize(previous, messages):
+            raise RuntimeError("boom")
+
+        summaries = RollingSummaries(summarize)
+        summaries.schedule("u", history_of(1))
+        await asyncio.sleep(0)
+        assert summaries.memory_message("u") is None
+        assert summaries.snapshot()["failures"] == 1
+
+    async def test_users_bounded(self):
+        """Test that the least recently used summaries are evicted."""
+        summaries = create_summaries(None, mode="local")
+        summaries.max_users = 2
+        for user in ("a", "b", "c"):
+            summaries.schedule(user, history_of(1))
+            await asyncio.sleep(0)
+        assert summaries.memory_message("a") is None
+        assert summaries.memory_message("c") is not None
+
+    async def test_off_by_default(self):
+        """Test that summaries are disabled unless a mode is chosen."""
+        assert create_summaries(None, mode="off") is None
+
+
+class RecordingCompletions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, messages, **kwargs):
+        self.calls.append(messages)
+        content = json.dumps({"reasoning": "r", "confusion_score": 10, "question": "Why?"})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.mark.asyncio
+class TestStudentTurnWindow:
+    """Test the token window in generate_student_response."""
+
+    async def test_memory_message_follows_system_prompt(self, monkeypatch):
+        """Test that old turns are summarized and sent after the system prompt."""
+        summaries = create_summaries(None, mode="local")
+        monkeypatch.setattr(consumer, "summaries", summaries)
+        completions = RecordingCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        store = InMemoryHistoryStore(max_messages=100)
+        await store.append("u", *history_of(40, size=200))
+
+        await consumer.generate_student_response("next", "Python", "u", client, store)
+        await asyncio.sleep(0)
+        await consumer.generate_student_response("again", "Python", "u", client, store)
+
+        first, second = completions.calls
+        assert all(m["role"] != "system" for m in first[1:])
+        assert second[1]["role"] == "system"
+        assert second[1]["content"].startswith("Summary of the earlier conversation")
+        assert sum(message_tokens(m) for m in second[2:-1]) <= 1200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
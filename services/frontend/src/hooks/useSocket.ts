@@ -5,6 +5,12 @@ import { addMessage, setConfusionScore } from "../store/chatSlice";
 
 const GATEWAY_URL = import.meta.env.VITE_GATEWAY_URL || "http://localhost:4000";
 
+// Sent with every message and kept on resends, so the engine answers each one once
+const newMessageId = (): string =>
+    typeof crypto !== "undefined" && "randomUUID" in crypto
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 export const useSocket = (token: string | null) => {
     const [socket, setSocket] = useState<Socket | null>(null);
     const [isConnected, setIsConnected] = useState(false);
@@ -64,10 +70,11 @@ export const useSocket = (token: string | null) => {
 
     const sendMessage = (message: string) => {
         if (socket && isConnected) {
-            socket.emit("message:send", { message, topic: selectedTopic });
+            const messageId = newMessageId();
+            socket.emit("message:send", { message, topic: selectedTopic, messageId });
             dispatch(
                 addMessage({
-                    id: `user-${Date.now()}`,
+                    id: `user-${messageId}`,
                     role: "user",
                     content: message,
                     timestamp: new Date().toISOString(),
@@ -81,7 +88,8 @@ export const useSocket = (token: string | null) => {
             socket.emit("message:send", {
                 message: "[INITIAL_GREETING]",
                 topic,
-                isInitial: true
+                isInitial: true,
+                messageId: newMessageId(),
             });
         }
     };
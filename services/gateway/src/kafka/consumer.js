@@ -1,10 +1,13 @@
 const { Kafka, logLevel } = require("kafkajs");
+const createRecentKeys = require("./recentKeys");
 
 const {
   KAFKA_BROKERS = "kafka:9092",
   KAFKA_CLIENT_ID = "gateway-consumer",
   CHAT_OUTPUT_TOPIC = "chat.output",
   CHAT_SCORE_TOPIC = "chat.score",
+  CHAT_OUTPUT_PARTIAL_TOPIC = "chat.output.partial",
+  DEDUPE_MAX_KEYS = "10000",
 } = process.env;
 
 function createKafkaConsumer(io, socketRegistry) {
@@ -15,15 +18,19 @@ function createKafkaConsumer(io, socketRegistry) {
   });
 
   const consumer = kafka.consumer({ groupId: `${KAFKA_CLIENT_ID}-group` });
+  // Drops re-published turns (same idempotencyKey) after an engine restart
+  const recentKeys = createRecentKeys(Number(DEDUPE_MAX_KEYS));
 
   async function start() {
     await consumer.connect();
     await consumer.subscribe({ topic: CHAT_OUTPUT_TOPIC, fromBeginning: false });
     await consumer.subscribe({ topic: CHAT_SCORE_TOPIC, fromBeginning: false });
+    await consumer.subscribe({ topic: CHAT_OUTPUT_PARTIAL_TOPIC, fromBeginning: false });
 
     await consumer.run({
       eachMessage: async ({ topic, message }) => {
         const event = JSON.parse(message.value.toString());
+        if (event.idempotencyKey && !recentKeys.firstSeen(`${topic}:${event.idempotencyKey}`)) return;
         const socketId = socketRegistry.get(event.userId);
         if (!socketId) return;
 
@@ -31,6 +38,9 @@ function createKafkaConsumer(io, socketRegistry) {
           io.to(socketId).emit("message:receive", event);
         } else if (topic === CHAT_SCORE_TOPIC) {
           io.to(socketId).emit("message:score", event);
+        } else if (topic === CHAT_OUTPUT_PARTIAL_TOPIC) {
+          // Streamed question text; clients append `delta` in `seq` order
+          io.to(socketId).emit("message:partial", event);
         }
       },
     });
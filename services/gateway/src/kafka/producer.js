@@ -26,11 +26,12 @@ class KafkaProducer {
     return KafkaProducer.instance;
   }
 
-  async produce(topic, value) {
+  // Records with the same key land on the same partition, in order
+  async produce(topic, value, key = null) {
     await this.connection;
     return this.producer.send({
       topic,
-      messages: [{ value: JSON.stringify(value) }],
+      messages: [{ key, value: JSON.stringify(value) }],
     });
   }
 
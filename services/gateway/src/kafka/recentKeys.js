@@ -0,0 +1,23 @@
+// Bounded set of recently delivered idempotency keys. The AI engine commits
+// offsets at-least-once, so a restarted engine can publish a turn twice.
+function createRecentKeys(maxSize = 10000) {
+  const keys = new Map();
+
+  return {
+    // True the first time a key is seen; false for a repeat still remembered.
+    firstSeen(key) {
+      if (key === undefined || key === null) return true;
+      if (keys.has(key)) return false;
+      keys.set(key, true);
+      if (keys.size > maxSize) {
+        keys.delete(keys.keys().next().value);
+      }
+      return true;
+    },
+    get size() {
+      return keys.size;
+    },
+  };
+}
+
+module.exports = createRecentKeys;
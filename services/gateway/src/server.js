@@ -77,9 +77,12 @@ io.on("connection", (socket) => {
       message: payload.message,
       topic: payload.topic, // Pass topic from payload
       isInitial: payload.isInitial || false, // Pass initial greeting flag
+      // Client-generated and resent unchanged, so the engine can answer each message once
+      messageId: typeof payload.messageId === "string" ? payload.messageId.slice(0, 128) : undefined,
       timestamp: new Date().toISOString(),
     };
-    producer.produce(CHAT_INPUT_TOPIC, event).catch((err) => {
+    // Keyed by user so one engine worker sees all of a user's turns, in order
+    producer.produce(CHAT_INPUT_TOPIC, event, String(userId)).catch((err) => {
       console.error("Kafka produce failure:", err);
     });
   });
@@ -51,6 +51,15 @@ describe("Kafka Producer Tests", () => {
         expect(producer.producer.send).toHaveBeenCalled();
     });
 
+    it("should key a message when given a key", async () => {
+        await producer.produce("chat.input", { userId: "u1" }, "u1");
+
+        expect(producer.producer.send).toHaveBeenCalledWith({
+            topic: "chat.input",
+            messages: [{ key: "u1", value: JSON.stringify({ userId: "u1" }) }],
+        });
+    });
+
     it("should disconnect properly", async () => {
         await producer.disconnect();
 
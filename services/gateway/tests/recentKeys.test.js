@@ -0,0 +1,27 @@
+const createRecentKeys = require("../src/kafka/recentKeys");
+
+describe("Recent idempotency keys", () => {
+  it("should report a key only the first time", () => {
+    const recent = createRecentKeys();
+
+    expect(recent.firstSeen("chat.output:chat.input:0:1")).toBe(true);
+    expect(recent.firstSeen("chat.output:chat.input:0:1")).toBe(false);
+  });
+
+  it("should let records without a key through", () => {
+    const recent = createRecentKeys();
+
+    expect(recent.firstSeen(undefined)).toBe(true);
+    expect(recent.firstSeen(undefined)).toBe(true);
+  });
+
+  it("should forget the oldest keys beyond its size", () => {
+    const recent = createRecentKeys(2);
+    recent.firstSeen("a");
+    recent.firstSeen("b");
+    recent.firstSeen("c");
+
+    expect(recent.size).toBe(2);
+    expect(recent.firstSeen("a")).toBe(true);
+  });
+});